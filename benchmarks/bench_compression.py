@@ -0,0 +1,103 @@
+"""
+Benchmark of the response compression: the CPU time spent versus the
+bytes saved per content encoding and level, for a repetitive JSON
+payload, and the peak memory of a streamed versus a jsonify response.
+
+Run from the repository root:
+
+    python benchmarks/bench_compression.py --rows 100000
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+
+from flask import Flask, jsonify  # noqa: E402
+
+from compression import Compressor, brotli  # noqa: E402
+from responses import stream_json  # noqa: E402
+
+SETTINGS = [('gzip', level) for level in (1, 6, 9)] + [('br', quality) for quality in (1, 4, 11)]
+
+
+def payload(rows):
+    """Builds a time-series like stats listing, as repetitive as such JSON responses are."""
+    started = datetime(2020, 1, 1)
+    return {'stats': [
+        {
+            'shortcode': '{:06d}'.format(row),
+            'created': (started + timedelta(minutes=row)).isoformat(),
+            'lastRedirect': (started + timedelta(minutes=row, seconds=random.randint(0, 3600))).isoformat(),
+            'redirectCount': random.randint(0, 10000)
+        }
+        for row in range(rows)
+    ]}
+
+
+def compress(encoding, level, chunks):
+    compressor = Compressor()
+    compressor.gzip_level = compressor.brotli_quality = level
+    _compress, _finish = compressor.compressor(encoding=encoding)
+    started = time.process_time()
+    size = sum(len(_compress(chunk)) for chunk in chunks) + len(_finish())
+    return time.process_time() - started, size
+
+
+def peak_memory(build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in build():
+        pass
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    arguments = parser.parse_args()
+
+    data = payload(rows=arguments.rows)
+    app = Flask(__name__)
+    with app.test_request_context():
+        chunks = list(stream_json(data=data).response)
+        size = sum(len(chunk) for chunk in chunks)
+        print('Payload: {ROWS} rows, {SIZE:.2f} MB of JSON in {CHUNKS} chunks'.format(
+            ROWS=arguments.rows, SIZE=size / 1e6, CHUNKS=len(chunks)
+        ))
+        for encoding, level in SETTINGS:
+            if encoding == 'br' and brotli is None:
+                print('{ENCODING:>5} {LEVEL:>2}: skipped, brotli is not installed'.format(ENCODING=encoding, LEVEL=level))
+                continue
+            cpu, compressed = compress(encoding=encoding, level=level, chunks=chunks)
+            print('{ENCODING:>5} {LEVEL:>2}: {SIZE:>8.2f} MB ratio={RATIO:5.1f}x saved={SAVED:6.2f} MB '
+                  'cpu={CPU:7.1f}ms ({SPEED:6.1f} MB/s, {COST:5.2f}ms per MB saved)'.format(
+                      ENCODING=encoding,
+                      LEVEL=level,
+                      SIZE=compressed / 1e6,
+                      RATIO=size / compressed,
+                      SAVED=(size - compressed) / 1e6,
+                      CPU=cpu * 1000,
+                      SPEED=size / 1e6 / cpu if cpu else float('inf'),
+                      COST=cpu * 1000 / ((size - compressed) / 1e6)
+                  ))
+
+        for name, build in (
+            ('jsonify', lambda: [jsonify(data).get_data()]),
+            ('stream_json', lambda: stream_json(data=data).response)
+        ):
+            elapsed, peak = peak_memory(build=build)
+            print('{NAME:>11}: {ELAPSED:7.1f}ms peak memory={PEAK:7.2f} MB'.format(
+                NAME=name, ELAPSED=elapsed * 1000, PEAK=peak / 1e6
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of the per-worker link lookups: a dict of shortcode to url
+strings versus the compact link index, with and without the host
+compression.
+
+The memory per link is measured with the traced memory allocations of
+the build, the url strings of the dict included, and the time per
+lookup over random shortcodes.
+
+Run from the repository root:
+
+    python benchmarks/bench_link_index.py --links 1000000 --hosts 1000 --lookups 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+
+from link_index import CompactLinkIndex  # noqa: E402
+import shortcode_codec  # noqa: E402
+
+
+def measure(build, lookup, probes, links):
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    structure = build()
+    size = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    started = time.perf_counter()
+    for probe in probes:
+        lookup(structure, probe)
+    return size / links, (time.perf_counter() - started) / len(probes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--links', type=int, default=1000000)
+    parser.add_argument('--hosts', type=int, default=1000)
+    parser.add_argument('--lookups', type=int, default=200000)
+    arguments = parser.parse_args()
+
+    generator = random.Random(0)
+    keys = sorted(generator.sample(range(shortcode_codec.MAX_VALUE), arguments.links))
+    rows = [
+        (key, 'https://host{HOST}.example.com/articles/{KEY}?utm_source=newsletter'.format(
+            HOST=generator.randrange(arguments.hosts), KEY=key
+        ), 0)
+        for key in keys
+    ]
+    probes = [shortcode_codec.decode(key) for key in generator.choices(keys, k=arguments.lookups)]
+
+    results = {
+        'dict': measure(
+            build=lambda: {shortcode_codec.decode(key): url.encode('utf-8').decode('utf-8') for key, url, _ in rows},
+            lookup=lambda cache, shortcode: cache.get(shortcode),
+            probes=probes,
+            links=arguments.links
+        )
+    }
+    for name, compress_hosts in (('index', False), ('index+hosts', True)):
+        results[name] = measure(
+            build=lambda: CompactLinkIndex.build(rows=rows, compress_hosts=compress_hosts),
+            lookup=lambda index, shortcode: index.lookup(key=shortcode_codec.key(shortcode)),
+            probes=probes,
+            links=arguments.links
+        )
+
+    print('{NAME:>12} {BYTES:>14} {LOOKUP:>12}'.format(NAME='', BYTES='bytes/link', LOOKUP='lookup'))
+    for name, (size, lookup) in results.items():
+        print('{NAME:>12} {BYTES:>14.1f} {LOOKUP:>10.2f}us'.format(NAME=name, BYTES=size, LOOKUP=lookup * 1e6))
+
+
+if __name__ == '__main__':
+    main()
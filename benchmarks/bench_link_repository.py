@@ -0,0 +1,116 @@
+"""
+Benchmark of the stats and redirect lookups: the former ORM path,
+hydrating the Stat, Shortcode, Url and Redirect entities, versus the
+Core repository returning a slotted LinkView.
+
+The time and the peak of the traced memory allocations are reported
+per lookup.
+
+Run from the repository root:
+
+    python benchmarks/bench_link_repository.py --links 10000 --lookups 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+
+from app import create_app  # noqa: E402
+from db import db as dbs  # noqa: E402
+from models import Url, Shortcode, Stat  # noqa: E402
+from repository import links  # noqa: E402
+
+
+def orm_get_stats(shortcode):
+    """The former Stat.get_stats implementation."""
+    _stat = Stat.query.filter(Stat.shortcodeId == Shortcode.key(shortcode=shortcode)).first()
+    if _stat is None or _stat.shortcode.url.is_expired():
+        return None
+    if _stat.redirect is None:
+        last_redirect, redirect_count = None, 0
+    else:
+        last_redirect, redirect_count = _stat.redirect.lastRedirect.isoformat(), _stat.redirect.redirectCount
+    return {'created': _stat.created.isoformat(), 'lastRedirect': last_redirect, 'redirectCount': redirect_count}
+
+
+def core_get_stats(shortcode):
+    """The current Stat.get_stats implementation."""
+    link = links.find(shortcode=shortcode)
+    if link is None or link.is_expired():
+        return None
+    return link.stats()
+
+
+def orm_url(shortcode):
+    """The former redirect read, without the increment."""
+    _stat = Stat.query.filter(Stat.shortcodeId == Shortcode.key(shortcode=shortcode)).first()
+    return _stat.shortcode.url.url
+
+
+def core_url(shortcode):
+    """The current redirect read, without the increment."""
+    return links.find(shortcode=shortcode).url
+
+
+def measure(lookup, shortcodes):
+    """Every lookup starts with an empty identity map, as a request does, on an open connection."""
+    peaks = []
+    tracemalloc.start()
+    for shortcode in shortcodes:
+        dbs.session.expunge_all()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        lookup(shortcode)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    timings = []
+    for shortcode in shortcodes:
+        dbs.session.expunge_all()
+        started = time.perf_counter()
+        lookup(shortcode)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), statistics.mean(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--links', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(config={
+            'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'bench.db'),
+            'SCHEMA_AUTO_MIGRATE': True
+        })
+        with app.app_context():
+            shortcodes = [Url.insert_url(url='http://example{}.com'.format(index)) for index in range(arguments.links)]
+            for shortcode in shortcodes[::2]:
+                links.record_redirect(link=links.find(shortcode=shortcode))
+            dbs.session.commit()
+            probes = random.Random(0).choices(shortcodes, k=arguments.lookups)
+            assert all(orm_get_stats(shortcode) == core_get_stats(shortcode) for shortcode in probes[:100])
+
+            for name, orm, core in (('get_stats', orm_get_stats, core_get_stats), ('redirect url', orm_url, core_url)):
+                orm_time, orm_peak = measure(lookup=orm, shortcodes=probes)
+                core_time, core_peak = measure(lookup=core, shortcodes=probes)
+                print('{NAME:>12}: orm median={ORM_TIME:6.1f}us peak={ORM_PEAK:7.0f}B  '
+                      'core median={CORE_TIME:6.1f}us peak={CORE_PEAK:7.0f}B  speedup={SPEEDUP:.1f}x'.format(
+                          NAME=name,
+                          ORM_TIME=orm_time * 1e6,
+                          ORM_PEAK=orm_peak,
+                          CORE_TIME=core_time * 1e6,
+                          CORE_PEAK=core_peak,
+                          SPEEDUP=orm_time / core_time
+                      ))
+
+
+if __name__ == '__main__':
+    main()
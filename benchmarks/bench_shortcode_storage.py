@@ -0,0 +1,100 @@
+"""
+Benchmark of the shortcode storage layouts: the former string column
+with a unique index versus the shortcode packed into the INTEGER
+primary key.
+
+Run from the repository root:
+
+    python benchmarks/bench_shortcode_storage.py --rows 10000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + '/../src')
+
+import shortcode_codec  # noqa: E402
+
+LAYOUTS = {
+    'string': (
+        'CREATE TABLE shortcode (id INTEGER PRIMARY KEY, urlId INTEGER, shortcode VARCHAR, UNIQUE (shortcode))',
+        'INSERT INTO shortcode (urlId, shortcode) VALUES (?, ?)',
+        'SELECT id FROM shortcode WHERE shortcode = ?',
+        lambda shortcode: shortcode
+    ),
+    'integer': (
+        'CREATE TABLE shortcode (id INTEGER PRIMARY KEY, urlId INTEGER)',
+        'INSERT INTO shortcode (urlId, id) VALUES (?, ?)',
+        'SELECT id FROM shortcode WHERE id = ?',
+        shortcode_codec.encode
+    )
+}
+
+
+def sample_shortcodes(rows, seed):
+    generator = random.Random(seed)
+    values = generator.sample(range(shortcode_codec.MAX_VALUE + 1), rows)
+    return [shortcode_codec.decode(value) for value in values]
+
+
+def build(path, layout, shortcodes, batch_size=100000):
+    create, insert, _, to_key = LAYOUTS[layout]
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.execute(create)
+    for start in range(0, len(shortcodes), batch_size):
+        batch = shortcodes[start:start + batch_size]
+        connection.executemany(insert, ((start + index, to_key(code)) for index, code in enumerate(batch)))
+    connection.commit()
+    return connection
+
+
+def table_sizes(connection):
+    try:
+        return dict(connection.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name').fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+
+def lookups(connection, layout, shortcodes, amount):
+    _, _, select, to_key = LAYOUTS[layout]
+    probes = [to_key(code) for code in random.Random(1).choices(shortcodes, k=amount)]
+    start = time.perf_counter()
+    for probe in probes:
+        connection.execute(select, (probe,)).fetchone()
+    return (time.perf_counter() - start) / amount
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    arguments = parser.parse_args()
+
+    shortcodes = sample_shortcodes(rows=arguments.rows, seed=0)
+    with tempfile.TemporaryDirectory() as directory:
+        for layout in LAYOUTS:
+            path = os.path.join(directory, layout + '.db')
+            started = time.perf_counter()
+            connection = build(path=path, layout=layout, shortcodes=shortcodes)
+            build_time = time.perf_counter() - started
+            latency = lookups(connection=connection, layout=layout, shortcodes=shortcodes, amount=arguments.lookups)
+            print('{LAYOUT:>8}: rows={ROWS} build={BUILD:.1f}s file={SIZE:.1f}MiB lookup={LATENCY:.2f}us'.format(
+                LAYOUT=layout,
+                ROWS=arguments.rows,
+                BUILD=build_time,
+                SIZE=os.path.getsize(path) / 2 ** 20,
+                LATENCY=latency * 1e6
+            ))
+            for name, size in sorted(table_sizes(connection).items()):
+                print('{PAD:>10}{NAME}: {SIZE:.1f}MiB'.format(PAD='', NAME=name, SIZE=size / 2 ** 20))
+            connection.close()
+
+
+if __name__ == '__main__':
+    main()
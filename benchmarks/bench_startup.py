@@ -0,0 +1,71 @@
+"""
+Benchmark of the worker cold start: the time from spawning a fresh
+interpreter to the response of the first request, for a database that
+is already migrated and for a database that is migrated on boot.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py --runs 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src')
+
+WORKER = '''
+import sys, time
+started = float(sys.argv[2])
+sys.path.insert(0, {SOURCE!r})
+from app import create_app
+app = create_app(config={{
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + sys.argv[1],
+    'SCHEMA_AUTO_MIGRATE': True,
+}})
+imported = time.time()
+response = app.test_client().get('/metrics')
+assert response.status_code == 200
+print(imported - started, time.time() - started)
+'''.format(SOURCE=SOURCE_DIRECTORY)
+
+
+def spawn(database):
+    started = time.time()
+    output = subprocess.check_output([sys.executable, '-c', WORKER, database, repr(started)])
+    boot, first_request = output.split()
+    return float(boot), float(first_request)
+
+
+def report(name, samples):
+    boots, first_requests = zip(*samples)
+    print('{NAME:>10}: boot median={BOOT:.1f}ms first request median={FIRST:.1f}ms p90={P90:.1f}ms'.format(
+        NAME=name,
+        BOOT=statistics.median(boots) * 1000,
+        FIRST=statistics.median(first_requests) * 1000,
+        P90=sorted(first_requests)[int(len(first_requests) * 0.9) - 1] * 1000
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=20)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        fresh = []
+        for run in range(arguments.runs):
+            fresh.append(spawn(database=os.path.join(directory, 'fresh{RUN}.db'.format(RUN=run))))
+        migrated_database = os.path.join(directory, 'migrated.db')
+        spawn(database=migrated_database)
+        migrated = [spawn(database=migrated_database) for _ in range(arguments.runs)]
+    report(name='fresh', samples=fresh)
+    report(name='migrated', samples=migrated)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the storage backends: the time per insert, redirect and
+stats operation of the sqlalchemy backend versus the memory backend,
+called directly and through the full request handling, which shows
+the cost the database adds.
+
+Run from the repository root:
+
+    python benchmarks/bench_storage.py --links 10000 --operations 20000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+
+from app import create_app  # noqa: E402
+
+
+def timed(operation, arguments):
+    started = time.perf_counter()
+    for argument in arguments:
+        operation(argument)
+    return (time.perf_counter() - started) / len(arguments)
+
+
+def bench_backend(app, links, operations):
+    storage = app.extensions['storage']
+    with app.app_context():
+        urls = ['http://example{}.com'.format(index) for index in range(links)]
+        insert = timed(operation=lambda url: storage.insert_url(url=url), arguments=urls)
+        shortcodes = [storage.insert_url(url=url) for url in urls]
+        probes = random.Random(0).choices(shortcodes, k=operations)
+        resolve = timed(operation=lambda shortcode: storage.resolve(shortcode=shortcode), arguments=probes)
+        stats = timed(operation=lambda shortcode: storage.get_stats(shortcode=shortcode), arguments=probes)
+    return insert, resolve, stats, probes
+
+
+def bench_requests(app, probes):
+    client = app.test_client()
+    redirect = timed(operation=lambda shortcode: client.get('/' + shortcode), arguments=probes)
+    stats = timed(operation=lambda shortcode: client.get('/' + shortcode + '/stats'), arguments=probes)
+    return redirect, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--links', type=int, default=10000)
+    parser.add_argument('--operations', type=int, default=20000)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {}
+        for backend in ('sqlalchemy', 'memory'):
+            app = create_app(config={
+                'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+                'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, backend + '.db'),
+                'STORAGE_BACKEND': backend,
+                'ADMISSION_ENABLED': False,
+                'SCHEMA_AUTO_MIGRATE': True
+            })
+            insert, resolve, stats, probes = bench_backend(
+                app=app, links=arguments.links, operations=arguments.operations
+            )
+            redirect_request, stats_request = bench_requests(app=app, probes=probes[:arguments.operations // 10])
+            results[backend] = (insert, resolve, stats, redirect_request, stats_request)
+
+    names = ('insert', 'resolve', 'get_stats', 'GET /<code>', 'GET /<code>/stats')
+    print('{NAME:>18} {SQL:>14} {MEMORY:>14} {RATIO:>8}'.format(NAME='', SQL='sqlalchemy', MEMORY='memory', RATIO='ratio'))
+    for index, name in enumerate(names):
+        sql, memory = results['sqlalchemy'][index], results['memory'][index]
+        print('{NAME:>18} {SQL:>12.1f}us {MEMORY:>12.1f}us {RATIO:>7.1f}x'.format(
+            NAME=name, SQL=sql * 1e6, MEMORY=memory * 1e6, RATIO=sql / memory
+        ))
+
+
+if __name__ == '__main__':
+    main()
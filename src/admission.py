@@ -0,0 +1,176 @@
+import threading
+
+from flask import request, g
+
+from exceptions import ServiceOverloaded
+from metrics import metrics
+
+
+class Budget:
+    """
+    This object limits the amount of concurrently handled requests
+    of one kind, with a bounded wait queue and a wait deadline.
+    """
+    def __init__(self, name, concurrency, queue_size, timeout):
+        """
+        This method initializes the budget with the provided parameters.
+
+        :param name: The provided budget name, used for the metrics.
+        :type name: str
+
+        :param concurrency: The maximum amount of concurrent requests.
+        :type concurrency: int
+
+        :param queue_size: The maximum amount of waiting requests.
+        :type queue_size: int
+
+        :param timeout: The maximum amount of seconds a request waits.
+        :type timeout: float
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.waiting = 0
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+
+    def _update_gauges(self):
+        metrics.set_gauge('admission.{NAME}.queue_depth'.format(NAME=self.name), self.waiting)
+        metrics.set_gauge('admission.{NAME}.in_flight'.format(NAME=self.name), self.in_flight)
+
+    def acquire(self):
+        """
+        This method admits a request, waiting in the queue for a free
+        slot if all slots are taken.
+
+        :return: The admission result, False if the queue is full or
+            the deadline passed.
+        :rtype: bool
+        """
+        acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                if self.waiting >= self.queue_size:
+                    metrics.incr('admission.{NAME}.shed'.format(NAME=self.name))
+                    return False
+                self.waiting += 1
+                self._update_gauges()
+            try:
+                acquired = self._slots.acquire(timeout=self.timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+                    self._update_gauges()
+            if not acquired:
+                metrics.incr('admission.{NAME}.shed'.format(NAME=self.name))
+                return False
+        with self._lock:
+            self.in_flight += 1
+            self._update_gauges()
+        metrics.incr('admission.{NAME}.admitted'.format(NAME=self.name))
+        return True
+
+    def release(self):
+        """This method frees the slot of an admitted request."""
+        with self._lock:
+            self.in_flight -= 1
+            self._update_gauges()
+        self._slots.release()
+
+
+class AdmissionController:
+    """
+    This object protects the database under overload, by admitting the
+    write and read endpoint requests within separate budgets.
+
+    Requests that can not be admitted before the deadline fail fast
+    with a ServiceOverloaded exception, instead of piling up behind
+    the database write lock.
+    """
+    ENDPOINTS = {
+        'shorten_url.shorten_url': 'write',
+        'check_shortcodes.check_shortcodes': 'read',
+        'get_url.get_url': 'read',
+        'get_stats.get_stats': 'read',
+        'get_stats.get_global_stats': 'read'
+    }
+
+    def __init__(self, budgets, retry_after=1):
+        """
+        This method initializes the controller with the provided parameters.
+
+        :param budgets: The provided budget per kind of request, write and read.
+        :type budgets: dict
+
+        :param retry_after: The amount of seconds after which a shed
+            request may be retried.
+        :type retry_after: int
+        """
+        self.budgets = budgets
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_config(cls, app):
+        """
+        This method creates the controller, with the budgets of the
+        provided app configuration, and registers its request hooks on
+        the provided app.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :return: The controller.
+        :rtype: admission.AdmissionController
+        """
+        controller = cls(
+            budgets={
+                kind: Budget(
+                    name=kind,
+                    concurrency=app.config.get('ADMISSION_{KIND}_CONCURRENCY'.format(KIND=kind.upper()), 8),
+                    queue_size=app.config.get('ADMISSION_{KIND}_QUEUE_SIZE'.format(KIND=kind.upper()), 64),
+                    timeout=app.config.get('ADMISSION_{KIND}_TIMEOUT'.format(KIND=kind.upper()), 1.0)
+                ) for kind in ('write', 'read')
+            },
+            retry_after=app.config.get('ADMISSION_RETRY_AFTER', 1)
+        )
+        controller.init_app(app=app)
+        return controller
+
+    def init_app(self, app):
+        """
+        This method registers the admission request hooks on the provided app.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+        """
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+
+    def admit(self):
+        """
+        This method admits the current request within the budget of
+        its endpoint. Requests of other endpoints are not limited.
+
+        :raises:
+            ServiceOverloaded: When the request can not be admitted in time.
+        """
+        kind = self.ENDPOINTS.get(request.endpoint)
+        if kind is None:
+            return
+        budget = self.budgets[kind]
+        if not budget.acquire():
+            raise ServiceOverloaded(retry_after=self.retry_after)
+        g.admission_budget = budget
+
+    def release(self, error=None):
+        """
+        This method frees the budget slot of the current request, if admitted.
+
+        :param error: The provided unhandled exception, if any.
+        :type error: Exception
+        """
+        budget = g.pop('admission_budget', None)
+        if budget is not None:
+            budget.release()
@@ -0,0 +1,314 @@
+from array import array
+from bisect import bisect_right
+import csv
+import ipaddress
+import logging
+import os
+import re
+import threading
+from urllib.parse import urlsplit
+
+from db import db as dbs
+from metrics import metrics
+from models import ClickAggregate
+import shortcode_codec
+
+LOGGER = logging.getLogger(__name__)
+
+DIMENSIONS = ('referrer', 'agent', 'country')
+
+DIRECT = '(direct)'
+UNKNOWN = '(unknown)'
+
+AGENT_FAMILIES = (
+    ('Bot', re.compile(r'bot|crawl|spider|slurp|facebookexternalhit|preview', re.IGNORECASE)),
+    ('Edge', re.compile(r'Edg(e|A|iOS)?/')),
+    ('Opera', re.compile(r'OPR/|Opera')),
+    ('Samsung Internet', re.compile(r'SamsungBrowser/')),
+    ('Chrome', re.compile(r'Chrome/|CriOS/')),
+    ('Firefox', re.compile(r'Firefox/|FxiOS/')),
+    ('Safari', re.compile(r'Safari/')),
+    ('curl', re.compile(r'^curl/')),
+    ('Python', re.compile(r'python-requests|Python-urllib|aiohttp|httpx', re.IGNORECASE))
+)
+
+
+def referrer_host(referrer):
+    """
+    This method classifies the provided Referer header by its host.
+
+    :param referrer: The provided Referer header.
+    :type referrer: str
+
+    :return: The lowercase host without the www. prefix, DIRECT without a
+        referrer, or UNKNOWN for a referrer without a host.
+    :rtype: str
+    """
+    if not referrer:
+        return DIRECT
+    try:
+        host = urlsplit(referrer).hostname
+    except ValueError:
+        host = None
+    if not host:
+        return UNKNOWN
+    if host.startswith('www.'):
+        host = host[4:]
+    return host[:ClickAggregate.value.type.length]
+
+
+def agent_family(user_agent):
+    """
+    This method classifies the provided User-Agent header by its client family.
+
+    :param user_agent: The provided User-Agent header.
+    :type user_agent: str
+
+    :return: The client family, from a fixed set of families.
+    :rtype: str
+    """
+    if not user_agent:
+        return UNKNOWN
+    for family, pattern in AGENT_FAMILIES:
+        if pattern.search(user_agent):
+            return family
+    return 'Other'
+
+
+class CountryDatabase:
+    """
+    This object looks up the country of an IPv4 address in a local
+    database file, a CSV file with rows of the first address, the last
+    address and the country code of a range. The addresses are either
+    dotted or integers.
+
+    The ranges are kept as sorted integer arrays, so a lookup is a
+    binary search.
+    """
+    def __init__(self, path):
+        """
+        This method loads the provided database file.
+
+        :param path: The provided database file path.
+        :type path: str
+        """
+        ranges = []
+        with open(path, newline='') as database_file:
+            for row in csv.reader(database_file):
+                if len(row) < 3:
+                    continue
+                try:
+                    first, last = (self._address(value) for value in row[:2])
+                except ValueError:
+                    continue  # a header or an IPv6 range
+                ranges.append((first, last, row[2].strip().upper() or UNKNOWN))
+        ranges.sort()
+        self.firsts = array('I', (first for first, _, _ in ranges))
+        self.lasts = array('I', (last for _, last, _ in ranges))
+        self.countries = [country for _, _, country in ranges]
+
+    @staticmethod
+    def _address(value):
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        return int(ipaddress.IPv4Address(value))
+
+    def __len__(self):
+        return len(self.countries)
+
+    def lookup(self, address):
+        """
+        This method looks up the country of the provided address.
+
+        :param address: The provided client address.
+        :type address: str
+
+        :return: The country code, or UNKNOWN if no range holds the address.
+        :rtype: str
+        """
+        try:
+            _address = ipaddress.ip_address(address)
+        except ValueError:
+            return UNKNOWN
+        if _address.version != 4:
+            return UNKNOWN
+        _address = int(_address)
+        index = bisect_right(self.firsts, _address) - 1
+        if index < 0 or _address > self.lasts[index]:
+            return UNKNOWN
+        return self.countries[index]
+
+
+class ClickAnalytics:
+    """
+    This object aggregates the clicks per shortcode by referrer host,
+    client family and, if a country database is present, country.
+
+    The counts are aggregated in memory per worker, with at most top_n
+    values per shortcode and dimension, the further values being counted
+    as the OTHER value. The counts are added to the ClickAggregate table
+    in batches, by a daemon thread every flush_interval seconds, or
+    earlier once flush_size clicks are pending.
+    """
+    def __init__(self, app, countries=None, top_n=20, flush_size=1000, flush_interval=10):
+        """
+        This method initializes the analytics with the provided parameters.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :param countries: The provided optional country database.
+        :type countries: analytics.CountryDatabase
+
+        :param top_n: The maximum amount of values per shortcode and dimension.
+        :type top_n: int
+
+        :param flush_size: The amount of pending clicks that triggers a flush.
+        :type flush_size: int
+
+        :param flush_interval: The amount of seconds between two flushes.
+        :type flush_interval: float
+        """
+        self.app = app
+        self.countries = countries
+        self.top_n = top_n
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.pending_clicks = 0
+        self._lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, app):
+        """
+        This method creates the analytics from the provided app configuration.
+        The country dimension is only recorded if the country database
+        file exists.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :return: The analytics.
+        :rtype: analytics.ClickAnalytics
+        """
+        path = os.path.join(app.root_path, app.config.get('ANALYTICS_COUNTRY_DB_PATH', 'countries.csv'))
+        countries = CountryDatabase(path=path) if os.path.exists(path) else None
+        return cls(
+            app=app,
+            countries=countries,
+            top_n=app.config.get('ANALYTICS_TOP_N', 20),
+            flush_size=app.config.get('ANALYTICS_FLUSH_SIZE', 1000),
+            flush_interval=app.config.get('ANALYTICS_FLUSH_INTERVAL', 10)
+        )
+
+    def classify(self, referrer, user_agent, address):
+        """
+        This method classifies a click into its dimension values.
+
+        :return: The (dimension, value) pairs.
+        :rtype: list
+        """
+        values = [('referrer', referrer_host(referrer)), ('agent', agent_family(user_agent))]
+        if self.countries is not None:
+            values.append(('country', self.countries.lookup(address)))
+        return values
+
+    def _count(self, key, dimension, value, amount):
+        values = self.pending.setdefault((key, dimension), {})
+        if value not in values and len(values) >= self.top_n:
+            value = ClickAggregate.OTHER
+            metrics.incr('analytics.folded', amount)
+        values[value] = values.get(value, 0) + amount
+
+    def record(self, shortcode, referrer, user_agent, address):
+        """
+        This method counts a click of the provided shortcode.
+
+        :param shortcode: The provided clicked shortcode.
+        :type shortcode: str
+
+        :param referrer: The provided Referer header.
+        :type referrer: str
+
+        :param user_agent: The provided User-Agent header.
+        :type user_agent: str
+
+        :param address: The provided client address.
+        :type address: str
+        """
+        key = shortcode_codec.key(shortcode)
+        if key is None:
+            return
+        values = self.classify(referrer=referrer, user_agent=user_agent, address=address)
+        with self._lock:
+            for dimension, value in values:
+                self._count(key=key, dimension=dimension, value=value, amount=1)
+            self.pending_clicks += 1
+            pending_clicks = self.pending_clicks
+        metrics.incr('analytics.clicks')
+        if pending_clicks >= self.flush_size:
+            self._flush_requested.set()
+
+    def flush(self):
+        """
+        This method adds the pending counts to the ClickAggregate table,
+        in one transaction. The counts are kept pending if the database
+        is unavailable.
+
+        :return: The amount of flushed clicks.
+        :rtype: int
+
+        .. warning::
+            This method has to be called within an application context.
+        """
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            pending_clicks, self.pending_clicks = self.pending_clicks, 0
+        if not pending:
+            return 0
+        counts = {
+            (key, dimension, value): count
+            for (key, dimension), values in pending.items()
+            for value, count in values.items()
+        }
+        try:
+            ClickAggregate.add(counts=counts, top_n=self.top_n)
+            dbs.session.commit()
+        except Exception:
+            dbs.session.rollback()
+            with self._lock:
+                for (key, dimension, value), count in counts.items():
+                    self._count(key=key, dimension=dimension, value=value, amount=count)
+                self.pending_clicks += pending_clicks
+            metrics.incr('analytics.flush_failures')
+            raise
+        metrics.incr('analytics.flushes')
+        return pending_clicks
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    LOGGER.warning('Click analytics flush failed, the counts are kept pending', exc_info=True)
+                finally:
+                    dbs.session.remove()
+
+    def start(self):
+        """This method starts the flushing daemon thread."""
+        self._thread = threading.Thread(target=self._run, name='click-analytics', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """This method stops the flushing thread, after a last flush."""
+        self._stopped.set()
+        self._flush_requested.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -1,19 +1,46 @@
 from flask import Flask
+import atexit
 import os
-from sqlalchemy.exc import OperationalError
 
 from db import db as dbs
 from app_config import FlaskConfig
-from exceptions import InvalidRequestPayload, ShortcodeAlreadyInUse, ShortcodeNotFound, InvalidShortcode
-from endpoints import blueprint_shorten_url, blueprint_get_url, blueprint_get_stats
+from exceptions import InvalidRequestPayload, ShortcodeAlreadyInUse, ShortcodeNotFound, InvalidShortcode, \
+    IdempotencyKeyReused, IdempotencyRequestInProgress, ServiceOverloaded
+from endpoints import blueprint_shorten_url, blueprint_get_url, blueprint_get_stats, blueprint_metrics, \
+    blueprint_check_shortcodes
+from responses import RedirectResponder
+from cache import stats_versions, idempotency_results
+from admission import AdmissionController
+from commands import COMMANDS
+from tracing import tracer
+import schema
+import storage
 
 APP_CONFIG = {
     **FlaskConfig.CONFIG_FLASK,
     **FlaskConfig.CONFIG_SQLALCHEMY,
+    **FlaskConfig.CONFIG_STORAGE,
+    **FlaskConfig.CONFIG_EXPIRY,
+    **FlaskConfig.CONFIG_SWEEPER,
+    **FlaskConfig.CONFIG_RESPONSES,
+    **FlaskConfig.CONFIG_GLOBAL_STATS,
+    **FlaskConfig.CONFIG_SHORTCODE_CHECK,
+    **FlaskConfig.CONFIG_IDEMPOTENCY,
+    **FlaskConfig.CONFIG_ADMISSION,
+    **FlaskConfig.CONFIG_DEGRADED_MODE,
+    **FlaskConfig.CONFIG_SCHEMA,
+    **FlaskConfig.CONFIG_TRACING,
+    **FlaskConfig.CONFIG_SLOW_QUERY_LOG,
+    **FlaskConfig.CONFIG_REQUEST_LOG,
+    **FlaskConfig.CONFIG_ANALYTICS,
+    **FlaskConfig.CONFIG_COMPRESSION,
+    **FlaskConfig.CONFIG_INVALIDATION,
+    **FlaskConfig.CONFIG_LINK_INDEX,
+    **FlaskConfig.CONFIG_MAINTENANCE,
 }
 
 
-def create_app(config):
+def create_app(config=APP_CONFIG):
     """
     This method instantiates the Flask app.
 
@@ -24,11 +51,33 @@ def create_app(config):
       configuration parameters.
     - Attaching the SQLAlchemy database object to the
       application object.
-    - Configuring the database.
+    - Checking the database schema version, which migrates the
+      database only if configured and needed.
+    - Registering the CLI commands, i.e. the migrate, maintenance and
+      reconcile-stats commands.
+    - Creating the configured storage backend of the links.
     - Registering the modular blueprints on the application
       object.
+    - Configuring the pre-built redirect responses, the
+      stats version stamps and the idempotency result store.
     - Configuring a custom error handler for various
       exception scenario's.
+    - Registering the response compression, if enabled.
+    - Registering the admission control of the endpoints, if enabled.
+    - Registering the sampling request tracer.
+    - Registering the slow query log, if enabled.
+    - Registering the request log for the traffic replay, if enabled.
+    - Starting the expiry sweeper, if enabled.
+    - Starting the degraded read-only redirect mode, if enabled.
+    - Starting the click analytics, if enabled.
+    - Starting the cross-worker invalidation bus, if enabled, which also
+      enables the link change log.
+    - Building the compact link index of the redirects, if enabled,
+      subscribed to the invalidation bus if enabled.
+    - Starting the database maintenance scheduler, if enabled.
+
+    The optional components are imported when enabled only, to keep
+    the worker boot fast.
 
     :param config: The provided configuration parameters.
     :type config: dict
@@ -43,22 +92,37 @@ def create_app(config):
 
     dbs.init_app(app=app)
 
-    try:
-        dbs.create_all(app=app)
-    except OperationalError:
-        from models import Url, Shortcode, Stat, Redirect
-        dbs.create_all()
-        dbs.session.commit()
+    schema.check(app=app)
+    for command in COMMANDS:
+        app.cli.add_command(command)
+
+    app.extensions['storage'] = storage.from_config(app=app)
+    app.extensions['storage'].start()
+    atexit.register(app.extensions['storage'].stop)
 
     app.register_blueprint(blueprint=blueprint_shorten_url, url_prefix='')
+    app.register_blueprint(blueprint=blueprint_check_shortcodes, url_prefix='')
     app.register_blueprint(blueprint=blueprint_get_url, url_prefix='')
     app.register_blueprint(blueprint=blueprint_get_stats, url_prefix='')
+    app.register_blueprint(blueprint=blueprint_metrics, url_prefix='')
+    app.extensions['redirect_responder'] = RedirectResponder.from_config(config=app.config)
+    stats_versions.configure(
+        maxsize=app.config.get('STATS_VERSION_CACHE_SIZE', 10000),
+        ttl=app.config.get('STATS_VERSION_CACHE_TTL', 5)
+    )
+    idempotency_results.configure(
+        maxsize=app.config.get('IDEMPOTENCY_CACHE_SIZE', 10000),
+        ttl=app.config.get('IDEMPOTENCY_TTL', 86400)
+    )
 
     exceptions = [
         InvalidRequestPayload,
         ShortcodeAlreadyInUse,
         ShortcodeNotFound,
-        InvalidShortcode
+        InvalidShortcode,
+        IdempotencyKeyReused,
+        IdempotencyRequestInProgress,
+        ServiceOverloaded
     ]
 
     for exception in exceptions:
@@ -66,10 +130,67 @@ def create_app(config):
         def handle_exception(error):
             return error.http_response()
 
+    if app.config.get('COMPRESSION_ENABLED', True):
+        from compression import compressor
+        compressor.init_app(app=app)
+
+    if app.config.get('ADMISSION_ENABLED', True):
+        app.extensions['admission'] = AdmissionController.from_config(app=app)
+
+    tracer.init_app(app=app)
+
+    if app.config.get('SLOW_QUERY_LOG_ENABLED', False):
+        from slow_query import slow_query_log
+        slow_query_log.init_app(app=app)
+
+    if app.config.get('REQUEST_LOG_ENABLED', False):
+        from request_log import request_log
+        request_log.init_app(app=app)
+
+    if app.config.get('SWEEPER_ENABLED', False):
+        from sweeper import ExpirySweeper
+        app.extensions['expiry_sweeper'] = ExpirySweeper(
+            app=app,
+            interval=app.config.get('SWEEPER_INTERVAL', 60),
+            batch_size=app.config.get('SWEEPER_BATCH_SIZE', 100)
+        )
+        app.extensions['expiry_sweeper'].start()
+
+    if app.config.get('DEGRADED_MODE_ENABLED', False):
+        from degraded import DegradedRedirects
+        app.extensions['degraded_redirects'] = DegradedRedirects.from_config(app=app)
+        app.extensions['degraded_redirects'].start()
+
+    if app.config.get('ANALYTICS_ENABLED', False):
+        from analytics import ClickAnalytics
+        app.extensions['click_analytics'] = ClickAnalytics.from_config(app=app)
+        app.extensions['click_analytics'].start()
+
+    if app.config.get('INVALIDATION_ENABLED', False):
+        from invalidation import InvalidationBus
+        app.extensions['invalidation_bus'] = InvalidationBus.from_config(app=app)
+        app.extensions['invalidation_bus'].start()
+
+    if app.config.get('LINK_INDEX_ENABLED', False):
+        from link_index import IndexedRedirects
+        app.extensions['link_index'] = IndexedRedirects.from_config(app=app)
+        if 'invalidation_bus' in app.extensions:
+            app.extensions['invalidation_bus'].subscribe(app.extensions['link_index'].apply)
+        app.extensions['link_index'].start()
+        atexit.register(app.extensions['link_index'].stop)
+
+    if app.config.get('MAINTENANCE_ENABLED', False):
+        from maintenance import MaintenanceScheduler
+        app.extensions['maintenance'] = MaintenanceScheduler.from_config(app=app)
+        app.extensions['maintenance'].start()
+
     return app
 
 
 if __name__ == '__main__':
     ENVIRONMENT_DEBUG = os.environ.get('APP_DEBUG', True)  # pragma: no cover
     ENVIRONMENT_PORT = os.environ.get('APP_PORT', 5000)  # pragma: no cover
-    create_app(APP_CONFIG).run(host='0.0.0.0', port=ENVIRONMENT_PORT, debug=ENVIRONMENT_DEBUG)  # pragma: no cover
+    # The local development server migrates its database on startup
+    create_app(dict(APP_CONFIG, SCHEMA_AUTO_MIGRATE=True)).run(  # pragma: no cover
+        host='0.0.0.0', port=ENVIRONMENT_PORT, debug=ENVIRONMENT_DEBUG
+    )
@@ -15,3 +15,128 @@ class FlaskConfig:
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
         'SQLALCHEMY_DATABASE_URI': SQLITE_URI
     }
+
+    CONFIG_STORAGE = {
+        'STORAGE_BACKEND': 'sqlalchemy',
+        'STORAGE_SNAPSHOT_PATH': None,
+        'STORAGE_SNAPSHOT_INTERVAL': 60
+    }
+
+    CONFIG_EXPIRY = {
+        'EXPIRY_MAX_TTL': 100 * 365 * 86400
+    }
+
+    CONFIG_SWEEPER = {
+        'SWEEPER_ENABLED': False,
+        'SWEEPER_INTERVAL': 60,
+        'SWEEPER_BATCH_SIZE': 100
+    }
+
+    CONFIG_RESPONSES = {
+        'REDIRECT_STATUS_CODE': 302,
+        'REDIRECT_CACHE_CONTROL': None,
+        'STATS_MAX_AGE': 0,
+        'STATS_VERSION_CACHE_SIZE': 10000,
+        'STATS_VERSION_CACHE_TTL': 5
+    }
+
+    CONFIG_GLOBAL_STATS = {
+        'GLOBAL_STATS_DAYS': 30,
+        'GLOBAL_STATS_MAX_DAYS': 366
+    }
+
+    CONFIG_SHORTCODE_CHECK = {
+        'SHORTCODE_CHECK_MAX_CANDIDATES': 100,
+        'SHORTCODE_CHECK_MAX_SUGGESTIONS': 5
+    }
+
+    CONFIG_IDEMPOTENCY = {
+        'IDEMPOTENCY_CACHE_SIZE': 10000,
+        'IDEMPOTENCY_TTL': 86400,
+        'IDEMPOTENCY_RESERVATION_TTL': 30
+    }
+
+    CONFIG_ADMISSION = {
+        'ADMISSION_ENABLED': True,
+        'ADMISSION_RETRY_AFTER': 1,
+        'ADMISSION_WRITE_CONCURRENCY': 4,
+        'ADMISSION_WRITE_QUEUE_SIZE': 64,
+        'ADMISSION_WRITE_TIMEOUT': 1.0,
+        'ADMISSION_READ_CONCURRENCY': 16,
+        'ADMISSION_READ_QUEUE_SIZE': 256,
+        'ADMISSION_READ_TIMEOUT': 0.5
+    }
+
+    CONFIG_DEGRADED_MODE = {
+        'DEGRADED_MODE_ENABLED': False,
+        'SNAPSHOT_PATH': 'links.snapshot',
+        'SNAPSHOT_REFRESH_INTERVAL': 60,
+        'CLICK_BUFFER_PATH': 'clicks.buffer',
+        'CIRCUIT_FAILURE_THRESHOLD': 3,
+        'CIRCUIT_RESET_TIMEOUT': 5.0
+    }
+
+    CONFIG_SCHEMA = {
+        'SCHEMA_AUTO_MIGRATE': False
+    }
+
+    CONFIG_TRACING = {
+        'TRACING_SAMPLE_RATE': 0.0,
+        'TRACING_BUFFER_SIZE': 10000,
+        'TRACING_FILE': None,
+        'TRACING_DEBUG_ENDPOINT': False
+    }
+
+    CONFIG_SLOW_QUERY_LOG = {
+        'SLOW_QUERY_LOG_ENABLED': False,
+        'SLOW_QUERY_THRESHOLD_MS': 50,
+        'SLOW_QUERY_LOG_PATH': 'slow_queries.jsonl'
+    }
+
+    CONFIG_REQUEST_LOG = {
+        'REQUEST_LOG_ENABLED': False,
+        'REQUEST_LOG_PATH': 'request_log.jsonl'
+    }
+
+    CONFIG_ANALYTICS = {
+        'ANALYTICS_ENABLED': False,
+        'ANALYTICS_TOP_N': 20,
+        'ANALYTICS_FLUSH_SIZE': 1000,
+        'ANALYTICS_FLUSH_INTERVAL': 10,
+        'ANALYTICS_COUNTRY_DB_PATH': 'countries.csv'
+    }
+
+    CONFIG_COMPRESSION = {
+        'COMPRESSION_ENABLED': True,
+        'COMPRESSION_THRESHOLD': 1024,
+        'COMPRESSION_GZIP_LEVEL': 6,
+        'COMPRESSION_BROTLI_QUALITY': 4,
+        'COMPRESSION_MIMETYPES': ('application/json', )
+    }
+
+    CONFIG_INVALIDATION = {
+        'INVALIDATION_ENABLED': False,
+        'INVALIDATION_POLL_INTERVAL': 0.05,
+        'INVALIDATION_BATCH_SIZE': 500,
+        'INVALIDATION_RETENTION': 3600
+    }
+
+    CONFIG_LINK_INDEX = {
+        'LINK_INDEX_ENABLED': False,
+        'LINK_INDEX_COMPRESS_HOSTS': True,
+        'LINK_INDEX_MERGE_SIZE': 10000,
+        'LINK_INDEX_MERGE_INTERVAL': 5,
+        'LINK_INDEX_FLUSH_INTERVAL': 1,
+        'LINK_INDEX_REBUILD_INTERVAL': 3600
+    }
+
+    CONFIG_MAINTENANCE = {
+        'MAINTENANCE_ENABLED': False,
+        'MAINTENANCE_INTERVAL': 300,
+        'MAINTENANCE_VACUUM_PAGES': 100,
+        'MAINTENANCE_VACUUM_STEP_PAUSE': 0.05,
+        'MAINTENANCE_ANALYZE_INTERVAL': 86400,
+        'MAINTENANCE_LATENCY_THRESHOLD_MS': 50,
+        'MAINTENANCE_LATENCY_WINDOW': 10,
+        'MAINTENANCE_LOCK_PATH': None
+    }
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    This object is a bounded, thread-safe key-value store, whose
+    entries are evicted after a time-to-live or, when the store
+    is full, in least recently used order.
+    """
+    def __init__(self, maxsize=1024, ttl=60):
+        """
+        This method initializes the cache with the provided parameters.
+
+        :param maxsize: The maximum amount of stored entries.
+        :type maxsize: int
+
+        :param ttl: The amount of seconds an entry is kept.
+        :type ttl: float
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize, ttl):
+        """
+        This method reconfigures the cache and drops all stored entries.
+
+        :param maxsize: The maximum amount of stored entries.
+        :type maxsize: int
+
+        :param ttl: The amount of seconds an entry is kept.
+        :type ttl: float
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, key, default=None):
+        """
+        This method fetches the stored value for the provided key.
+
+        :param key: The provided key.
+        :type key: collections.abc.Hashable
+
+        :param default: The value returned on a missing or expired entry.
+        :type default: object
+
+        :return: The stored value.
+        :rtype: object
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        This method stores the provided value for the provided key.
+
+        :param key: The provided key.
+        :type key: collections.abc.Hashable
+
+        :param value: The provided value.
+        :type value: object
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """
+        This method stores the provided value for the provided key, only
+        if no unexpired entry is stored for the key yet.
+
+        :param key: The provided key.
+        :type key: collections.abc.Hashable
+
+        :param value: The provided value.
+        :type value: object
+
+        :param ttl: The amount of seconds the entry is kept, defaults to
+            the ttl of the cache.
+        :type ttl: float
+
+        :return: Whether the value is stored.
+        :rtype: bool
+        """
+        if self.maxsize <= 0:
+            return True
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return False
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return True
+
+    def pop(self, key):
+        """
+        This method removes the entry for the provided key, if present.
+
+        :param key: The provided key.
+        :type key: collections.abc.Hashable
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """This method removes all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+stats_versions = TTLCache()
+idempotency_results = TTLCache()
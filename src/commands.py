@@ -0,0 +1,119 @@
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Create the missing database tables and stamp the schema version."""
+    from schema import migrate, LegacySchemaError
+    try:
+        version = migrate()
+    except LegacySchemaError as error:
+        raise click.ClickException(str(error))
+    click.echo('Database migrated to schema version {VERSION}'.format(VERSION=version))
+
+
+@click.command('slow-queries')
+@click.option('--path', default=None, help='The slow query log path, defaults to SLOW_QUERY_LOG_PATH.')
+@click.option('--top', default=10, show_default=True, help='The amount of statement fingerprints to show.')
+@with_appcontext
+def slow_queries_command(path, top):
+    """Summarize the slow query log per statement fingerprint."""
+    from slow_query import summarize
+    path = path or os.path.join(current_app.root_path, current_app.config.get('SLOW_QUERY_LOG_PATH', 'slow_queries.jsonl'))
+    if not os.path.exists(path):
+        raise click.ClickException('No slow query log at {PATH}'.format(PATH=path))
+    for summary in summarize(path=path)[:top]:
+        click.echo('{FINGERPRINT}  count={COUNT} total={TOTAL}ms mean={MEAN}ms p95={P95}ms max={MAX}ms'.format(
+            FINGERPRINT=summary['fingerprint'],
+            COUNT=summary['count'],
+            TOTAL=summary['totalMs'],
+            MEAN=summary['meanMs'],
+            P95=summary['p95Ms'],
+            MAX=summary['maxMs']
+        ))
+        click.echo('    {STATEMENT}'.format(STATEMENT=summary['statement']))
+        click.echo('    endpoints: {ENDPOINTS}  methods: {METHODS}'.format(
+            ENDPOINTS=', '.join(summary['endpoints']) or '-',
+            METHODS=', '.join(summary['methods']) or '-'
+        ))
+        for line in summary['plan'] or ():
+            click.echo('    plan: {LINE}'.format(LINE=line))
+
+
+@click.command('maintenance')
+@click.option('--analyze', is_flag=True, help='Run a full ANALYZE of the link tables instead of PRAGMA optimize.')
+@click.option('--vacuum-pages', default=None, type=int, help='The pages freed per step, defaults to MAINTENANCE_VACUUM_PAGES.')
+@click.option('--enable-incremental-vacuum', is_flag=True,
+              help='Convert the database to incremental auto_vacuum with a full, blocking, VACUUM.')
+@with_appcontext
+def maintenance_command(analyze, vacuum_pages, enable_incremental_vacuum):
+    """Run the database maintenance once and report the database sizes."""
+    from db import db as dbs
+    from maintenance import MaintenanceScheduler
+    if enable_incremental_vacuum:
+        with dbs.get_engine().connect() as connection:
+            connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            connection.execute('VACUUM')
+    scheduler = MaintenanceScheduler(
+        app=current_app._get_current_object(),
+        vacuum_pages=vacuum_pages or current_app.config.get('MAINTENANCE_VACUUM_PAGES', 100),
+        step_pause=0
+    )
+    report = scheduler.run(analyze=analyze)
+    if report is None:
+        raise click.ClickException('The database maintenance supports SQLite only')
+    click.echo('database: {DATABASE}'.format(DATABASE=report['database']))
+    click.echo('file={FILE}B wal={WAL}B pages={PAGES} free={FREE} ({FREE_BYTES}B) page_size={PAGE_SIZE}B'.format(
+        FILE=report['fileBytes'],
+        WAL=report['walBytes'],
+        PAGES=report['pageCount'],
+        FREE=report['freePages'],
+        FREE_BYTES=report['freeBytes'],
+        PAGE_SIZE=report['pageSize']
+    ))
+    click.echo('auto_vacuum={AUTO_VACUUM} journal_mode={JOURNAL_MODE} vacuumed={VACUUMED} refreshed={REFRESHED} '
+               'checkpoint={CHECKPOINT}'.format(
+                   AUTO_VACUUM=report['autoVacuum'],
+                   JOURNAL_MODE=report['journalMode'],
+                   VACUUMED=report['vacuumedPages'],
+                   REFRESHED=report['refreshed'],
+                   CHECKPOINT=report['checkpoint'] or '-'
+               ))
+    if report['autoVacuum'] != 'incremental':
+        click.echo('The free pages are not returned, run: flask maintenance --enable-incremental-vacuum')
+    for name, size in sorted((report['indexes'] or {}).items()):
+        click.echo('    index {NAME}: {SIZE}B'.format(NAME=name, SIZE=size))
+
+
+@click.command('reconcile-stats')
+@click.option('--dry-run', is_flag=True, help='Report the drift without rebuilding the global stats.')
+@with_appcontext
+def reconcile_stats_command(dry_run):
+    """Rebuild the global stats from the links and report the drift."""
+    from models import GlobalStat
+    drift = GlobalStat.reconcile(apply=not dry_run)
+    for entry in drift:
+        click.echo('{METRIC}{DAY}: summary={SUMMARY} actual={ACTUAL} drift={DRIFT:+d}'.format(
+            METRIC=entry['metric'],
+            DAY=' ' + entry['day'] if entry['day'] is not None else '',
+            SUMMARY=entry['summary'],
+            ACTUAL=entry['actual'],
+            DRIFT=entry['summary'] - entry['actual']
+        ))
+    if not drift:
+        click.echo('No drift, the global stats match the links')
+    elif not dry_run:
+        click.echo('Rebuilt the global stats, {AMOUNT} totals drifted'.format(AMOUNT=len(drift)))
+
+
+COMMANDS = [
+    migrate_command,
+    slow_queries_command,
+    maintenance_command,
+    reconcile_stats_command
+]
@@ -0,0 +1,169 @@
+import itertools
+import zlib
+
+from flask import request
+
+from metrics import metrics
+from responses import CONTENT_ENCODINGS, compressed_etag
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+class Compressor:
+    """
+    This object compresses the responses, with the content encoding
+    negotiated on the Accept-Encoding header of the request. Brotli is
+    preferred over gzip if the optional brotli package is installed.
+
+    Only successful responses of a compressible mimetype above a size
+    threshold are compressed, so the redirects, the 304 responses and
+    the small JSON responses are sent as is. A streamed response is
+    compressed chunk by chunk while it is sent.
+    """
+    def __init__(self):
+        """This method initializes the compressor with the default parameters."""
+        self.threshold = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 4
+        self.mimetypes = {'application/json'}
+
+    def init_app(self, app):
+        """
+        This method configures the compressor from the provided app
+        configuration and registers the response hook.
+
+        The hook has to be registered before the other response hooks,
+        as Flask runs the response hooks in reverse order, so the other
+        hooks see the uncompressed response.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+        """
+        self.threshold = app.config.get('COMPRESSION_THRESHOLD', 1024)
+        self.gzip_level = app.config.get('COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = app.config.get('COMPRESSION_BROTLI_QUALITY', 4)
+        self.mimetypes = set(app.config.get('COMPRESSION_MIMETYPES', ('application/json', )))
+        app.after_request(self.compress)
+
+    @staticmethod
+    def available_encodings():
+        """
+        This method lists the supported content encodings, in order of preference.
+
+        :return: The content encodings.
+        :rtype: list
+        """
+        return [encoding for encoding in CONTENT_ENCODINGS if encoding != 'br' or brotli is not None]
+
+    def compressor(self, encoding):
+        """
+        This method creates an incremental compressor for the provided
+        content encoding.
+
+        :param encoding: The provided content encoding.
+        :type encoding: str
+
+        :return: The compress and finish methods of the compressor.
+        :rtype: tuple
+        """
+        if encoding == 'br':
+            _compressor = brotli.Compressor(quality=self.brotli_quality)
+            return _compressor.process, _compressor.finish
+        _compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+        return _compressor.compress, _compressor.flush
+
+    def compressible(self, response):
+        """
+        This method checks if the provided response may be compressed,
+        regardless of its size and the Accept-Encoding header.
+
+        :param response: The provided response.
+        :type response: flask.Response
+
+        :return: The compressibility result.
+        :rtype: bool
+        """
+        return (
+            200 <= response.status_code < 300
+            and response.status_code != 204
+            and request.method != 'HEAD'
+            and not response.direct_passthrough
+            and 'Content-Encoding' not in response.headers
+            and response.mimetype in self.mimetypes
+        )
+
+    def compress(self, response):
+        """
+        This method compresses the provided response, if it is compressible,
+        larger than the threshold, and a supported content encoding is
+        accepted. A strong ETag gets the content encoding as suffix.
+
+        :param response: The provided response.
+        :type response: flask.Response
+
+        :return: The compressed or unaltered response.
+        :rtype: flask.Response
+        """
+        if not self.compressible(response=response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.available_encodings())
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            chunks = response.iter_encoded()
+            head, size = [], 0
+            for chunk in chunks:
+                head.append(chunk)
+                size += len(chunk)
+                if size >= self.threshold:
+                    break
+            else:
+                response.set_data(b''.join(head))
+                return response
+            response.response = self._stream(
+                encoding=encoding,
+                chunks=itertools.chain(head, chunks),
+                close=getattr(response.response, 'close', None)
+            )
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.threshold:
+                return response
+            _compress, _finish = self.compressor(encoding=encoding)
+            compressed = _compress(data) + _finish()
+            response.set_data(compressed)
+            metrics.incr('compression.bytes_in', len(data))
+            metrics.incr('compression.bytes_out', len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(compressed_etag(etag=etag, encoding=encoding))
+        metrics.incr('compression.responses.{ENCODING}'.format(ENCODING=encoding))
+        return response
+
+    def _stream(self, encoding, chunks, close=None):
+        _compress, _finish = self.compressor(encoding=encoding)
+        size_in, size_out = 0, 0
+        try:
+            for chunk in chunks:
+                size_in += len(chunk)
+                compressed = _compress(chunk)
+                if compressed:
+                    size_out += len(compressed)
+                    yield compressed
+            compressed = _finish()
+            size_out += len(compressed)
+            yield compressed
+        finally:
+            if close is not None:
+                close()
+            metrics.incr('compression.bytes_in', size_in)
+            metrics.incr('compression.bytes_out', size_out)
+
+
+compressor = Compressor()
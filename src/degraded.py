@@ -0,0 +1,304 @@
+from collections import Counter
+import logging
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy.exc import DatabaseError
+
+from db import db as dbs
+from exceptions import ShortcodeNotFound
+from metrics import metrics
+from models import Redirect
+from snapshot import LinkSnapshot
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    This object decides if the database is used, based on the
+    recent database failures.
+
+    - closed: the database is used.
+    - open: the database is skipped, after failure_threshold consecutive
+      failures, until reset_timeout seconds have passed.
+    - half-open: a single probe request uses the database again, its
+      outcome closes or re-opens the circuit.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=5.0):
+        """
+        This method initializes the closed circuit breaker with the
+        provided parameters.
+
+        :param failure_threshold: The amount of consecutive failures
+            that opens the circuit.
+        :type failure_threshold: int
+
+        :param reset_timeout: The amount of seconds after which an open
+            circuit lets a probe request through.
+        :type reset_timeout: float
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        This method decides if the current request may use the database.
+
+        :return: The permission result.
+        :rtype: bool
+        """
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                metrics.set_gauge('degraded.circuit_state', self.state)
+                return True
+            return False
+
+    def record_success(self):
+        """This method closes the circuit after a successful database request."""
+        if self.state == self.CLOSED and self.failures == 0:
+            return
+        with self._lock:
+            if self.state != self.CLOSED:
+                LOGGER.warning('Database recovered, circuit closed')
+            self.state = self.CLOSED
+            self.failures = 0
+            metrics.set_gauge('degraded.circuit_state', self.state)
+
+    def record_failure(self):
+        """This method registers a failed database request, opening the circuit if needed."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    LOGGER.warning('Database unavailable, circuit opened')
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                metrics.set_gauge('degraded.circuit_state', self.state)
+
+
+class ClickBuffer:
+    """
+    This object buffers the redirect clicks served without the database
+    in an append-only file, until they can be applied to the database.
+    """
+    def __init__(self, path):
+        """
+        This method initializes the buffer for the provided file path.
+
+        :param path: The provided buffer file path.
+        :type path: str
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, shortcode, amount=1):
+        """
+        This method appends the provided clicks to the buffer file.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :param amount: The provided amount of clicks.
+        :type amount: int
+        """
+        with self._lock:
+            with open(self.path, 'a') as buffer_file:
+                buffer_file.write('{SHORTCODE} {AMOUNT}\n'.format(SHORTCODE=shortcode, AMOUNT=amount))
+
+    def drain(self, apply):
+        """
+        This method applies the buffered clicks, aggregated per shortcode.
+        Clicks that can not be applied because of a database failure are
+        written back to the buffer.
+
+        The buffer file is first renamed to a file of this drain, so the
+        clicks appended meanwhile, by any worker, go to a new buffer file.
+
+        :param apply: The provided method applying the clicks, called
+            with the shortcode and the amount of clicks.
+        :type apply: collections.abc.Callable
+
+        :return: The amount of applied clicks.
+        :rtype: int
+        """
+        draining_path = '{PATH}.{TOKEN}.draining'.format(PATH=self.path, TOKEN=uuid.uuid4().hex)
+        with self._lock:
+            try:
+                os.replace(self.path, draining_path)
+            except FileNotFoundError:
+                return 0
+        with open(draining_path) as buffer_file:
+            lines = buffer_file.readlines()
+        os.remove(draining_path)
+        clicks = Counter()
+        for line in lines:
+            shortcode, amount = line.split()
+            clicks[shortcode] += int(amount)
+        applied = 0
+        pending = list(clicks.items())
+        for index, (shortcode, amount) in enumerate(pending):
+            try:
+                apply(shortcode, amount)
+            except ShortcodeNotFound:
+                continue
+            except DatabaseError:
+                for remaining_shortcode, remaining_amount in pending[index:]:
+                    self.record(shortcode=remaining_shortcode, amount=remaining_amount)
+                raise
+            applied += amount
+        return applied
+
+    def __bool__(self):
+        return os.path.exists(self.path)
+
+
+class DegradedRedirects:
+    """
+    This object serves the redirects from the local link snapshot while
+    the database is unavailable, as decided by the circuit breaker.
+
+    The clicks of the redirects served from the snapshot are buffered,
+    and applied to the database by the refresher once it recovered.
+    """
+    def __init__(self, app, snapshot, click_buffer, breaker, refresh_interval=60):
+        """
+        This method initializes the degraded mode with the provided parameters.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :param snapshot: The provided link snapshot.
+        :type snapshot: snapshot.LinkSnapshot
+
+        :param click_buffer: The provided click buffer.
+        :type click_buffer: degraded.ClickBuffer
+
+        :param breaker: The provided circuit breaker.
+        :type breaker: degraded.CircuitBreaker
+
+        :param refresh_interval: The amount of seconds between two
+            snapshot refreshes.
+        :type refresh_interval: float
+        """
+        self.app = app
+        self.snapshot = snapshot
+        self.click_buffer = click_buffer
+        self.breaker = breaker
+        self.refresh_interval = refresh_interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, app):
+        """
+        This method instantiates the degraded mode from the provided
+        app configuration. Relative paths are relative to the app root.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :return: The configured degraded mode.
+        :rtype: degraded.DegradedRedirects
+        """
+        return cls(
+            app=app,
+            snapshot=LinkSnapshot(path=os.path.join(app.root_path, app.config.get('SNAPSHOT_PATH', 'links.snapshot'))),
+            click_buffer=ClickBuffer(path=os.path.join(app.root_path, app.config.get('CLICK_BUFFER_PATH', 'clicks.buffer'))),
+            breaker=CircuitBreaker(
+                failure_threshold=app.config.get('CIRCUIT_FAILURE_THRESHOLD', 3),
+                reset_timeout=app.config.get('CIRCUIT_RESET_TIMEOUT', 5.0)
+            ),
+            refresh_interval=app.config.get('SNAPSHOT_REFRESH_INTERVAL', 60)
+        )
+
+    def redirect(self, shortcode):
+        """
+        This method handles the redirect with the database while the
+        circuit is closed, and from the snapshot otherwise. Any outcome
+        of the database other than a database error, a not found shortcode
+        included, counts as a success for the circuit breaker.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :raises:
+            ShortcodeNotFound: When the provided shortcode does not exist.
+
+        :return: The related FQDN domain.
+        :rtype: str
+        """
+        if self.breaker.allow():
+            try:
+                redirect_url = Redirect.redirect(shortcode=shortcode)
+            except DatabaseError:
+                dbs.session.rollback()
+                self.breaker.record_failure()
+                LOGGER.warning('Database failure, redirect served from snapshot', exc_info=True)
+            except Exception:
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                return redirect_url
+        redirect_url = self.snapshot.lookup(shortcode=shortcode)
+        if redirect_url is None:
+            raise ShortcodeNotFound
+        self.click_buffer.record(shortcode=shortcode)
+        metrics.incr('degraded.redirects')
+        return redirect_url
+
+    def refresh(self):
+        """
+        This method applies the buffered clicks and rebuilds the snapshot,
+        if the circuit is closed.
+        """
+        if self.breaker.state != CircuitBreaker.CLOSED:
+            return
+        with self.app.app_context():
+            try:
+                if self.click_buffer:
+                    applied = self.click_buffer.drain(apply=lambda shortcode, amount: Redirect.increment(
+                        shortcode=shortcode, amount=amount
+                    ))
+                    metrics.incr('degraded.clicks_applied', applied)
+                count = LinkSnapshot.build(path=self.snapshot.path)
+                metrics.set_gauge('degraded.snapshot_links', count)
+            except DatabaseError:
+                dbs.session.rollback()
+                self.breaker.record_failure()
+                LOGGER.warning('Database failure, snapshot refresh skipped', exc_info=True)
+            finally:
+                dbs.session.remove()
+
+    def _run(self):
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception:  # pragma: no cover
+                LOGGER.exception('Snapshot refresh failed')
+
+    def start(self):
+        """This method builds the first snapshot and starts the refresher in a daemon thread."""
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name='snapshot-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """This method stops the refresher thread."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -1,7 +1,12 @@
-from flask import Blueprint, request, jsonify
+from datetime import datetime, timedelta, timezone
+import hashlib
+from flask import Blueprint, Response, request, jsonify, current_app, g
 
-from models import Url, Redirect, Stat
-from exceptions import InvalidRequestPayload
+from models import ClickAggregate
+from exceptions import InvalidRequestPayload, IdempotencyKeyReused, IdempotencyRequestInProgress
+from cache import stats_versions, idempotency_results
+from metrics import metrics
+from responses import stats_etag, cacheable, not_modified, matching_etag, stream_json
 
 import logging
 
@@ -10,6 +15,167 @@ LOGGER = logging.getLogger(__name__)
 blueprint_shorten_url = Blueprint('shorten_url', __name__)
 blueprint_get_url = Blueprint('get_url', __name__)
 blueprint_get_stats = Blueprint('get_stats', __name__)
+blueprint_check_shortcodes = Blueprint('check_shortcodes', __name__)
+blueprint_metrics = Blueprint('metrics', __name__)
+
+
+def parse_expiry(request_data, max_ttl):
+    """
+    This method determines the expiry moment from the request payload,
+    provided either as a TTL in seconds, or as an ISO 8601 expiresAt
+    moment.
+
+    :param request_data: The provided request payload.
+    :type request_data: dict
+
+    :param max_ttl: The provided maximum amount of seconds until the
+        expiry moment.
+    :type max_ttl: int
+
+    :raises:
+        InvalidRequestPayload: When both the ttl and expiresAt are provided.
+        InvalidRequestPayload: When the ttl is not a positive integer.
+        InvalidRequestPayload: When the expiresAt is not an ISO 8601 moment
+            in the future.
+        InvalidRequestPayload: When the expiry moment is more than the
+            max_ttl seconds away.
+
+    :return: The naive UTC expiry moment, or None if the link never expires.
+    :rtype: datetime.datetime
+    """
+    ttl = request_data.get('ttl')
+    expires_at = request_data.get('expiresAt')
+    if ttl is not None and expires_at is not None:
+        raise InvalidRequestPayload('Provide either ttl or expiresAt')
+    now = datetime.utcnow()
+    if ttl is not None:
+        if isinstance(ttl, bool) or not isinstance(ttl, int) or ttl <= 0:
+            raise InvalidRequestPayload('Ttl must be a positive integer')
+        if ttl > max_ttl:
+            raise InvalidRequestPayload('Ttl must be at most {MAX} seconds'.format(MAX=max_ttl))
+        return now + timedelta(seconds=ttl)
+    if expires_at is not None:
+        try:
+            expiry = datetime.fromisoformat(str(expires_at).replace('Z', '+00:00'))
+            if expiry.tzinfo is not None:
+                expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+        except (ValueError, OverflowError):
+            raise InvalidRequestPayload('ExpiresAt must be an ISO 8601 datetime')
+        if expiry <= now:
+            raise InvalidRequestPayload('ExpiresAt must be in the future')
+        if expiry - now > timedelta(seconds=max_ttl):
+            raise InvalidRequestPayload('ExpiresAt must be at most {MAX} seconds away'.format(MAX=max_ttl))
+        return expiry
+    return None
+
+
+def parse_breakdown(breakdown):
+    """
+    This method determines the click analytics dimensions from the
+    breakdown parameter, a comma separated list of dimensions. An empty
+    breakdown parameter selects all dimensions.
+
+    :param breakdown: The provided breakdown parameter.
+    :type breakdown: str
+
+    :raises:
+        InvalidRequestPayload: When an unknown dimension is provided.
+
+    :return: The dimensions.
+    :rtype: list
+    """
+    from analytics import DIMENSIONS
+    if not breakdown:
+        return list(DIMENSIONS)
+    dimensions = [dimension.strip() for dimension in breakdown.split(',') if dimension.strip()]
+    if not dimensions or any(dimension not in DIMENSIONS for dimension in dimensions):
+        raise InvalidRequestPayload('Breakdown must be one of: {DIMENSIONS}'.format(DIMENSIONS=', '.join(DIMENSIONS)))
+    return dimensions
+
+
+@blueprint_shorten_url.before_request
+def replay_idempotent_request():
+    """
+    This method replays the stored result of an earlier url shortening
+    request with the same Idempotency-Key header, without running the
+    Url database model specific methods again.
+
+    A new Idempotency-Key is reserved before the request is handled, so
+    a concurrent retry is refused instead of running the request twice.
+    The reservation expires after IDEMPOTENCY_RESERVATION_TTL seconds,
+    so the key is released if the worker dies during the request.
+
+    :raises:
+        IdempotencyKeyReused: When the Idempotency-Key was used before
+            for a different request payload.
+        IdempotencyRequestInProgress: When a request with the same
+            Idempotency-Key is still being handled.
+
+    :return: The replayed response, or None if no result is stored.
+    :rtype: flask.Response
+    """
+    key = request.headers.get('Idempotency-Key')
+    if key is None:
+        return None
+    digest = hashlib.sha1(request.get_data()).hexdigest()
+    reservation_ttl = current_app.config.get('IDEMPOTENCY_RESERVATION_TTL', 30)
+    if idempotency_results.add(key, (digest, None, None), ttl=reservation_ttl):
+        metrics.incr('idempotency.misses')
+        metrics.ratio('idempotency.replay_hit_rate', 'idempotency.hits', ['idempotency.hits', 'idempotency.misses'])
+        g.idempotency_key = (key, digest)
+        return None
+    stored_digest, status_code, body = idempotency_results.get(key, (digest, None, None))
+    if stored_digest != digest:
+        raise IdempotencyKeyReused
+    if status_code is None:
+        metrics.incr('idempotency.in_progress')
+        raise IdempotencyRequestInProgress
+    metrics.incr('idempotency.hits')
+    metrics.ratio('idempotency.replay_hit_rate', 'idempotency.hits', ['idempotency.hits', 'idempotency.misses'])
+    response = Response(body, status=status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+@blueprint_shorten_url.after_request
+def store_idempotent_result(response):
+    """
+    This method stores the status and body of an url shortening
+    response for a request with an Idempotency-Key header.
+
+    Server errors are not stored and release the Idempotency-Key, so a
+    retry runs the request again.
+
+    :param response: The provided response.
+    :type response: flask.Response
+
+    :return: The unaltered response.
+    :rtype: flask.Response
+    """
+    idempotency_key = g.pop('idempotency_key', None)
+    if idempotency_key is None:
+        return response
+    key, digest = idempotency_key
+    if response.status_code < 500:
+        idempotency_results.set(key, (digest, response.status_code, response.get_data()))
+        metrics.incr('idempotency.stores')
+    else:
+        idempotency_results.pop(key)
+    return response
+
+
+@blueprint_shorten_url.teardown_request
+def release_idempotency_key(error=None):
+    """
+    This method releases the reserved Idempotency-Key of a request that
+    ended without a stored result, e.g. on an unhandled exception.
+
+    :param error: The provided unhandled exception, if any.
+    :type error: Exception
+    """
+    idempotency_key = g.pop('idempotency_key', None)
+    if idempotency_key is not None:
+        idempotency_results.pop(idempotency_key[0])
 
 
 @blueprint_shorten_url.route('/shorten', methods=['POST'])
@@ -19,20 +185,24 @@ def shorten_url():
     routed to the configured relative routing url and being
     a POST request.
 
-    The Url database model specific methods will handle the logic.
+    The configured storage backend will handle the logic.
 
     :raises:
         InvalidRequestPayload: When the provided payload is invalid JSON.
         InvalidRequestPayload: When the provided payload does not contain
             the url to shorten.
+        InvalidRequestPayload: When the provided ttl or expiresAt is invalid.
 
     :return: The shortened url and corresponding shortcode.
     :rtype: flask.Response
 
     .. note::
         Note that if no shortcode is provided in the request payload, the
-        shortcode is set to None, the Shortcode database model specific
-        methods will handle the logic.
+        shortcode is set to None, the configured storage backend will
+        handle the logic.
+    .. note::
+        Retries with the same Idempotency-Key header are replayed by
+        replay_idempotent_request, before this method is reached.
     """
     if not request.is_json:
         raise InvalidRequestPayload('Unsupported Media Type: Invalid JSON')
@@ -44,8 +214,16 @@ def shorten_url():
         request_shortcode = None
     else:
         request_shortcode = request_data['shortcode']
+    expires_at = parse_expiry(
+        request_data=request_data,
+        max_ttl=current_app.config.get('EXPIRY_MAX_TTL', 100 * 365 * 86400)
+    )
 
-    shortcode = Url.insert_url(url=request_url, shortcode=request_shortcode)
+    shortcode = current_app.extensions['storage'].insert_url(
+        url=request_url,
+        shortcode=request_shortcode,
+        expires_at=expires_at
+    )
     response = jsonify({
         "shortcode": shortcode
     })
@@ -53,6 +231,54 @@ def shorten_url():
     return response
 
 
+@blueprint_check_shortcodes.route('/shorten/check', methods=['POST'])
+def check_shortcodes():
+    """
+    This endpoint method handles the bulk shortcode availability checks,
+    routed to the configured relative routing url and being a POST
+    request, so candidate shortcodes are checked before shortening.
+
+    The configured storage backend will handle the logic.
+
+    :raises:
+        InvalidRequestPayload: When the provided payload is invalid JSON.
+        InvalidRequestPayload: When the provided payload does not contain
+            a list of candidate shortcodes.
+        InvalidRequestPayload: When more candidates are provided than
+            the configured maximum.
+        InvalidRequestPayload: When the provided amount of suggestions
+            is not an integer between zero and the configured maximum.
+
+    :return: The validity, availability and optional suggestions
+        per candidate shortcode, in the provided order.
+    :rtype: flask.Response
+
+    .. note::
+        The availability is a snapshot, a custom shortcode can still be
+        taken before it is used with the url shortening request.
+    """
+    if not request.is_json:
+        raise InvalidRequestPayload('Unsupported Media Type: Invalid JSON')
+    request_data = request.get_json()
+    candidates = request_data.get('shortcodes') if isinstance(request_data, dict) else None
+    if not isinstance(candidates, list):
+        raise InvalidRequestPayload('Shortcodes must be a list')
+    max_candidates = current_app.config.get('SHORTCODE_CHECK_MAX_CANDIDATES', 100)
+    if len(candidates) > max_candidates:
+        raise InvalidRequestPayload('At most {MAX} shortcodes can be checked at once'.format(MAX=max_candidates))
+    suggestions = request_data.get('suggest', 0)
+    max_suggestions = current_app.config.get('SHORTCODE_CHECK_MAX_SUGGESTIONS', 5)
+    if isinstance(suggestions, bool) or not isinstance(suggestions, int) or not 0 <= suggestions <= max_suggestions:
+        raise InvalidRequestPayload('Suggest must be an integer between 0 and {MAX}'.format(MAX=max_suggestions))
+
+    results = current_app.extensions['storage'].check_availability(shortcodes=candidates, suggestions=suggestions)
+    response = jsonify({
+        "shortcodes": results
+    })
+    response.status_code = 200
+    return response
+
+
 @blueprint_get_url.route('/<shortcode>', methods=['GET'])
 def get_url(shortcode):
     """
@@ -60,28 +286,53 @@ def get_url(shortcode):
     routed to the shortcode specific routing url and being
     a GET request.
 
-    The Redirect database model specific methods will handle the logic.
+    The configured storage backend will handle the logic.
 
     :param shortcode: The provided shortcode as url parameter.
     :type shortcode: str
 
     :return: The response with the corresponding url for the provided
         shortcode added to the Location header.
-    :rtype: flask.Response
+    :rtype: responses.RedirectResponse
 
     .. note::
-        The Redirect database model specific methods handle the logic
-        and exception handling for this endpoint, as the endpoint relies
-        heavily on database specific logic.
+        The storage backend handles the logic and exception handling
+        for this endpoint, as the endpoint relies heavily on storage
+        specific logic.
+    .. note::
+        With the degraded mode enabled, the redirect is served from the
+        local link snapshot while the database is unavailable.
+    .. note::
+        With the link index enabled, the redirect is served from the
+        compact link index of this worker, and the click is counted in
+        batches.
     .. seealso::
+        See for the storage backends: src/storage.py
         See for database model related methods: src/models.py
         See for exception related exceptions: src/exceptions.py
+        See for the redirect response configuration: src/responses.py
+        See for the degraded mode: src/degraded.py
+        See for the click analytics: src/analytics.py
+        See for the link index: src/link_index.py
     """
-    redirect_url = Redirect.redirect(shortcode=shortcode)
-    response = jsonify()
-    response.status_code = 302
-    response.headers['Location'] = redirect_url
-    return response
+    link_index = current_app.extensions.get('link_index')
+    redirect_url = link_index.redirect(shortcode=shortcode) if link_index is not None else None
+    if redirect_url is None:
+        degraded_redirects = current_app.extensions.get('degraded_redirects')
+        if degraded_redirects is not None:
+            redirect_url = degraded_redirects.redirect(shortcode=shortcode)
+        else:
+            redirect_url = current_app.extensions['storage'].resolve(shortcode=shortcode)
+    stats_versions.pop(shortcode)
+    click_analytics = current_app.extensions.get('click_analytics')
+    if click_analytics is not None:
+        click_analytics.record(
+            shortcode=shortcode,
+            referrer=request.referrer,
+            user_agent=request.user_agent.string,
+            address=request.remote_addr
+        )
+    return current_app.extensions['redirect_responder'](redirect_url)
 
 
 @blueprint_get_stats.route('/<shortcode>/stats', methods=['GET'])
@@ -91,24 +342,109 @@ def get_stats(shortcode):
     routed to the shortcode specific routing url concatenated with
     the stats endpoint and being a GET request.
 
-    The Stat database model specific methods will handle the logic.
+    The configured storage backend will handle the logic.
 
     :param shortcode: The provided shortcode as url parameter.
     :type shortcode: str
 
+    :raises:
+        InvalidRequestPayload: When the breakdown parameter holds an
+            unknown dimension.
+
     :return: The response with the corresponding stats details for the
-        provided shortcode.
+        provided shortcode, or a 304 response when the If-None-Match
+        header matches the current ETag.
     :rtype: flask.Response
 
     .. note::
-        The Stat database model specific methods handle the logic
-        and exception handling for this endpoint, as the endpoint relies
-        heavily on database specific logic.
+        The storage backend handles the logic and exception handling
+        for this endpoint, as the endpoint relies heavily on storage
+        specific logic.
+    .. note::
+        The ETag of the last served stats is kept as a version stamp,
+        which is dropped on a redirect of the shortcode in this worker,
+        so a matching conditional request is answered without querying
+        the database. The ETags of the compressed representations match
+        as well.
+    .. note::
+        With the breakdown parameter, the click aggregates per referrer
+        host, client family and country are added. These responses are
+        not version stamped, and the pending clicks of this worker are
+        flushed first.
     .. seealso::
+        See for the storage backends: src/storage.py
         See for database model related methods: src/models.py
         See for exception related exceptions: src/exceptions.py
+        See for the click analytics: src/analytics.py
     """
-    stats = Stat.get_stats(shortcode=shortcode)
+    if 'breakdown' in request.args:
+        dimensions = parse_breakdown(breakdown=request.args['breakdown'])
+        click_analytics = current_app.extensions.get('click_analytics')
+        if click_analytics is not None:
+            click_analytics.flush()
+        stats = current_app.extensions['storage'].get_stats(shortcode=shortcode)
+        stats['breakdown'] = ClickAggregate.breakdown(shortcode=shortcode, dimensions=dimensions)
+        response = jsonify(stats)
+        response.status_code = 200
+        return response
+    max_age = current_app.config.get('STATS_MAX_AGE', 0)
+    version = stats_versions.get(shortcode)
+    matched = matching_etag(etag=version) if version is not None else None
+    if matched is not None:
+        return not_modified(etag=matched, max_age=max_age)
+    stats = current_app.extensions['storage'].get_stats(shortcode=shortcode)
+    etag = stats_etag(stats=stats)
+    stats_versions.set(shortcode, etag)
+    matched = matching_etag(etag=etag)
+    if matched is not None:
+        return not_modified(etag=matched, max_age=max_age)
     response = jsonify(stats)
     response.status_code = 200
+    return cacheable(response=response, etag=etag, max_age=max_age)
+
+
+@blueprint_get_stats.route('/stats', methods=['GET'])
+def get_global_stats():
+    """
+    This endpoint method handles the service-wide stats requests,
+    routed to the stats routing url and being a GET request.
+
+    The configured storage backend will handle the logic.
+
+    :raises:
+        InvalidRequestPayload: When the days parameter is not an integer
+            between one and the configured maximum.
+
+    :return: The response with the amount of links and clicks, and the
+        links created and clicks per day of the provided amount of most
+        recent days.
+    :rtype: flask.Response
+
+    .. note::
+        The totals are materialized by the storage backend, so this
+        endpoint does not scan the links. See the reconcile-stats command
+        for the drift between the totals and the links.
+    """
+    max_days = current_app.config.get('GLOBAL_STATS_MAX_DAYS', 366)
+    days = request.args.get('days', current_app.config.get('GLOBAL_STATS_DAYS', 30))
+    try:
+        days = int(days)
+    except ValueError:
+        days = 0
+    if not 1 <= days <= max_days:
+        raise InvalidRequestPayload('Days must be an integer between 1 and {MAX}'.format(MAX=max_days))
+    response = jsonify(current_app.extensions['storage'].summary(days=days))
+    response.status_code = 200
     return response
+
+
+@blueprint_metrics.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    This endpoint method exposes the in-process counters and gauges
+    of the worker handling the request.
+
+    :return: The streamed response with the counters and gauges.
+    :rtype: flask.Response
+    """
+    return stream_json(data=metrics.snapshot(), status_code=200)
@@ -1,5 +1,6 @@
 from abc import ABC
-from flask import jsonify
+import json
+from flask import jsonify, Response
 
 
 class AbstractHttpException(ABC, Exception):
@@ -42,6 +43,10 @@ class AbstractHttpException(ABC, Exception):
         This method initializes the subclass object first, in
         order to determine if the required attributes are set.
 
+        The response body for the fixed exception message is
+        serialized once here, so raising the exception without a
+        custom message or payload does not serialize it again.
+
         :raises:
             NotImplementedError: Is raised when a required attribute is
                 missing in the subclass.
@@ -57,6 +62,7 @@ class AbstractHttpException(ABC, Exception):
                         EXCEPTION=cls.__name__,
                         PARAM=attr
                     ))
+        cls.HTTP_BODY = json.dumps({'message': cls.MESSAGE}, separators=(',', ':')).encode('utf-8') + b'\n'
 
     def http_response(self):
         """
@@ -66,6 +72,8 @@ class AbstractHttpException(ABC, Exception):
         :return: The HTTP response package.
         :rtype: flask.Response
         """
+        if self.payload is None and self._message == self.MESSAGE:
+            return Response(self.HTTP_BODY, status=self.STATUS_CODE, mimetype='application/json')
         response = dict(self.payload or ())
         response['message'] = self._message
         http_package = jsonify(response)
@@ -99,3 +107,45 @@ class InvalidShortcode(AbstractHttpException):
     """This Exception should be used when the provided shortcode by the client has an invalid format"""
     STATUS_CODE = 412
     MESSAGE = 'The provided shortcode is invalid'
+
+
+class IdempotencyKeyReused(AbstractHttpException):
+    """This Exception should be used when an Idempotency-Key is reused for a different request payload"""
+    STATUS_CODE = 422
+    MESSAGE = 'Idempotency-Key already used for a different request payload'
+
+
+class IdempotencyRequestInProgress(AbstractHttpException):
+    """This Exception should be used when a request with the same Idempotency-Key is still being handled"""
+    STATUS_CODE = 409
+    MESSAGE = 'A request with this Idempotency-Key is still in progress, retry later'
+
+
+class ServiceOverloaded(AbstractHttpException):
+    """This Exception should be used when a request is shed, as the service can not admit it in time"""
+    STATUS_CODE = 503
+    MESSAGE = 'Service overloaded, retry later'
+
+    def __init__(self, *args, retry_after=1, **kwargs):
+        """
+        This method initializes the Exception object with
+        the provided parameters, if provided.
+
+        :param retry_after: The provided amount of seconds after which
+            the client may retry.
+        :type retry_after: int
+        """
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+
+    def http_response(self):
+        """
+        This method creates a HTTP response package from
+        the provided parameters, with the Retry-After header.
+
+        :return: The HTTP response package.
+        :rtype: flask.Response
+        """
+        http_package = super().http_response()
+        http_package.headers['Retry-After'] = str(self.retry_after)
+        return http_package
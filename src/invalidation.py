@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import and_, bindparam, func, select, text
+
+from cache import stats_versions
+from db import db as dbs
+from metrics import metrics
+from models import LinkChange
+import shortcode_codec
+
+LOGGER = logging.getLogger(__name__)
+
+
+def drop_stats_versions(changes):
+    """
+    This method drops the stats version stamps of the changed links.
+
+    :param changes: The provided (shortcode, kind) changes.
+    :type changes: list
+    """
+    for shortcode, _ in changes:
+        stats_versions.pop(shortcode)
+
+
+class InvalidationBus:
+    """
+    This object propagates the link changes of all workers to the
+    cached link state of this worker, through the link change log.
+
+    A daemon thread polls the SQLite data_version on its own connection,
+    which only changes when another connection commits, so an idle
+    database costs one pragma per poll. On a change, the new change log
+    entries are read in batches and every batch is handed to the
+    subscribers at once.
+
+    The propagation delay is bounded by the poll interval plus the batch
+    reads, and is measured from the moment of the change. The subscribers
+    run in the polling thread, so the request paths never wait for them.
+    """
+    def __init__(self, app, poll_interval=0.05, batch_size=500, retention=3600):
+        """
+        This method initializes the bus with the provided parameters.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :param poll_interval: The amount of seconds between two polls.
+        :type poll_interval: float
+
+        :param batch_size: The maximum amount of changes per batch.
+        :type batch_size: int
+
+        :param retention: The amount of seconds a change is kept in the
+            change log.
+        :type retention: float
+        """
+        self.app = app
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.retention = retention
+        self.subscribers = []
+        self.last_id = None
+        self.data_version = None
+        self.pruned_at = time.monotonic()
+        self._connection = None
+        self._failing = False
+        self._stopped = threading.Event()
+        self._connected = threading.Event()
+        self._thread = None
+        table = LinkChange.__table__
+        self._changes = select([table.c.id, table.c.shortcodeId, table.c.kind, table.c.createdAt]).where(
+            table.c.id > bindparam('last_id')
+        ).order_by(table.c.id).limit(batch_size)
+        self._last_id = select([table.c.id]).order_by(table.c.id.desc()).limit(1)
+        # The newest change is never pruned, so SQLite never reuses the ids below last_id.
+        self._prune = table.delete().where(and_(
+            table.c.createdAt < bindparam('before'),
+            table.c.id < select([func.max(table.c.id)]).as_scalar()
+        ))
+
+    @classmethod
+    def from_config(cls, app):
+        """
+        This method creates the bus from the provided app configuration.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :return: The bus, with the stats version stamps subscribed.
+        :rtype: invalidation.InvalidationBus
+        """
+        bus = cls(
+            app=app,
+            poll_interval=app.config.get('INVALIDATION_POLL_INTERVAL', 0.05),
+            batch_size=app.config.get('INVALIDATION_BATCH_SIZE', 500),
+            retention=app.config.get('INVALIDATION_RETENTION', 3600)
+        )
+        bus.subscribe(drop_stats_versions)
+        return bus
+
+    def subscribe(self, subscriber):
+        """
+        This method registers a subscriber, called with every batch of
+        (shortcode, kind) changes.
+
+        A subscriber replacing a structure read by the request paths
+        should build the new structure aside and swap it in, so the
+        request paths stay lock-free.
+
+        :param subscriber: The provided subscriber.
+        :type subscriber: collections.abc.Callable
+        """
+        self.subscribers.append(subscriber)
+
+    def connect(self):
+        """
+        This method opens the polling connection and skips the changes
+        made before.
+        """
+        with self.app.app_context():
+            engine = dbs.get_engine()
+        self._connection = engine.connect()
+        self.last_id = self._connection.execute(self._last_id).scalar() or 0
+        self.data_version = self._poll_data_version()
+
+    def close(self):
+        """This method closes the polling connection."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _poll_data_version(self):
+        if self._connection.dialect.name != 'sqlite':
+            return None
+        return self._connection.execute(text('PRAGMA data_version')).scalar()
+
+    def poll(self):
+        """
+        This method applies the changes committed since the last poll,
+        batch by batch.
+
+        :return: The amount of applied changes.
+        :rtype: int
+        """
+        data_version = self._poll_data_version()
+        if data_version is not None and data_version == self.data_version:
+            return 0
+        self.data_version = data_version
+        applied = 0
+        while True:
+            rows = self._connection.execute(self._changes, last_id=self.last_id).fetchall()
+            if not rows:
+                break
+            self.apply(rows=rows)
+            self.last_id = rows[-1].id
+            applied += len(rows)
+            if len(rows) < self.batch_size:
+                break
+        if time.monotonic() - self.pruned_at >= min(self.retention, 60):
+            self.pruned_at = time.monotonic()
+            self._connection.execute(self._prune, before=time.time() - self.retention)
+        return applied
+
+    def apply(self, rows):
+        """
+        This method hands a batch of change log entries to the subscribers,
+        and records the propagation delay.
+
+        :param rows: The provided change log entries.
+        :type rows: list
+        """
+        changes = [(shortcode_codec.decode(row.shortcodeId), row.kind) for row in rows]
+        for subscriber in self.subscribers:
+            try:
+                subscriber(changes)
+            except Exception:
+                LOGGER.exception('Invalidation subscriber failed')
+        delay = (time.time() - min(row.createdAt for row in rows)) * 1000
+        metrics.incr('invalidation.changes', len(rows))
+        metrics.incr('invalidation.batches')
+        metrics.set_gauge('invalidation.delay_ms', round(delay, 3))
+        metrics.set_gauge('invalidation.delay_max_ms', round(max(delay, metrics.get('invalidation.delay_max_ms')), 3))
+
+    def _run(self):
+        try:
+            self.connect()
+        finally:
+            self._connected.set()
+        try:
+            while not self._stopped.wait(self.poll_interval):
+                try:
+                    self.poll()
+                except Exception:
+                    if not self._failing:
+                        LOGGER.warning('Invalidation poll failed, retrying every poll', exc_info=True)
+                    self._failing = True
+                    metrics.incr('invalidation.poll_failures')
+                else:
+                    self._failing = False
+        finally:
+            self.close()
+
+    def start(self):
+        """
+        This method starts the bus in a daemon thread, which opens its
+        own polling connection, and waits for the connection.
+        """
+        self._thread = threading.Thread(target=self._run, name='invalidation-bus', daemon=True)
+        self._thread.start()
+        self._connected.wait()
+
+    def stop(self):
+        """This method stops the bus thread."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,453 @@
+"""
+The compact per-worker link index, an alternative to a dict of
+shortcode to url strings, which costs well over 100 bytes per link.
+
+The index holds the links in a few flat arrays instead of Python
+objects, i.e. about 20 bytes plus the UTF-8 url bytes per link:
+
+- keys: the packed shortcodes, sorted, searched with a binary search.
+- expires: the expiry epoch of every link, 0 if none, as 64-bit
+  integers, so any datetime up to the year 9999 fits.
+- offsets: the offsets of the urls in one contiguous UTF-8 buffer.
+- host ids: with the host compression, the index of the scheme and
+  host prefix of every url in the host table, the buffer holding the
+  rest of the urls only.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+import calendar
+import logging
+import sys
+import threading
+import time
+
+from cache import stats_versions
+from db import db as dbs
+from metrics import metrics
+from models import LinkChange, Shortcode, Url
+import shortcode_codec
+
+LOGGER = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def split_host(url):
+    """
+    This method splits the provided url into its scheme and host prefix
+    and the rest of the url.
+
+    :param url: The provided url.
+    :type url: str
+
+    :return: The prefix, empty for a url without a scheme, and the rest.
+    :rtype: tuple
+    """
+    scheme = url.find('://')
+    if scheme < 0:
+        return '', url
+    path = url.find('/', scheme + 3)
+    if path < 0:
+        return url, ''
+    return url[:path], url[path:]
+
+
+def _epoch(expires_at):
+    return calendar.timegm(expires_at.utctimetuple()) if expires_at is not None else 0
+
+
+class CompactLinkIndex:
+    """
+    This object is an immutable, compact shortcode to url index, see the
+    module docstring for the layout.
+
+    A changed index is built aside, with the merged method, so a lookup
+    never sees a partially built index.
+    """
+    def __init__(self, keys, expires, offsets, buffer, hosts=None, host_ids=None):
+        """
+        This method initializes the index with the provided arrays, see build.
+        """
+        self.keys = keys
+        self.expires = expires
+        self.offsets = offsets
+        self.buffer = buffer
+        self.hosts = hosts
+        self.host_ids = host_ids
+
+    @classmethod
+    def build(cls, rows, compress_hosts=True):
+        """
+        This method builds the index from the provided rows.
+
+        :param rows: The provided (packed shortcode, url, expiry epoch)
+            rows, sorted on the packed shortcode.
+        :type rows: collections.abc.Iterable
+
+        :param compress_hosts: Whether the scheme and host prefixes of the
+            urls are stored once, in the host table.
+        :type compress_hosts: bool
+
+        :return: The index.
+        :rtype: link_index.CompactLinkIndex
+        """
+        keys, expires, offsets, buffer = array('I'), array('q'), array('I', [0]), bytearray()
+        hosts, host_ids, host_table = ([], array('I'), {}) if compress_hosts else (None, None, None)
+        for key, url, expires_at in rows:
+            if compress_hosts:
+                host, url = split_host(url)
+                host_id = host_table.get(host)
+                if host_id is None:
+                    host_id = host_table[host] = len(hosts)
+                    hosts.append(host)
+                host_ids.append(host_id)
+            buffer += url.encode('utf-8')
+            keys.append(key)
+            expires.append(expires_at)
+            offsets.append(len(buffer))
+        return cls(keys=keys, expires=expires, offsets=offsets, buffer=buffer, hosts=hosts, host_ids=host_ids)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def url(self, index):
+        """
+        This method fetches the url at the provided position.
+
+        :param index: The provided position in the index.
+        :type index: int
+
+        :return: The url.
+        :rtype: str
+        """
+        url = self.buffer[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+        if self.hosts is not None:
+            return self.hosts[self.host_ids[index]] + url
+        return url
+
+    def lookup(self, key, now=None):
+        """
+        This method looks up the url of the provided packed shortcode,
+        with a binary search over the sorted keys.
+
+        :param key: The provided packed shortcode.
+        :type key: int
+
+        :param now: The provided reference epoch, defaults to the current time.
+        :type now: float
+
+        :return: The url, or None if the shortcode is not present or expired.
+        :rtype: str
+        """
+        index = bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            return None
+        expires = self.expires[index]
+        if expires and expires <= (now or time.time()):
+            return None
+        return self.url(index=index)
+
+    def merged(self, delta, now=None):
+        """
+        This method builds a new index from this index and the provided
+        changes. The expired links are left out.
+
+        :param delta: The provided (url, expiry epoch) per packed shortcode,
+            None for a deleted link.
+        :type delta: dict
+
+        :param now: The provided reference epoch, defaults to the current time.
+        :type now: float
+
+        :return: The new index.
+        :rtype: link_index.CompactLinkIndex
+        """
+        now = now or time.time()
+        changes = sorted(delta.items())
+
+        def rows():
+            position = 0
+            for index, key in enumerate(self.keys):
+                while position < len(changes) and changes[position][0] <= key:
+                    change_key, change = changes[position]
+                    position += 1
+                    if change is not None:
+                        yield change_key, change[0], change[1]
+                if position and changes[position - 1][0] == key:
+                    continue
+                yield key, self.url(index=index), self.expires[index]
+            for change_key, change in changes[position:]:
+                if change is not None:
+                    yield change_key, change[0], change[1]
+
+        return self.build(
+            rows=(row for row in rows() if not row[2] or row[2] > now),
+            compress_hosts=self.hosts is not None
+        )
+
+    def memory(self):
+        """
+        This method reports the memory used by the index.
+
+        :return: The amount of links, the bytes in total and per link,
+            and the amount of hosts.
+        :rtype: dict
+        """
+        size = sum(sys.getsizeof(part) for part in (self.keys, self.expires, self.offsets, self.buffer))
+        if self.hosts is not None:
+            size += sys.getsizeof(self.host_ids) + sys.getsizeof(self.hosts) + sum(map(sys.getsizeof, self.hosts))
+        return {
+            'entries': len(self),
+            'bytes': size,
+            'bytesPerEntry': round(size / len(self), 1) if len(self) else 0.0,
+            'hosts': len(self.hosts) if self.hosts is not None else None
+        }
+
+
+class IndexedRedirects:
+    """
+    This object serves the redirects from the compact link index of this
+    worker, without a database query.
+
+    The index is built in bulk from the database on start. The link
+    changes of the invalidation bus are collected in a small delta dict,
+    merged into a new index in a daemon thread once merge_size changes
+    are pending or every merge_interval seconds, and the index is rebuilt
+    from the database every rebuild_interval seconds. The delta and the
+    index are replaced, never changed in place, so the lookups take no
+    lock.
+
+    A shortcode missing from the index, i.e. created in another worker
+    without the invalidation bus, is resolved by the storage backend. The
+    clicks served from the index are counted in memory and added to the
+    storage backend every flush_interval seconds, so the redirect counts
+    lag by at most that interval.
+    """
+    def __init__(self, app, compress_hosts=True, merge_size=10000, merge_interval=5, flush_interval=1,
+                 rebuild_interval=3600):
+        """
+        This method initializes the redirects with the provided parameters.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :param compress_hosts: Whether the index compresses the url hosts.
+        :type compress_hosts: bool
+
+        :param merge_size: The amount of pending changes that triggers a merge.
+        :type merge_size: int
+
+        :param merge_interval: The amount of seconds between two merges.
+        :type merge_interval: float
+
+        :param flush_interval: The amount of seconds between two click flushes.
+        :type flush_interval: float
+
+        :param rebuild_interval: The amount of seconds between two rebuilds
+            from the database, 0 to never rebuild.
+        :type rebuild_interval: float
+        """
+        self.app = app
+        self.compress_hosts = compress_hosts
+        self.merge_size = merge_size
+        self.merge_interval = merge_interval
+        self.flush_interval = flush_interval
+        self.rebuild_interval = rebuild_interval
+        self.index = CompactLinkIndex.build(rows=(), compress_hosts=compress_hosts)
+        self.delta = {}
+        self.merging = {}
+        self.clicks = Counter()
+        self.merged_at = self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._clicks_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, app):
+        """
+        This method creates the redirects from the provided app configuration.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :return: The redirects.
+        :rtype: link_index.IndexedRedirects
+        """
+        return cls(
+            app=app,
+            compress_hosts=app.config.get('LINK_INDEX_COMPRESS_HOSTS', True),
+            merge_size=app.config.get('LINK_INDEX_MERGE_SIZE', 10000),
+            merge_interval=app.config.get('LINK_INDEX_MERGE_INTERVAL', 5),
+            flush_interval=app.config.get('LINK_INDEX_FLUSH_INTERVAL', 1),
+            rebuild_interval=app.config.get('LINK_INDEX_REBUILD_INTERVAL', 3600)
+        )
+
+    def _publish(self, index):
+        self.index = index
+        memory = index.memory()
+        metrics.set_gauge('link_index.entries', memory['entries'])
+        metrics.set_gauge('link_index.bytes', memory['bytes'])
+        metrics.set_gauge('link_index.bytes_per_entry', memory['bytesPerEntry'])
+
+    def build(self):
+        """
+        This method builds the index from the database, in one streamed query.
+
+        :return: The amount of indexed links.
+        :rtype: int
+        """
+        with self.app.app_context():
+            try:
+                rows = dbs.session.query(Shortcode.id, Url.url, Url.expiresAt).join(
+                    Url, Shortcode.urlId == Url.id
+                ).order_by(Shortcode.id).yield_per(10000)
+                index = CompactLinkIndex.build(
+                    rows=((key, url, _epoch(expires_at)) for key, url, expires_at in rows),
+                    compress_hosts=self.compress_hosts
+                )
+            finally:
+                dbs.session.remove()
+        self._publish(index=index)
+        self.built_at = time.monotonic()
+        return len(index)
+
+    def lookup(self, shortcode):
+        """
+        This method looks up the url of the provided shortcode, in the
+        pending changes first.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :return: The url, or None if the shortcode is not indexed, deleted
+            or expired.
+        :rtype: str
+        """
+        key = shortcode_codec.key(shortcode)
+        if key is None:
+            return None
+        for changes in (self.delta, self.merging):
+            change = changes.get(key, _MISSING)
+            if change is not _MISSING:
+                if change is None or (change[1] and change[1] <= time.time()):
+                    return None
+                return change[0]
+        return self.index.lookup(key=key)
+
+    def redirect(self, shortcode):
+        """
+        This method serves the redirect of the provided shortcode from the
+        index, counting the click in memory.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :return: The url, or None if the redirect has to be served by the
+            storage backend.
+        :rtype: str
+        """
+        url = self.lookup(shortcode=shortcode)
+        if url is None:
+            metrics.incr('link_index.misses')
+            return None
+        with self._clicks_lock:
+            self.clicks[shortcode] += 1
+        metrics.incr('link_index.hits')
+        return url
+
+    def apply(self, changes):
+        """
+        This method adds a batch of invalidation bus changes to a new
+        delta, fetching the urls of the created links in one query.
+
+        :param changes: The provided (shortcode, kind) changes.
+        :type changes: list
+        """
+        created = {shortcode_codec.encode(shortcode) for shortcode, kind in changes if kind == LinkChange.CREATED}
+        rows = []
+        if created:
+            with self.app.app_context():
+                try:
+                    rows = dbs.session.query(Shortcode.id, Url.url, Url.expiresAt).join(
+                        Url, Shortcode.urlId == Url.id
+                    ).filter(Shortcode.id.in_(created)).all()
+                finally:
+                    dbs.session.remove()
+        with self._lock:
+            delta = dict(self.delta)
+            for shortcode, kind in changes:
+                delta[shortcode_codec.encode(shortcode)] = None
+            for key, url, expires_at in rows:
+                delta[key] = (url, _epoch(expires_at))
+            self.delta = delta
+
+    def merge(self):
+        """
+        This method merges the pending changes into a new index.
+
+        :return: The amount of merged changes.
+        :rtype: int
+        """
+        with self._lock:
+            pending = self.merging = self.delta
+            self.delta = {}
+        if pending:
+            self._publish(index=self.index.merged(delta=pending))
+        self.merging = {}
+        self.merged_at = time.monotonic()
+        return len(pending)
+
+    def flush(self):
+        """
+        This method adds the clicks served from the index to the storage
+        backend. The storage counts the batch all or nothing, so the
+        clicks are kept pending as a whole if the storage fails.
+
+        :return: The amount of flushed clicks.
+        :rtype: int
+        """
+        with self._clicks_lock:
+            pending, self.clicks = self.clicks, Counter()
+        if not pending:
+            return 0
+        with self.app.app_context():
+            try:
+                counted = self.app.extensions['storage'].record_redirects(counts=dict(pending))
+            except Exception:
+                dbs.session.rollback()
+                with self._clicks_lock:
+                    self.clicks.update(pending)
+                metrics.incr('link_index.flush_failures')
+                raise
+            finally:
+                dbs.session.remove()
+        for shortcode in pending:
+            stats_versions.pop(shortcode)
+        return counted
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+                now = time.monotonic()
+                if self.rebuild_interval and now - self.built_at >= self.rebuild_interval:
+                    self.build()
+                elif len(self.delta) >= self.merge_size or (self.delta and now - self.merged_at >= self.merge_interval):
+                    self.merge()
+            except Exception:
+                LOGGER.warning('Link index maintenance failed, retrying', exc_info=True)
+
+    def start(self):
+        """This method builds the index and starts the maintenance daemon thread."""
+        self.build()
+        self._thread = threading.Thread(target=self._run, name='link-index', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """This method stops the maintenance thread, after a last click flush."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
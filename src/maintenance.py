@@ -0,0 +1,409 @@
+from collections import deque
+import logging
+import os
+import threading
+import time
+
+from flask import g
+from sqlalchemy import text
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from db import db as dbs
+from metrics import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+TABLES = ('shortcode', 'url', 'stat', 'redirect')
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+class LatencyMonitor:
+    """
+    This object keeps the latencies of the recently finished requests,
+    so the background maintenance can tell a quiet period from a busy one.
+    """
+    def __init__(self, threshold_ms=50, window=10, size=2048):
+        """
+        This method initializes the monitor with the provided parameters.
+
+        :param threshold_ms: The p99 request latency above which the
+            application is considered busy.
+        :type threshold_ms: float
+
+        :param window: The amount of seconds of recent requests considered.
+        :type window: float
+
+        :param size: The maximum amount of kept request latencies.
+        :type size: int
+        """
+        self.threshold_ms = threshold_ms
+        self.window = window
+        self.latencies = deque(maxlen=size)
+
+    def init_app(self, app):
+        """
+        This method registers the request hooks measuring the request latency.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+        """
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g.maintenance_started = time.monotonic()
+
+    def _teardown_request(self, error=None):
+        started = g.pop('maintenance_started', None)
+        if started is not None:
+            finished = time.monotonic()
+            self.record(latency_ms=(finished - started) * 1000, finished=finished)
+
+    def record(self, latency_ms, finished=None):
+        """
+        This method records the latency of a finished request.
+
+        :param latency_ms: The provided request latency in milliseconds.
+        :type latency_ms: float
+
+        :param finished: The monotonic time the request finished.
+        :type finished: float
+        """
+        self.latencies.append((time.monotonic() if finished is None else finished, latency_ms))
+
+    def p99(self):
+        """
+        This method computes the p99 latency of the requests finished
+        within the window.
+
+        :return: The p99 latency in milliseconds, 0.0 without requests.
+        :rtype: float
+        """
+        since = time.monotonic() - self.window
+        recent = sorted(latency for finished, latency in list(self.latencies) if finished >= since)
+        if not recent:
+            return 0.0
+        return recent[min(len(recent) - 1, int(len(recent) * 0.99))]
+
+    def quiet(self):
+        """
+        This method checks whether the recent p99 latency is within the
+        threshold.
+
+        :return: The quiet indication.
+        :rtype: bool
+        """
+        return self.p99() <= self.threshold_ms
+
+
+class MaintenanceScheduler:
+    """
+    This object keeps the SQLite database file healthy in the background:
+    it checkpoints the WAL, refreshes the planner statistics of the link
+    tables and returns the free pages to the file system.
+
+    The free pages are vacuumed in small incremental steps, every step a
+    short write transaction of its own, and the maintenance yields to the
+    requests as soon as the recent p99 request latency exceeds the
+    threshold, i.e. the remaining steps wait for the next quiet run.
+
+    The incremental vacuum only returns pages of a database created with
+    auto_vacuum set to incremental, as the migrate command does for a new
+    database. The report shows the mode, an existing database has to be
+    converted once with a full VACUUM, see the maintenance command.
+
+    Of the workers sharing the database file, a single one runs the
+    scheduled maintenance: the worker holding the exclusive lock on the
+    lock file, taken over by another worker when it exits. Its requests
+    sample the latency of the load balanced requests of all workers.
+    Without fcntl, i.e. on Windows, every worker runs the maintenance.
+    """
+    def __init__(self, app, monitor=None, interval=300, vacuum_pages=100, step_pause=0.05, analyze_interval=86400,
+                 lock_path=None):
+        """
+        This method initializes the scheduler with the provided parameters.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :param monitor: The provided request latency monitor, None to
+            run the maintenance regardless of the request latency.
+        :type monitor: maintenance.LatencyMonitor
+
+        :param interval: The amount of seconds between two runs.
+        :type interval: float
+
+        :param vacuum_pages: The maximum amount of pages freed per step.
+        :type vacuum_pages: int
+
+        :param step_pause: The amount of seconds between two vacuum steps.
+        :type step_pause: float
+
+        :param analyze_interval: The amount of seconds between two full
+            ANALYZE runs of the link tables, the runs in between refresh
+            the statistics with PRAGMA optimize.
+        :type analyze_interval: float
+
+        :param lock_path: The provided path of the lock file electing the
+            single maintenance runner, None to always run.
+        :type lock_path: str
+        """
+        self.app = app
+        self.monitor = monitor
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self.step_pause = step_pause
+        self.analyze_interval = analyze_interval
+        self.analyzed_at = None
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, app):
+        """
+        This method creates the scheduler, and its request latency
+        monitor, from the provided app configuration. The lock file
+        defaults to the SQLite database path with a .maintenance.lock
+        suffix.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :return: The scheduler.
+        :rtype: maintenance.MaintenanceScheduler
+        """
+        monitor = LatencyMonitor(
+            threshold_ms=app.config.get('MAINTENANCE_LATENCY_THRESHOLD_MS', 50),
+            window=app.config.get('MAINTENANCE_LATENCY_WINDOW', 10)
+        )
+        monitor.init_app(app=app)
+        lock_path = app.config.get('MAINTENANCE_LOCK_PATH')
+        if lock_path is None:
+            with app.app_context():
+                url = dbs.get_engine().url
+            if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+                lock_path = url.database + '.maintenance.lock'
+        return cls(
+            app=app,
+            monitor=monitor,
+            interval=app.config.get('MAINTENANCE_INTERVAL', 300),
+            vacuum_pages=app.config.get('MAINTENANCE_VACUUM_PAGES', 100),
+            step_pause=app.config.get('MAINTENANCE_VACUUM_STEP_PAUSE', 0.05),
+            analyze_interval=app.config.get('MAINTENANCE_ANALYZE_INTERVAL', 86400),
+            lock_path=lock_path
+        )
+
+    def elect(self):
+        """
+        This method elects this worker as the maintenance runner, if no
+        other worker holds the lock file. The lock is held until stop,
+        or until the worker exits.
+
+        :return: The elected indication.
+        :rtype: bool
+        """
+        if self._lock_file is not None or self.lock_path is None or fcntl is None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def quiet(self):
+        """
+        This method checks whether the maintenance may continue.
+
+        :return: The quiet indication.
+        :rtype: bool
+        """
+        return self.monitor is None or self.monitor.quiet()
+
+    def report(self, connection):
+        """
+        This method reports the file, page and index sizes of the database.
+
+        :param connection: The provided database connection.
+        :type connection: sqlalchemy.engine.Connection
+
+        :return: The database report.
+        :rtype: dict
+        """
+        page_size = connection.execute(text('PRAGMA page_size')).scalar()
+        page_count = connection.execute(text('PRAGMA page_count')).scalar()
+        free_pages = connection.execute(text('PRAGMA freelist_count')).scalar()
+        path = connection.engine.url.database
+        on_disk = bool(path) and os.path.exists(path)
+        report = {
+            'database': path,
+            'fileBytes': os.path.getsize(path) if on_disk else page_size * page_count,
+            'walBytes': os.path.getsize(path + '-wal') if on_disk and os.path.exists(path + '-wal') else 0,
+            'pageSize': page_size,
+            'pageCount': page_count,
+            'freePages': free_pages,
+            'freeBytes': free_pages * page_size,
+            'autoVacuum': AUTO_VACUUM_MODES.get(connection.execute(text('PRAGMA auto_vacuum')).scalar()),
+            'journalMode': connection.execute(text('PRAGMA journal_mode')).scalar(),
+            'indexes': self.index_sizes(connection=connection)
+        }
+        metrics.set_gauge('maintenance.file_bytes', report['fileBytes'])
+        metrics.set_gauge('maintenance.free_pages', free_pages)
+        return report
+
+    @staticmethod
+    def index_sizes(connection):
+        """
+        This method fetches the size in bytes of every index of the link
+        tables, from the dbstat virtual table if SQLite provides it.
+
+        :param connection: The provided database connection.
+        :type connection: sqlalchemy.engine.Connection
+
+        :return: The index sizes, None without the dbstat virtual table.
+        :rtype: dict
+        """
+        try:
+            rows = connection.execute(text(
+                "SELECT m.name, sum(s.pgsize) FROM sqlite_master m JOIN dbstat s ON s.name = m.name "
+                "WHERE m.type = 'index' AND m.tbl_name IN ({TABLES}) GROUP BY m.name ORDER BY m.name".format(
+                    TABLES=', '.join("'{TABLE}'".format(TABLE=table) for table in TABLES)
+                )
+            )).fetchall()
+        except Exception:
+            return None
+        return {name: size for name, size in rows}
+
+    def checkpoint(self, connection):
+        """
+        This method checkpoints the WAL without waiting for the readers
+        or the writers, if the database is in WAL mode.
+
+        :param connection: The provided database connection.
+        :type connection: sqlalchemy.engine.Connection
+
+        :return: The (busy, log pages, checkpointed pages) result, None
+            outside WAL mode.
+        :rtype: tuple
+        """
+        if connection.execute(text('PRAGMA journal_mode')).scalar() != 'wal':
+            return None
+        return tuple(connection.execute(text('PRAGMA wal_checkpoint(PASSIVE)')).fetchone())
+
+    def analyze(self, connection, force=False):
+        """
+        This method refreshes the planner statistics: a full ANALYZE of
+        the link tables on the first run and every analyze interval,
+        PRAGMA optimize in between.
+
+        :param connection: The provided database connection.
+        :type connection: sqlalchemy.engine.Connection
+
+        :param force: The indication to run the full ANALYZE.
+        :type force: bool
+
+        :return: The statement run, i.e. 'analyze' or 'optimize'.
+        :rtype: str
+        """
+        stale = self.analyzed_at is None or time.monotonic() - self.analyzed_at >= self.analyze_interval
+        if force or stale or not connection.dialect.has_table(connection, 'sqlite_stat1'):
+            for table in TABLES:
+                connection.execute(text('ANALYZE {TABLE}'.format(TABLE=table)))
+            self.analyzed_at = time.monotonic()
+            return 'analyze'
+        connection.execute(text('PRAGMA optimize'))
+        return 'optimize'
+
+    def vacuum(self, connection):
+        """
+        This method returns the free pages to the file system, in steps of
+        the configured amount of pages, as long as the application is quiet.
+
+        :param connection: The provided database connection.
+        :type connection: sqlalchemy.engine.Connection
+
+        :return: The amount of vacuumed pages, and the indication whether
+            the vacuum yielded to the requests.
+        :rtype: tuple
+        """
+        vacuumed = 0
+        while not self._stopped.is_set():
+            free_pages = connection.execute(text('PRAGMA freelist_count')).scalar()
+            if not free_pages:
+                return vacuumed, False
+            if not self.quiet():
+                metrics.incr('maintenance.yields')
+                return vacuumed, True
+            # Stepped to completion by executescript, the sqlite3 module steps a pragma once, freeing one page.
+            connection.connection.executescript('PRAGMA incremental_vacuum({PAGES})'.format(PAGES=int(self.vacuum_pages)))
+            freed = free_pages - connection.execute(text('PRAGMA freelist_count')).scalar()
+            if freed <= 0:
+                return vacuumed, False
+            vacuumed += freed
+            metrics.incr('maintenance.vacuumed_pages', freed)
+            self._stopped.wait(self.step_pause)
+        return vacuumed, False
+
+    def run(self, analyze=False):
+        """
+        This method runs the maintenance once: the WAL checkpoint, the
+        statistics refresh and the incremental vacuum, every step skipped
+        once the application is busy.
+
+        :param analyze: The indication to run the full ANALYZE.
+        :type analyze: bool
+
+        :return: The database report after the maintenance, with the
+            vacuumed pages, the refresh statement, the checkpoint result and
+            the yield indication, or None for a database other than SQLite.
+        :rtype: dict
+        """
+        with self.app.app_context():
+            engine = dbs.get_engine()
+        if engine.dialect.name != 'sqlite':
+            return None
+        with engine.connect() as connection:
+            checkpoint, refreshed, vacuumed, yielded = None, None, 0, not self.quiet()
+            if yielded:
+                metrics.incr('maintenance.yields')
+            else:
+                checkpoint = self.checkpoint(connection=connection)
+                refreshed = self.analyze(connection=connection, force=analyze)
+                vacuumed, yielded = self.vacuum(connection=connection)
+            report = self.report(connection=connection)
+        metrics.incr('maintenance.runs')
+        return dict(report, vacuumedPages=vacuumed, refreshed=refreshed, checkpoint=checkpoint, yielded=yielded)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if not self.elect():
+                continue
+            try:
+                report = self.run()
+            except Exception:  # pragma: no cover
+                LOGGER.exception('Database maintenance failed')
+            else:
+                if report is not None and report['vacuumedPages']:
+                    LOGGER.info('Database maintenance vacuumed {PAGES} pages'.format(PAGES=report['vacuumedPages']))
+
+    def start(self):
+        """This method starts the scheduler in a daemon thread."""
+        self._thread = threading.Thread(target=self._run, name='database-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """This method stops the scheduler thread, releasing the runner lock."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
@@ -0,0 +1,94 @@
+import threading
+
+
+class MetricsRegistry:
+    """
+    This object keeps the in-process counters and gauges of the
+    application, exposed through the metrics endpoint.
+    """
+    def __init__(self):
+        """This method initializes the empty registry."""
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        """
+        This method increments the counter with the provided name.
+
+        :param name: The provided counter name.
+        :type name: str
+
+        :param amount: The provided increment.
+        :type amount: int
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        """
+        This method sets the gauge with the provided name.
+
+        :param name: The provided gauge name.
+        :type name: str
+
+        :param value: The provided gauge value.
+        :type value: int|float
+        """
+        self._gauges[name] = value
+
+    def get(self, name, default=0):
+        """
+        This method fetches the counter or gauge with the provided name.
+
+        :param name: The provided counter or gauge name.
+        :type name: str
+
+        :param default: The value returned for an unknown name.
+        :type default: int|float
+
+        :return: The counter or gauge value.
+        :rtype: int|float
+        """
+        if name in self._counters:
+            return self._counters[name]
+        return self._gauges.get(name, default)
+
+    def ratio(self, name, numerator, denominator):
+        """
+        This method sets the gauge with the provided name to the ratio
+        between two counters.
+
+        :param name: The provided gauge name.
+        :type name: str
+
+        :param numerator: The provided numerator counter name.
+        :type numerator: str
+
+        :param denominator: The provided denominator counter names.
+        :type denominator: list
+        """
+        total = sum(self._counters.get(counter, 0) for counter in denominator)
+        self.set_gauge(name, self._counters.get(numerator, 0) / total if total else 0.0)
+
+    def snapshot(self):
+        """
+        This method fetches a copy of all counters and gauges.
+
+        :return: The counters and gauges.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges)
+            }
+
+    def reset(self):
+        """This method removes all counters and gauges."""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+
+
+metrics = MetricsRegistry()
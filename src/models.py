@@ -1,9 +1,17 @@
+from collections import deque
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.util import identity_key
 from sqlalchemy.sql import func
-import string
 import random
-import re
+import time
 
 from db import db as dbs
+import shortcode_codec
+from cache import stats_versions
+from tracing import traced
+from repository import links
 from exceptions import ShortcodeAlreadyInUse, InvalidShortcode, ShortcodeNotFound
 
 
@@ -26,31 +34,189 @@ class Url(dbs.Model):
 
     id = dbs.Column(dbs.Integer, primary_key=True)
     url = dbs.Column(dbs.String, nullable=False)
+    expiresAt = dbs.Column(dbs.DateTime, nullable=True, index=True)
     shortcode = dbs.relationship('Shortcode', uselist=False, back_populates='url')
 
+    def is_expired(self, now=None):
+        """
+        This method checks if the Url record has passed its
+        expiry moment. Records without an expiry never expire.
+
+        :param now: The provided reference moment, defaults to the
+            current UTC time.
+        :type now: datetime.datetime
+
+        :return: The expiry status.
+        :rtype: bool
+        """
+        if self.expiresAt is None:
+            return False
+        return self.expiresAt <= (now or datetime.utcnow())
+
     @classmethod
-    def insert_url(cls, url, shortcode=None):
+    @traced('Url.insert_url')
+    def insert_url(cls, url, shortcode=None, expires_at=None):
         """
         This method creates a new Url record and
         returns the related shortcode. If the Url
         already exist, the existing related shortcode is returned.
 
+        The provided shortcode is validated without querying the
+        database, after which the records are inserted directly. The
+        unique constraints of the database decide on a conflict:
+
+        - An existing Url returns the existing related shortcode.
+        - A provided shortcode in use raises ShortcodeAlreadyInUse.
+        - A generated shortcode in use is replaced by a new one.
+
+        An existing Url that has already expired, but is not yet
+        removed by the sweeper, is purged first so the Url can be
+        shortened again.
+
         :param url: The provided URL.
         :type url: str
 
         :param shortcode: The provided shortcode.
         :type shortcode: str
 
+        :param expires_at: The provided optional expiry moment in UTC.
+        :type expires_at: datetime.datetime
+
+        :raises:
+            InvalidShortcode: When the provided shortcode has an invalid format.
+            ShortcodeAlreadyInUse: When the provided shortcode is already in use.
+
         :return: The related shortcode.
         :rtype: str
         """
-        _url = Url.query.filter_by(url=url).first()
-        if _url is None:
-            _shortcode = Shortcode.insert(shortcode=shortcode)
-            _url = cls(url=url, shortcode=_shortcode)
-        dbs.session.add(_url)
-        dbs.session.commit()
-        return _url.shortcode.shortcode
+        while True:
+            _shortcode = Shortcode.insert(shortcode=shortcode, check_in_use=False)
+            dbs.session.add(cls(url=url, shortcode=_shortcode, expiresAt=expires_at))
+            LinkChange.record(shortcode_ids=[_shortcode.id], kind=LinkChange.CREATED)
+            links.record_summary(links=1)
+            try:
+                dbs.session.commit()
+                return _shortcode.shortcode
+            except IntegrityError as error:
+                dbs.session.rollback()
+                violated = cls.violated_constraint(error=error)
+                if violated == cls.__tablename__:
+                    _url = cls.query.filter_by(url=url).first()
+                    if _url is None:
+                        continue
+                    if not _url.is_expired():
+                        return _url.shortcode.shortcode
+                    cls.purge(url_ids=[_url.id])
+                    dbs.session.commit()
+                elif violated == Shortcode.__tablename__:
+                    if shortcode is not None:
+                        raise ShortcodeAlreadyInUse
+                else:
+                    raise
+
+    @staticmethod
+    def violated_constraint(error):
+        """
+        This method determines which unique constraint is violated,
+        from the provided database error.
+
+        :param error: The provided database error.
+        :type error: sqlalchemy.exc.IntegrityError
+
+        :return: The table name of the violated unique constraint, or
+            None if no unique constraint is violated.
+        :rtype: str
+        """
+        message = str(error.orig)
+        if 'UNIQUE' not in message.upper():
+            return None
+        for column in (Url.url, Shortcode.id):
+            if '{TABLE}.{COLUMN}'.format(TABLE=column.table.name, COLUMN=column.name) in message:
+                return column.table.name
+        return None
+
+    @classmethod
+    @traced('Url.expired_ids')
+    def expired_ids(cls, limit, now=None):
+        """
+        This method fetches a batch of expired Url ids, driven
+        by the expiry index.
+
+        :param limit: The maximum amount of ids to fetch.
+        :type limit: int
+
+        :param now: The provided reference moment, defaults to the
+            current UTC time.
+        :type now: datetime.datetime
+
+        :return: The expired Url ids.
+        :rtype: list
+        """
+        rows = dbs.session.query(cls.id).filter(
+            cls.expiresAt <= (now or datetime.utcnow())
+        ).order_by(cls.expiresAt).limit(limit).all()
+        return [row.id for row in rows]
+
+    @classmethod
+    @traced('Url.purge')
+    def purge(cls, url_ids):
+        """
+        This method deletes the Url records for the provided ids,
+        together with the attached Shortcode, Stat and Redirect records
+        and the click aggregates. The deletions are added to the link
+        change log and subtracted from the global stats, the clicks per
+        day excepted. The freed shortcodes are released back to the
+        Shortcode allocator.
+
+        :param url_ids: The provided Url ids.
+        :type url_ids: list
+
+        :return: The freed shortcodes.
+        :rtype: list
+
+        .. warning::
+            The deletions are not committed to the database, as this
+            is done on a higher-level.
+        """
+        if not url_ids:
+            return []
+        shortcode_ids = [row.id for row in dbs.session.query(Shortcode.id).filter(
+            Shortcode.urlId.in_(url_ids)
+        )]
+        stat_ids = [row.id for row in dbs.session.query(Stat.id).filter(
+            Stat.shortcodeId.in_(shortcode_ids)
+        )] if shortcode_ids else []
+        redirect_ids = [row.id for row in dbs.session.query(Redirect.id).filter(
+            Redirect.statId.in_(stat_ids)
+        )] if stat_ids else []
+        deleted = {Url: url_ids, Shortcode: shortcode_ids, Stat: stat_ids, Redirect: redirect_ids}
+        LinkChange.record(shortcode_ids=shortcode_ids, kind=LinkChange.DELETED)
+        if stat_ids:
+            day = func.date(Stat.created)
+            clicks = 0
+            for row in dbs.session.query(day, func.count(Stat.id), func.sum(Redirect.redirectCount)).outerjoin(
+                Redirect, Redirect.statId == Stat.id
+            ).filter(Stat.id.in_(stat_ids)).group_by(day):
+                links.record_summary(links=-row[1], day=row[0])
+                clicks += row[2] or 0
+            links.record_summary(clicks=-clicks, daily=False)
+        if shortcode_ids:
+            ClickAggregate.query.filter(ClickAggregate.shortcodeId.in_(shortcode_ids)).delete(
+                synchronize_session=False
+            )
+        for model in (Redirect, Stat, Shortcode, Url):
+            if deleted[model]:
+                model.query.filter(model.id.in_(deleted[model])).delete(synchronize_session=False)
+        for model, ids in deleted.items():
+            for _id in ids:
+                instance = dbs.session.identity_map.get(identity_key(model, _id))
+                if instance is not None:
+                    dbs.session.expunge(instance)
+        freed = [shortcode_codec.decode(_id) for _id in shortcode_ids]
+        for shortcode in freed:
+            stats_versions.pop(shortcode)
+        Shortcode.release(shortcodes=freed)
+        return freed
 
 
 class Shortcode(dbs.Model):
@@ -59,22 +225,59 @@ class Shortcode(dbs.Model):
 
     For non time consuming development reasons, only One-to-One relations
     are set.
+
+    The shortcode is not stored as a string, but packed into the integer
+    primary key, so a shortcode lookup is a rowid seek and no separate
+    shortcode index is needed.
     """
     __tablename__ = 'shortcode'
-    __table_args__ = (
-        dbs.UniqueConstraint(
-            'shortcode'
-        ),
-    )
 
-    id = dbs.Column(dbs.Integer, primary_key=True)
+    id = dbs.Column(dbs.Integer, primary_key=True, autoincrement=False)
     urlId = dbs.Column(dbs.Integer, dbs.ForeignKey('url.id'))
     url = dbs.relationship('Url', back_populates='shortcode')
-    shortcode = dbs.Column(dbs.String)
     stats = dbs.relationship('Stat', uselist=False, back_populates='shortcode')
 
+    released = deque(maxlen=10000)
+    IN_QUERY_SIZE = 500
+
+    @property
+    def shortcode(self):
+        """
+        The shortcode string, unpacked from the primary key.
+
+        :rtype: str
+        """
+        if self.id is None:
+            return None
+        return shortcode_codec.decode(self.id)
+
+    @shortcode.setter
+    def shortcode(self, shortcode):
+        self.id = shortcode_codec.encode(shortcode)
+
     @staticmethod
-    def generate_random(length=6, chars=string.ascii_lowercase + string.digits + '_'):
+    def key(shortcode):
+        """
+        This method packs the provided shortcode into the primary
+        key value, without querying the database.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :raises:
+            ShortcodeNotFound: When the provided shortcode has an invalid
+                format, as such a shortcode can not exist.
+
+        :return: The packed shortcode.
+        :rtype: int
+        """
+        _key = shortcode_codec.key(shortcode)
+        if _key is None:
+            raise ShortcodeNotFound
+        return _key
+
+    @staticmethod
+    def generate_random(length=shortcode_codec.LENGTH, chars=shortcode_codec.ALPHABET):
         """
         This method generates a random string.
 
@@ -93,22 +296,21 @@ class Shortcode(dbs.Model):
     def check_validity(shortcode):
         """
         This method checks if the provided shortcode matches
-        the specific shortcode format, with a regex match check.
+        the specific shortcode format.
 
         :param shortcode: The provided shortcode.
         :type shortcode: str
 
         :return: The validity result.
         :rtype: bool
+
+        .. seealso::
+            See for the shortcode format: src/shortcode_codec.py
         """
-        desired_pattern = re.compile(r'^[a-z0-9_]{6}$')
-        match = desired_pattern.match(shortcode)
-        if match is not None:
-            return True
-        else:
-            return False
+        return shortcode_codec.is_valid(shortcode)
 
     @classmethod
+    @traced('Shortcode.check_in_use')
     def check_in_use(cls, shortcode):
         """
         This method checks if the provided shortcode is already in use,
@@ -120,25 +322,69 @@ class Shortcode(dbs.Model):
         :return: The in-use status.
         :rtype: bool
         """
-        _shortcode = cls.query.filter_by(shortcode=shortcode).first()
-        if _shortcode is None:
-            return False
-        else:
-            return True
+        return links.exists(shortcode=shortcode)
+
+    @classmethod
+    @traced('Shortcode.in_use_keys')
+    def in_use_keys(cls, keys):
+        """
+        This method determines which of the provided packed shortcodes
+        are in use, with a primary key IN query per IN_QUERY_SIZE keys.
+
+        :param keys: The provided packed shortcodes.
+        :type keys: list
+
+        :return: The packed shortcodes in use.
+        :rtype: set
+        """
+        keys = list(keys)
+        in_use = set()
+        for start in range(0, len(keys), cls.IN_QUERY_SIZE):
+            in_use.update(row.id for row in dbs.session.query(cls.id).filter(
+                cls.id.in_(keys[start:start + cls.IN_QUERY_SIZE])
+            ))
+        return in_use
 
     @classmethod
+    def release(cls, shortcodes):
+        """
+        This method hands freed shortcodes back to the allocator,
+        so they are reused by the next generated shortcodes.
+
+        :param shortcodes: The provided freed shortcodes.
+        :type shortcodes: list
+        """
+        cls.released.extend(shortcodes)
+
+    @classmethod
+    def allocate(cls):
+        """
+        This method takes a released shortcode, or generates a random
+        string if no shortcode is released, without checking if the
+        shortcode is in use.
+
+        :return: The unchecked new shortcode string.
+        :rtype: str
+        """
+        try:
+            return cls.released.popleft()
+        except IndexError:
+            return cls.generate_random()
+
+    @classmethod
+    @traced('Shortcode.generate_new')
     def generate_new(cls):
         """
         This method generates a new shortcode, by:
-            1. Generating a random string.
-            2. Checking if the random string is in use.
+            1. Allocating a released shortcode, or a random string.
+            2. Checking if the shortcode is in use.
             3. If not in use, returning the checked shortcode.
 
         :return: The checked new shortcode string.
         :rtype: str
         """
         while True:
-            random_shortcode = cls.generate_random()
+            random_shortcode = cls.allocate()
             shortcode_in_use = cls.check_in_use(shortcode=random_shortcode)
             if shortcode_in_use is False:
                 checked_shortcode = random_shortcode
@@ -146,7 +392,8 @@ class Shortcode(dbs.Model):
         return checked_shortcode
 
     @classmethod
-    def insert(cls, shortcode):
+    @traced('Shortcode.insert')
+    def insert(cls, shortcode, check_in_use=True):
         """
         This method instantiates a new Shortcode record in the database.
         A new Stat object is also attached to the Shortcode.
@@ -157,6 +404,15 @@ class Shortcode(dbs.Model):
         :param shortcode: The provided shortcode.
         :type shortcode: str
 
+        :param check_in_use: Whether the database is queried to check if
+            the shortcode is in use. Without the check, the unique
+            constraint decides on commit.
+        :type check_in_use: bool
+
+        :raises:
+            InvalidShortcode: When the provided shortcode has an invalid format.
+            ShortcodeAlreadyInUse: When the provided shortcode is already in use.
+
         :return: The instantiated Shortcode record
         :rtype: models.Shortcode
 
@@ -166,17 +422,15 @@ class Shortcode(dbs.Model):
             to the Url record, and then committing to the database.
         """
         if shortcode is not None:
-            shortcode_in_use = cls.check_in_use(shortcode=shortcode)
-            if shortcode_in_use is False:
-                shortcode_valid = cls.check_validity(shortcode=shortcode)
-                if shortcode_valid is True:
-                    accepted_shortcode = shortcode
-                else:
-                    raise InvalidShortcode
-            else:
+            if cls.check_validity(shortcode=shortcode) is False:
+                raise InvalidShortcode
+            if check_in_use is True and cls.check_in_use(shortcode=shortcode) is True:
                 raise ShortcodeAlreadyInUse
-        else:
+            accepted_shortcode = shortcode
+        elif check_in_use is True:
             accepted_shortcode = cls.generate_new()
+        else:
+            accepted_shortcode = cls.allocate()
         _stat = Stat()
         _shortcode = cls(
             shortcode=accepted_shortcode,
@@ -203,6 +457,7 @@ class Stat(dbs.Model):
     redirect = dbs.relationship('Redirect', back_populates='stat', uselist=False)
 
     @classmethod
+    @traced('Stat.get_stats')
     def get_stats(cls, shortcode):
         """
         This method retrieves the stats for the provided shortcode.
@@ -216,26 +471,17 @@ class Stat(dbs.Model):
         .. note::
             As the Redirect child for a stat is created in a non-greedy
             way, the logic handling for a not existing Redirect is handled
-            in this method.
+            by the link view.
+        .. seealso::
+            See for the link reads without the ORM: src/repository.py
 
         :raises:
             ShortcodeNotFound: When the provided shortcode does not exist.
         """
-        in_use = Shortcode.check_in_use(shortcode=shortcode)
-        if in_use is False:
+        link = links.find(shortcode=shortcode)
+        if link is None or link.is_expired():
             raise ShortcodeNotFound
-        _stat = cls.query.filter(cls.shortcode.has(shortcode=shortcode)).first()
-        if _stat.redirect is None:
-            last_redirect = None
-            redirect_count = 0
-        else:
-            last_redirect = _stat.redirect.lastRedirect.isoformat()
-            redirect_count = _stat.redirect.redirectCount
-        return {
-            cls.created.name: _stat.created.isoformat(),
-            Redirect.lastRedirect.name: last_redirect,
-            Redirect.redirectCount.name: redirect_count
-        }
+        return link.stats()
 
 
 class Redirect(dbs.Model):
@@ -246,16 +492,28 @@ class Redirect(dbs.Model):
     are set.
 
         The lastRedirect time is set server-side.
+
+    A Stat has at most one Redirect record, which is created by the first
+    redirect and incremented by the later ones in the same UPSERT, so
+    concurrent first redirects add up in a single record.
     """
     __tablename__ = 'redirect'
 
+    UPSERT = dbs.text(
+        'INSERT INTO redirect ("statId", "redirectCount", "lastRedirect") '
+        "VALUES (:stat_id, :amount, strftime('%Y-%m-%d %H:%M:%f', 'now')) "
+        'ON CONFLICT ("statId") DO UPDATE SET "redirectCount" = "redirectCount" + excluded."redirectCount", '
+        '"lastRedirect" = excluded."lastRedirect"'
+    )
+
     id = dbs.Column(dbs.Integer, primary_key=True)
-    statId = dbs.Column(dbs.Integer, dbs.ForeignKey('stat.id'))
+    statId = dbs.Column(dbs.Integer, dbs.ForeignKey('stat.id'), index=True, unique=True)
     stat = dbs.relationship('Stat', back_populates='redirect', foreign_keys=[statId])
     lastRedirect = dbs.Column(dbs.DateTime(timezone=True), server_default=func.now(), onupdate=func.strftime('%Y-%m-%d %H:%M:%f', 'now'))
     redirectCount = dbs.Column(dbs.Integer)
 
     @classmethod
+    @traced('Redirect.check_in_use')
     def check_in_use(cls, shortcode):
         """
         This method checks if a redirect record for the provided
@@ -270,17 +528,42 @@ class Redirect(dbs.Model):
         :raises:
             ShortcodeNotFound: When the provided shortcode does not exist.
         """
-        _stat = Stat.query.filter(Stat.shortcode.has(shortcode=shortcode)).first()
-        if _stat is None:
+        link = links.find(shortcode=shortcode)
+        if link is None or link.is_expired():
             raise ShortcodeNotFound
-        else:
-            _redirect = _stat.redirect
-            if _redirect is None:
-                return False
-            else:
-                return True
+        return link.count is not None
 
     @classmethod
+    @traced('Redirect.increment')
+    def increment(cls, shortcode, amount=1):
+        """
+        This method increments the redirectCount for the Redirect record
+        of the provided shortcode, creating the Redirect record if needed.
+        The count is incremented in the database, so concurrent redirects
+        are not lost.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :param amount: The provided amount of redirects.
+        :type amount: int
+
+        :return: The link, as read before the increment.
+        :rtype: repository.LinkView
+
+        :raises:
+            ShortcodeNotFound: When the provided shortcode does not exist
+                or has expired.
+        """
+        link = links.find(shortcode=shortcode)
+        if link is None or link.is_expired():
+            raise ShortcodeNotFound
+        links.record_redirect(link=link, amount=amount)
+        dbs.session.commit()
+        return link
+
+    @classmethod
+    @traced('Redirect.redirect')
     def redirect(cls, shortcode):
         """
         This method handles the redirect by incrementing the redirectCount
@@ -292,17 +575,284 @@ class Redirect(dbs.Model):
 
         :return: The related FQDN domain.
         :rtype: str
+
+        :raises:
+            ShortcodeNotFound: When the provided shortcode does not exist
+                or has expired.
         """
-        in_use = cls.check_in_use(shortcode=shortcode)
-        if in_use is True:
-            _redirect = Stat.query.filter(Stat.shortcode.has(shortcode=shortcode)).first().redirect
-            _redirect.redirectCount += 1
+        return cls.increment(shortcode=shortcode).url
+
+
+class GlobalStat(dbs.Model):
+    """
+    This model holds the single row with the service-wide totals, i.e.
+    the amount of links and the amount of clicks on them.
 
+    The totals are materialized: they are changed in the transactions
+    inserting and purging the links and counting the redirects, so the
+    totals are read without scanning the link tables. The reconcile
+    method rebuilds them from the link tables and reports the drift.
+    """
+    __tablename__ = 'global_stat'
+
+    UPSERT = dbs.text(
+        'INSERT INTO global_stat (id, links, clicks) VALUES (1, :links, :clicks) '
+        'ON CONFLICT (id) DO UPDATE SET links = links + excluded.links, clicks = clicks + excluded.clicks'
+    )
+
+    id = dbs.Column(dbs.Integer, primary_key=True, autoincrement=False)
+    links = dbs.Column(dbs.Integer, nullable=False, default=0)
+    clicks = dbs.Column(dbs.Integer, nullable=False, default=0)
+
+    @classmethod
+    @traced('GlobalStat.summary')
+    def summary(cls, days):
+        """
+        This method retrieves the service-wide totals, and the totals of
+        the provided amount of most recent days, with a primary key
+        lookup and a primary key range read.
+
+        :param days: The provided amount of days, including today.
+        :type days: int
+
+        :return: The amount of links and clicks, and the links created
+            and clicks per day, most recent day first.
+        :rtype: dict
+        """
+        totals = dbs.session.query(cls.links, cls.clicks).filter(cls.id == 1).first()
+        since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+        rows = dbs.session.query(DailyStat.day, DailyStat.linksCreated, DailyStat.clicks).filter(
+            DailyStat.day >= since
+        ).order_by(DailyStat.day.desc())
+        return {
+            'links': totals.links if totals is not None else 0,
+            'clicks': totals.clicks if totals is not None else 0,
+            'days': [{'day': row.day, 'linksCreated': row.linksCreated, 'clicks': row.clicks} for row in rows]
+        }
+
+    @classmethod
+    @traced('GlobalStat.reconcile')
+    def reconcile(cls, apply=True):
+        """
+        This method rebuilds the totals, and the links created per day,
+        from the link tables and reports where they drifted.
+
+        The clicks per day are not rebuilt, as the Redirect records only
+        hold the last redirect moment.
+
+        Every change of the links and clicks updates the totals row, so
+        the totals row is written first to take the write lock. The links
+        can then not change until the rebuilt totals are committed.
+
+        :param apply: Whether the rebuilt totals replace the drifted totals.
+        :type apply: bool
+
+        :return: The drifted totals, by metric and day, with the
+            materialized and the rebuilt value.
+        :rtype: list
+        """
+        links.record_summary(daily=False)
+        day = func.date(Stat.created)
+        actual = {
+            'links': dbs.session.query(func.count(Stat.id)).scalar(),
+            'clicks': dbs.session.query(func.coalesce(func.sum(Redirect.redirectCount), 0)).scalar()
+        }
+        created = dict(dbs.session.query(day, func.count(Stat.id)).group_by(day))
+        totals = cls.query.get(1)
+        daily = {row.day: row for row in DailyStat.query}
+        drift = []
+        for metric in ('links', 'clicks'):
+            summary = getattr(totals, metric) if totals is not None else 0
+            if summary != actual[metric]:
+                drift.append({'metric': metric, 'day': None, 'summary': summary, 'actual': actual[metric]})
+        for _day in sorted(set(created) | set(daily)):
+            summary = daily[_day].linksCreated if _day in daily else 0
+            if summary != created.get(_day, 0):
+                drift.append({'metric': 'linksCreated', 'day': _day, 'summary': summary, 'actual': created.get(_day, 0)})
+        if apply:
+            if totals is None:
+                totals = cls(id=1)
+                dbs.session.add(totals)
+            totals.links, totals.clicks = actual['links'], actual['clicks']
+            for entry in drift:
+                if entry['day'] is None:
+                    continue
+                if entry['day'] not in daily:
+                    daily[entry['day']] = DailyStat(day=entry['day'], clicks=0)
+                    dbs.session.add(daily[entry['day']])
+                daily[entry['day']].linksCreated = entry['actual']
+            dbs.session.commit()
         else:
-            _redirect = cls(
-                stat=Stat.query.filter(Stat.shortcode.has(shortcode=shortcode)).first(),
-                redirectCount=1
-            )
-            dbs.session.add(_redirect)
-        dbs.session.commit()
-        return _redirect.stat.shortcode.url.url
+            dbs.session.rollback()
+        return drift
+
+
+class DailyStat(dbs.Model):
+    """
+    This model holds the service-wide totals per UTC day, i.e. the
+    amount of links created on the day and the amount of clicks on the
+    day, materialized together with the GlobalStat totals.
+
+    The links created on a day are subtracted when the links are purged,
+    the clicks on a day are kept.
+    """
+    __tablename__ = 'daily_stat'
+
+    UPSERT = dbs.text(
+        "INSERT INTO daily_stat (day, linksCreated, clicks) VALUES (coalesce(:day, date('now')), :links, :clicks) "
+        'ON CONFLICT (day) DO UPDATE SET linksCreated = linksCreated + excluded.linksCreated, '
+        'clicks = clicks + excluded.clicks'
+    )
+
+    day = dbs.Column(dbs.String(10), primary_key=True)
+    linksCreated = dbs.Column(dbs.Integer, nullable=False, default=0)
+    clicks = dbs.Column(dbs.Integer, nullable=False, default=0)
+
+
+class ClickAggregate(dbs.Model):
+    """
+    This model holds the aggregated click counts per shortcode, per
+    dimension value, i.e. the amount of clicks referred by a host.
+
+    The counts are aggregated in memory by the workers and added in
+    batches, so no row is written per click. The amount of values per
+    shortcode and dimension is bounded, the least clicked values are
+    folded into the OTHER value.
+    """
+    __tablename__ = 'click_aggregate'
+
+    OTHER = '(other)'
+    UPSERT = dbs.text(
+        'INSERT INTO click_aggregate (shortcodeId, dimension, value, count) '
+        'VALUES (:shortcodeId, :dimension, :value, :count) '
+        'ON CONFLICT (shortcodeId, dimension, value) DO UPDATE SET count = count + excluded.count'
+    )
+
+    shortcodeId = dbs.Column(dbs.Integer, dbs.ForeignKey('shortcode.id'), primary_key=True, autoincrement=False)
+    dimension = dbs.Column(dbs.String(16), primary_key=True)
+    value = dbs.Column(dbs.String(128), primary_key=True)
+    count = dbs.Column(dbs.Integer, nullable=False)
+
+    @classmethod
+    @traced('ClickAggregate.add')
+    def add(cls, counts, top_n):
+        """
+        This method adds the provided click counts to the aggregates and
+        folds the values beyond the top_n most clicked values of every
+        changed shortcode and dimension into the OTHER value.
+
+        The counts of shortcodes that no longer exist are dropped.
+
+        :param counts: The provided counts, by (shortcode key, dimension, value).
+        :type counts: dict
+
+        :param top_n: The maximum amount of values per shortcode and dimension,
+            besides the OTHER value.
+        :type top_n: int
+
+        :return: The amount of added clicks.
+        :rtype: int
+
+        .. warning::
+            The aggregates are not committed to the database, as this
+            is done on a higher-level.
+        """
+        keys = {key for key, _, _ in counts}
+        existing = {row.id for row in dbs.session.query(Shortcode.id).filter(Shortcode.id.in_(keys))} if keys else set()
+        rows = [
+            {'shortcodeId': key, 'dimension': dimension, 'value': value, 'count': count}
+            for (key, dimension, value), count in counts.items() if key in existing
+        ]
+        if not rows:
+            return 0
+        dbs.session.execute(cls.UPSERT, rows)
+        changed = {(row['shortcodeId'], row['dimension']) for row in rows}
+        current = {}
+        for row in cls.query.filter(cls.shortcodeId.in_({key for key, _ in changed})):
+            if (row.shortcodeId, row.dimension) in changed and row.value != cls.OTHER:
+                current.setdefault((row.shortcodeId, row.dimension), []).append(row)
+        for (key, dimension), values in current.items():
+            if len(values) <= top_n:
+                continue
+            values.sort(key=lambda row: row.count, reverse=True)
+            folded = values[top_n:]
+            dbs.session.execute(cls.UPSERT, {
+                'shortcodeId': key,
+                'dimension': dimension,
+                'value': cls.OTHER,
+                'count': sum(row.count for row in folded)
+            })
+            for row in folded:
+                dbs.session.delete(row)
+        return sum(row['count'] for row in rows)
+
+    @classmethod
+    @traced('ClickAggregate.breakdown')
+    def breakdown(cls, shortcode, dimensions):
+        """
+        This method retrieves the click aggregates of the provided shortcode.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :param dimensions: The provided dimensions to retrieve.
+        :type dimensions: list
+
+        :return: The counts per value, per dimension, most clicked first.
+        :rtype: dict
+
+        :raises:
+            ShortcodeNotFound: When the provided shortcode has an invalid format.
+        """
+        breakdown = {dimension: {} for dimension in dimensions}
+        rows = cls.query.filter(
+            cls.shortcodeId == Shortcode.key(shortcode=shortcode),
+            cls.dimension.in_(dimensions)
+        ).order_by(cls.dimension, cls.count.desc(), cls.value)
+        for row in rows:
+            breakdown[row.dimension][row.value] = row.count
+        return breakdown
+
+
+class LinkChange(dbs.Model):
+    """
+    This model is the link change log, read by the invalidation bus of
+    every worker to drop the cached state of changed links.
+
+    A change is added in the transaction that changes the link, with the
+    moment of the change, so the propagation delay is measurable. The
+    change log is only written by the apps with the INVALIDATION_ENABLED
+    configuration parameter set.
+    """
+    __tablename__ = 'link_change'
+
+    CREATED = 'created'
+    DELETED = 'deleted'
+
+    id = dbs.Column(dbs.Integer, primary_key=True)
+    shortcodeId = dbs.Column(dbs.Integer, nullable=False)
+    kind = dbs.Column(dbs.String(16), nullable=False)
+    createdAt = dbs.Column(dbs.Float, nullable=False, index=True)
+
+    @classmethod
+    def record(cls, shortcode_ids, kind):
+        """
+        This method adds the changes of the provided shortcodes to the
+        change log, if enabled for the current app.
+
+        :param shortcode_ids: The provided packed shortcodes.
+        :type shortcode_ids: list
+
+        :param kind: The provided kind of change.
+        :type kind: str
+
+        .. warning::
+            The changes are not committed to the database, as this
+            is done on a higher-level, together with the link changes.
+        """
+        if not shortcode_ids or not current_app.config.get('INVALIDATION_ENABLED', False):
+            return
+        now = time.time()
+        dbs.session.execute(cls.__table__.insert(), [
+            {'shortcodeId': shortcode_id, 'kind': kind, 'createdAt': now} for shortcode_id in shortcode_ids
+        ])
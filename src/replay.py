@@ -0,0 +1,336 @@
+"""
+Traffic replay tool, replaying a recorded request log against a local app.
+
+The request log is recorded with REQUEST_LOG_ENABLED. The requests are
+replayed at the recorded pace divided by --speed, or as fast as possible
+with --speed 0, by a thread or process pool. The latency distribution is
+reported per endpoint, together with the responses that do not match
+the recorded responses.
+
+The shortcodes generated while recording differ from the shortcodes
+generated on replay, so the paths of the later requests for a generated
+shortcode are rewritten to the replayed shortcode, once the replayed
+shorten request has responded.
+
+Run from the src directory:
+
+    python replay.py request_log.jsonl --speed 2 --workers 8
+    python replay.py request_log.jsonl --speed 0 --target http://localhost:5000
+"""
+import argparse
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+import gzip
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+VOLATILE_FIELDS = ('created', 'lastRedirect')
+
+
+def load(path):
+    """
+    This method loads the recorded requests, in timestamp order.
+
+    :param path: The provided request log path.
+    :type path: str
+
+    :return: The recorded requests.
+    :rtype: list
+    """
+    with open(path) as log_file:
+        entries = [json.loads(line) for line in log_file if line.strip()]
+    return sorted(entries, key=lambda entry: entry['timestamp'])
+
+
+def decode(body, encoding):
+    """
+    This method decompresses the provided response body.
+
+    :param body: The provided response body.
+    :type body: bytes
+
+    :param encoding: The provided Content-Encoding header.
+    :type encoding: str
+
+    :return: The decompressed response body.
+    :rtype: bytes
+    """
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'br':
+        import brotli
+        return brotli.decompress(body)
+    return body
+
+
+class AppTarget:
+    """This object sends the requests to an in-process app, with a test client per thread."""
+    def __init__(self, database_uri):
+        from app import create_app, APP_CONFIG
+        self.app = create_app(config=dict(
+            APP_CONFIG,
+            SQLALCHEMY_DATABASE_URI=database_uri,
+            REQUEST_LOG_ENABLED=False,
+            ADMISSION_ENABLED=False,
+            SCHEMA_AUTO_MIGRATE=True
+        ))
+        self._local = threading.local()
+
+    def send(self, entry):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(
+            path=entry['path'],
+            method=entry['method'],
+            data=entry['body'],
+            headers=entry['headers']
+        )
+        body = decode(body=response.get_data(), encoding=response.headers.get('Content-Encoding'))
+        return response.status_code, response.headers.get('Location'), body
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTarget:
+    """This object sends the requests to a running app over HTTP, without following redirects."""
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(_NoRedirect)
+
+    def send(self, entry):
+        http_request = urllib.request.Request(
+            url=self.base_url + entry['path'],
+            data=entry['body'].encode('utf-8') if entry['body'] is not None else None,
+            headers=entry['headers'],
+            method=entry['method']
+        )
+        try:
+            with self.opener.open(http_request) as response:
+                body = decode(body=response.read(), encoding=response.headers.get('Content-Encoding'))
+                return response.status, response.headers.get('Location'), body
+        except urllib.error.HTTPError as error:
+            body = decode(body=error.read(), encoding=error.headers.get('Content-Encoding'))
+            return error.code, error.headers.get('Location'), body
+
+
+def generated_shortcode(entry):
+    """
+    This method fetches the recorded shortcode generated by a shorten
+    request without a provided shortcode.
+
+    :param entry: The provided recorded request.
+    :type entry: dict
+
+    :return: The generated shortcode, or None for other requests.
+    :rtype: str
+    """
+    if entry['endpoint'] != 'shorten_url.shorten_url' or 'shortcode' in json.loads(entry['body'] or '{}'):
+        return None
+    try:
+        return json.loads(entry.get('response') or '{}').get('shortcode')
+    except (ValueError, AttributeError):
+        return None
+
+
+def rewrite(entry, shortcodes):
+    """
+    This method rewrites the recorded shortcode in the path of the
+    provided request to the replayed shortcode, waiting for the replayed
+    shorten request if it is still in flight.
+
+    :param entry: The provided recorded request.
+    :type entry: dict
+
+    :param shortcodes: The replayed shortcode, or the future of the
+        replayed shorten request, per recorded generated shortcode.
+    :type shortcodes: dict
+
+    :return: The request to replay.
+    :rtype: dict
+    """
+    path, separator, query = entry['path'].partition('?')
+    segments = path.split('/')
+    if len(segments) < 2 or segments[1] not in shortcodes:
+        return entry
+    replayed = shortcodes[segments[1]]
+    if isinstance(replayed, Future):
+        replayed = shortcodes[segments[1]] = replayed.result()[3]
+    if replayed is None:
+        return entry
+    segments[1] = replayed
+    return dict(entry, path='/'.join(segments) + separator + query)
+
+
+def compare(entry, status_code, location, body):
+    """
+    This method compares a replayed response with the recorded response.
+    The volatile timestamps, and the generated shortcodes of requests
+    without a provided shortcode, are not compared.
+
+    :return: The mismatch description, or None if the responses match.
+    :rtype: str
+    """
+    if status_code != entry['status']:
+        return 'status {RECORDED} != {REPLAYED}'.format(RECORDED=entry['status'], REPLAYED=status_code)
+    if entry.get('location') is not None and location != entry['location']:
+        return 'location {RECORDED} != {REPLAYED}'.format(RECORDED=entry['location'], REPLAYED=location)
+    if entry.get('response') is None or not body:
+        return None
+    recorded, replayed = json.loads(entry['response']), json.loads(body)
+    if not isinstance(recorded, dict) or not isinstance(replayed, dict):
+        return None if recorded == replayed else 'body'
+    volatile = set(VOLATILE_FIELDS)
+    if generated_shortcode(entry) is not None:
+        volatile.add('shortcode')
+    for field in set(recorded) | set(replayed):
+        if field in volatile:
+            if (field in recorded) != (field in replayed):
+                return 'field {FIELD}'.format(FIELD=field)
+        elif recorded.get(field) != replayed.get(field):
+            return 'field {FIELD}: {RECORDED!r} != {REPLAYED!r}'.format(
+                FIELD=field, RECORDED=recorded.get(field), REPLAYED=replayed.get(field)
+            )
+    return None
+
+
+_target = None
+
+
+def _initialize(target_spec):
+    global _target
+    kind, value = target_spec
+    _target = HttpTarget(base_url=value) if kind == 'http' else AppTarget(database_uri=value)
+
+
+def _replay_one(entry):
+    started = time.perf_counter()
+    status_code, location, body = _target.send(entry)
+    latency = time.perf_counter() - started
+    shortcode = None
+    if generated_shortcode(entry) is not None and status_code == 201:
+        shortcode = json.loads(body).get('shortcode')
+    return entry['endpoint'], latency, compare(entry, status_code, location, body), shortcode
+
+
+def replay(entries, target_spec, speed=1.0, workers=4, executor='thread'):
+    """
+    This method replays the provided requests. The requests for a
+    generated shortcode are sent once the shorten request generating it
+    has responded.
+
+    :param entries: The provided recorded requests, in timestamp order.
+    :type entries: list
+
+    :param target_spec: The provided target, ('http', base url) or
+        ('app', database uri).
+    :type target_spec: tuple
+
+    :param speed: The provided replay speed factor, 0 for as fast as possible.
+    :type speed: float
+
+    :param workers: The provided amount of pool workers.
+    :type workers: int
+
+    :param executor: The provided pool kind, thread or process.
+    :type executor: str
+
+    :return: The (endpoint, latency, mismatch) results.
+    :rtype: list
+    """
+    _initialize(target_spec)
+    if executor == 'process':
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_initialize, initargs=(target_spec,))
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    with pool:
+        futures = []
+        shortcodes = {}
+        started = time.perf_counter()
+        first_timestamp = entries[0]['timestamp'] if entries else 0
+        for entry in entries:
+            if speed > 0:
+                delay = (entry['timestamp'] - first_timestamp) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            future = pool.submit(_replay_one, rewrite(entry=entry, shortcodes=shortcodes))
+            shortcode = generated_shortcode(entry)
+            if shortcode is not None:
+                shortcodes[shortcode] = future
+            futures.append(future)
+        return [future.result()[:3] for future in futures]
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(results):
+    """
+    This method summarizes the replay results per endpoint.
+
+    :param results: The provided (endpoint, latency, mismatch) results.
+    :type results: list
+
+    :return: The summaries per endpoint, with latencies in milliseconds.
+    :rtype: dict
+    """
+    per_endpoint = {}
+    for endpoint, latency, mismatch in results:
+        summary = per_endpoint.setdefault(endpoint or '<unmatched>', {'latencies': [], 'mismatches': []})
+        summary['latencies'].append(latency * 1000)
+        if mismatch is not None:
+            summary['mismatches'].append(mismatch)
+    for summary in per_endpoint.values():
+        latencies = sorted(summary.pop('latencies'))
+        summary.update({
+            'count': len(latencies),
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1]
+        })
+    return per_endpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('log', help='The recorded request log.')
+    parser.add_argument('--speed', type=float, default=1.0, help='The replay speed factor, 0 for as fast as possible.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--executor', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--target', default=None, help='The base url of a running app, defaults to an in-process app.')
+    parser.add_argument('--database', default='sqlite:///replay.db', help='The database of the in-process app.')
+    arguments = parser.parse_args()
+
+    target_spec = ('http', arguments.target) if arguments.target else ('app', arguments.database)
+    entries = load(path=arguments.log)
+    started = time.perf_counter()
+    results = replay(
+        entries=entries,
+        target_spec=target_spec,
+        speed=arguments.speed,
+        workers=arguments.workers,
+        executor=arguments.executor
+    )
+    elapsed = time.perf_counter() - started
+    print('Replayed {COUNT} requests in {ELAPSED:.2f}s ({RATE:.0f} req/s)'.format(
+        COUNT=len(results), ELAPSED=elapsed, RATE=len(results) / elapsed if elapsed else 0
+    ))
+    for endpoint, summary in sorted(report(results=results).items()):
+        print('{ENDPOINT:>24}: n={COUNT} p50={P50:.2f}ms p90={P90:.2f}ms p99={P99:.2f}ms max={MAX:.2f}ms '
+              'mismatches={MISMATCHES}'.format(
+                  ENDPOINT=endpoint, COUNT=summary['count'], P50=summary['p50'], P90=summary['p90'],
+                  P99=summary['p99'], MAX=summary['max'], MISMATCHES=len(summary['mismatches'])
+              ))
+        for mismatch in summary['mismatches'][:5]:
+            print('{PAD:>26}{MISMATCH}'.format(PAD='', MISMATCH=mismatch))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+from datetime import datetime
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import bindparam, select
+
+from db import db as dbs
+import shortcode_codec
+
+
+class LinkView:
+    """
+    The read-only view of a shortcode link, with the columns the redirect
+    and stats paths need, instead of the hydrated Url, Shortcode, Stat
+    and Redirect entities.
+    """
+    __slots__ = ('shortcode', 'url', 'expires_at', 'stat_id', 'created', 'count', 'last_redirect')
+
+    def __init__(self, shortcode, url, expires_at, stat_id, created, count, last_redirect):
+        self.shortcode = shortcode
+        self.url = url
+        self.expires_at = expires_at
+        self.stat_id = stat_id
+        self.created = created
+        self.count = count
+        self.last_redirect = last_redirect
+
+    def __repr__(self):
+        return 'LinkView(shortcode={SHORTCODE!r}, url={URL!r}, count={COUNT!r})'.format(
+            SHORTCODE=self.shortcode, URL=self.url, COUNT=self.count
+        )
+
+    def is_expired(self, now=None):
+        """
+        This method checks if the link has passed its expiry moment,
+        like models.Url.is_expired.
+
+        :param now: The provided reference moment, defaults to the
+            current UTC time.
+        :type now: datetime.datetime
+
+        :return: The expiry status.
+        :rtype: bool
+        """
+        if self.expires_at is None:
+            return False
+        return self.expires_at <= (now or datetime.utcnow())
+
+    def stats(self):
+        """
+        This method formats the stats of the link.
+
+        :return: The created moment, last redirect moment and redirect count.
+        :rtype: dict
+        """
+        return {
+            'created': self.created.isoformat(),
+            'lastRedirect': self.last_redirect.isoformat() if self.last_redirect is not None else None,
+            'redirectCount': self.count or 0
+        }
+
+
+class LinkRepository:
+    """
+    This object reads and updates the shortcode links with SQLAlchemy
+    Core statements, bypassing the ORM identity map and relationship
+    loading on the redirect and stats paths.
+
+    The statements are compiled once per database dialect and executed
+    on the connection of the current session, so they take part in the
+    session transaction. The counted redirects are added to the global
+    stats in the same transaction.
+    """
+    def __init__(self):
+        """This method initializes the repository without compiled statements."""
+        self._compiled = WeakKeyDictionary()
+
+    @staticmethod
+    def _statements():
+        from models import Url, Shortcode, Stat, Redirect, GlobalStat, DailyStat
+        url, shortcode, stat, redirect = Url.__table__, Shortcode.__table__, Stat.__table__, Redirect.__table__
+        return {
+            'find': select([
+                url.c.url,
+                url.c.expiresAt,
+                stat.c.id,
+                stat.c.created,
+                redirect.c.redirectCount,
+                redirect.c.lastRedirect
+            ]).select_from(
+                shortcode.join(url, url.c.id == shortcode.c.urlId)
+                .join(stat, stat.c.shortcodeId == shortcode.c.id)
+                .outerjoin(redirect, redirect.c.statId == stat.c.id)
+            ).where(shortcode.c.id == bindparam('key')),
+            'exists': select([shortcode.c.id]).where(shortcode.c.id == bindparam('key')),
+            'count_redirect': Redirect.UPSERT,
+            'count_global': GlobalStat.UPSERT,
+            'count_daily': DailyStat.UPSERT
+        }
+
+    def _execute(self, name, **params):
+        connection = dbs.session.connection()
+        dialect = connection.dialect
+        compiled = self._compiled.get(dialect)
+        if compiled is None:
+            compiled = self._compiled[dialect] = {
+                _name: statement.compile(dialect=dialect) for _name, statement in self._statements().items()
+            }
+        return connection.execute(compiled[name], params)
+
+    def find(self, shortcode):
+        """
+        This method fetches the link of the provided shortcode, with one
+        primary key lookup.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :return: The link, or None if the shortcode does not exist or
+            has an invalid format.
+        :rtype: repository.LinkView
+        """
+        key = shortcode_codec.key(shortcode)
+        if key is None:
+            return None
+        row = self._execute('find', key=key).first()
+        if row is None:
+            return None
+        return LinkView(shortcode, *row)
+
+    def exists(self, shortcode):
+        """
+        This method checks if the provided shortcode is in use.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :return: The in-use status.
+        :rtype: bool
+        """
+        key = shortcode_codec.key(shortcode)
+        if key is None:
+            return False
+        return self._execute('exists', key=key).first() is not None
+
+    def record_redirect(self, link, amount=1):
+        """
+        This method increments the redirect count of the provided link
+        in the database, creating the Redirect record if needed, in one
+        UPSERT statement.
+
+        :param link: The provided link.
+        :type link: repository.LinkView
+
+        :param amount: The provided amount of redirects.
+        :type amount: int
+
+        .. warning::
+            The increment is not committed to the database, as this
+            is done on a higher-level.
+        """
+        self._execute('count_redirect', stat_id=link.stat_id, amount=amount)
+        self.record_summary(clicks=amount)
+
+    def record_summary(self, links=0, clicks=0, day=None, daily=True):
+        """
+        This method adds the provided amounts to the service-wide totals
+        and, if daily, to the totals of the provided day.
+
+        :param links: The provided change of the amount of links.
+        :type links: int
+
+        :param clicks: The provided change of the amount of clicks.
+        :type clicks: int
+
+        :param day: The provided day as YYYY-MM-DD, defaults to the
+            current UTC day of the database.
+        :type day: str
+
+        :param daily: Whether the totals of the day are changed as well.
+        :type daily: bool
+
+        .. warning::
+            The change is not committed to the database, as this is done
+            on a higher-level, together with the link changes.
+        """
+        self._execute('count_global', links=links, clicks=clicks)
+        if daily:
+            self._execute('count_daily', day=day, links=links, clicks=clicks)
+
+
+links = LinkRepository()
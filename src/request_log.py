@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+import time
+
+from flask import request, g
+
+
+class RequestLog:
+    """
+    This object records every request and its response as a JSON line,
+    for the traffic replay tool.
+
+    Every line holds the request timestamp, method, path, endpoint,
+    replay relevant headers and body, and the response status, Location
+    header and body. Streamed and compressed response bodies are not
+    recorded.
+    """
+    HEADERS = (
+        'Content-Type',
+        'Accept-Encoding',
+        'If-None-Match',
+        'Idempotency-Key'
+    )
+
+    def __init__(self):
+        """This method initializes the disabled request log."""
+        self.path = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        This method configures the request log from the provided app
+        configuration and registers the request hooks.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+        """
+        self.path = os.path.join(app.root_path, app.config.get('REQUEST_LOG_PATH', 'request_log.jsonl'))
+        app.before_request(self.start)
+        app.after_request(self.record)
+
+    @staticmethod
+    def start():
+        """This method stamps the arrival of the current request."""
+        g.request_log_timestamp = time.time()
+
+    def record(self, response):
+        """
+        This method appends the current request and the provided response
+        to the request log.
+
+        :param response: The provided response.
+        :type response: flask.Response
+
+        :return: The unaltered response.
+        :rtype: flask.Response
+        """
+        entry = {
+            'timestamp': g.get('request_log_timestamp', time.time()),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'headers': {header: request.headers[header] for header in self.HEADERS if header in request.headers},
+            'body': request.get_data(as_text=True) or None,
+            'status': response.status_code,
+            'location': response.headers.get('Location'),
+            'response': None
+        }
+        if not response.is_streamed and not response.direct_passthrough and response.mimetype == 'application/json' \
+                and 'Content-Encoding' not in response.headers:
+            entry['response'] = response.get_data(as_text=True)
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as log_file:
+                log_file.write(line)
+        return response
+
+
+request_log = RequestLog()
@@ -0,0 +1,211 @@
+import hashlib
+from flask import Response, current_app, request
+
+CONTENT_ENCODINGS = ('br', 'gzip')
+
+
+class RedirectResponse(Response):
+    """
+    The minimal response object for the shortcode redirects.
+
+    A redirect does not carry a body, so no JSON serialization
+    and no Content-Type header are involved.
+    """
+    default_mimetype = None
+
+
+class RedirectResponder:
+    """
+    This object builds the redirect responses, with the status code
+    and the Cache-Control headers pre-built from the app configuration.
+    """
+    STATUS_CODES = (301, 302)
+
+    def __init__(self, status_code=302, cache_control=None):
+        """
+        This method initializes the responder with the provided parameters.
+
+        :param status_code: The provided redirect status code, either
+            301 or 302.
+        :type status_code: int
+
+        :param cache_control: The provided optional Cache-Control header value.
+        :type cache_control: str
+
+        :raises:
+            ValueError: When the provided status code is not a supported
+                redirect status code.
+        """
+        if status_code not in self.STATUS_CODES:
+            raise ValueError('Unsupported redirect status code: {STATUS_CODE}'.format(STATUS_CODE=status_code))
+        self.status_code = status_code
+        self.headers = []
+        if cache_control is not None:
+            self.headers.append(('Cache-Control', cache_control))
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        This method instantiates the responder from the provided
+        app configuration.
+
+        :param config: The provided app configuration.
+        :type config: flask.Config
+
+        :return: The configured responder.
+        :rtype: responses.RedirectResponder
+        """
+        return cls(
+            status_code=config.get('REDIRECT_STATUS_CODE', 302),
+            cache_control=config.get('REDIRECT_CACHE_CONTROL')
+        )
+
+    def __call__(self, location):
+        """
+        This method builds the redirect response for the provided location.
+
+        :param location: The provided redirect location.
+        :type location: str
+
+        :return: The redirect response.
+        :rtype: responses.RedirectResponse
+        """
+        return RedirectResponse(status=self.status_code, headers=[('Location', location)] + self.headers)
+
+
+def stats_etag(stats):
+    """
+    This method derives the strong ETag for the provided shortcode stats,
+    from the redirect count and the last redirect moment. The created
+    moment is included, so a recycled shortcode never reuses an ETag.
+
+    :param stats: The provided shortcode stats.
+    :type stats: dict
+
+    :return: The unquoted ETag.
+    :rtype: str
+    """
+    version = '{CREATED}|{COUNT}|{LAST}'.format(
+        CREATED=stats['created'],
+        COUNT=stats['redirectCount'],
+        LAST=stats['lastRedirect']
+    )
+    return hashlib.sha1(version.encode('utf-8')).hexdigest()
+
+
+def compressed_etag(etag, encoding):
+    """
+    This method derives the ETag of the compressed representation, as
+    the compressed bytes differ from the uncompressed bytes.
+
+    :param etag: The provided unquoted ETag.
+    :type etag: str
+
+    :param encoding: The provided content encoding.
+    :type encoding: str
+
+    :return: The unquoted ETag of the compressed representation.
+    :rtype: str
+    """
+    return '{ETAG}-{ENCODING}'.format(ETAG=etag, ENCODING=encoding)
+
+
+def matching_etag(etag):
+    """
+    This method matches the If-None-Match header of the current request
+    with the provided ETag, and the ETags of its compressed representations.
+
+    :param etag: The provided unquoted ETag.
+    :type etag: str
+
+    :return: The matching unquoted ETag, or None if no ETag matches.
+    :rtype: str
+    """
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return None
+    for candidate in (etag, ) + tuple(compressed_etag(etag, encoding) for encoding in CONTENT_ENCODINGS):
+        if if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def cacheable(response, etag, max_age=None):
+    """
+    This method adds the ETag and Cache-Control headers to the
+    provided response.
+
+    :param response: The provided response.
+    :type response: flask.Response
+
+    :param etag: The provided unquoted ETag.
+    :type etag: str
+
+    :param max_age: The provided optional Cache-Control max-age in seconds.
+    :type max_age: int
+
+    :return: The altered response.
+    :rtype: flask.Response
+    """
+    response.set_etag(etag)
+    if max_age is not None:
+        response.cache_control.max_age = max_age
+    return response
+
+
+def not_modified(etag, max_age=None):
+    """
+    This method builds the body-less 304 response for a matching
+    conditional request.
+
+    :param etag: The provided unquoted ETag.
+    :type etag: str
+
+    :param max_age: The provided optional Cache-Control max-age in seconds.
+    :type max_age: int
+
+    :return: The 304 response.
+    :rtype: flask.Response
+    """
+    return cacheable(response=Response(status=304), etag=etag, max_age=max_age)
+
+
+def stream_json(data, status_code=200, chunk_size=16384):
+    """
+    This method builds a streamed JSON response, serialized like
+    flask.jsonify but encoded chunk by chunk, so a large body is never
+    built fully in memory.
+
+    :param data: The provided JSON serializable data.
+    :type data: dict|list
+
+    :param status_code: The provided status code.
+    :type status_code: int
+
+    :param chunk_size: The provided minimum chunk size in characters.
+    :type chunk_size: int
+
+    :return: The streamed response.
+    :rtype: flask.Response
+    """
+    encoder = current_app.json_encoder(
+        separators=(',', ':'),
+        sort_keys=current_app.config.get('JSON_SORT_KEYS', True)
+    )
+
+    def generate():
+        chunks, size = [], 0
+        for chunk in encoder.iterencode(data):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= chunk_size:
+                yield ''.join(chunks).encode('utf-8')
+                chunks, size = [], 0
+        chunks.append('\n')
+        yield ''.join(chunks).encode('utf-8')
+
+    return Response(
+        generate(),
+        status=status_code,
+        mimetype=current_app.config.get('JSONIFY_MIMETYPE', 'application/json')
+    )
@@ -0,0 +1,197 @@
+import logging
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from db import db as dbs
+
+LOGGER = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 5
+
+# The columns of the layout before the shortcodes were packed into the
+# primary key, which create_all can not migrate.
+LEGACY_COLUMNS = (('shortcode', 'shortcode', True), ('url', 'expiresAt', False))
+
+
+class LegacySchemaError(RuntimeError):
+    """This Exception should be used when the database has a layout the migration can not upgrade"""
+
+
+class SchemaVersion(dbs.Model):
+    """
+    This model holds the single row with the version of the database
+    schema, so a worker boot checks one row instead of running the DDL.
+
+    The SCHEMA_VERSION is raised on every change of the database models.
+    """
+    __tablename__ = 'schema_version'
+
+    id = dbs.Column(dbs.Integer, primary_key=True)
+    version = dbs.Column(dbs.Integer, nullable=False)
+
+
+def current_version():
+    """
+    This method fetches the schema version of the database.
+
+    :return: The schema version, or None if the database is not migrated.
+    :rtype: int
+
+    .. warning::
+        This method has to be called within an application context.
+    """
+    try:
+        return dbs.session.query(SchemaVersion.version).filter(SchemaVersion.id == 1).scalar()
+    except (OperationalError, ProgrammingError):
+        dbs.session.rollback()
+        return None
+
+
+def legacy_columns(connection):
+    """
+    This method lists the legacy layout columns present, or missing, in
+    the database tables.
+
+    :param connection: The provided database connection.
+    :type connection: sqlalchemy.engine.Connection
+
+    :return: The legacy table.column names.
+    :rtype: list
+    """
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    legacy = []
+    for table, column, present in LEGACY_COLUMNS:
+        if table not in tables:
+            continue
+        columns = {column_info['name'] for column_info in inspector.get_columns(table)}
+        if (column in columns) == present:
+            legacy.append('{TABLE}.{COLUMN}'.format(TABLE=table, COLUMN=column))
+    return legacy
+
+
+def merge_duplicate_redirects(connection):
+    """
+    This method merges the Redirect records of a Stat into its first
+    record, before the unique index on the statId is created.
+
+    Every increment was applied to all records of the Stat, so the
+    largest count is kept.
+
+    :param connection: The provided database connection.
+    :type connection: sqlalchemy.engine.Connection
+
+    :return: The amount of deleted records.
+    :rtype: int
+    """
+    connection.execute(
+        'UPDATE redirect SET '
+        '"redirectCount" = (SELECT max(duplicate."redirectCount") FROM redirect AS duplicate '
+        'WHERE duplicate."statId" = redirect."statId"), '
+        '"lastRedirect" = (SELECT max(duplicate."lastRedirect") FROM redirect AS duplicate '
+        'WHERE duplicate."statId" = redirect."statId") '
+        'WHERE id IN (SELECT min(id) FROM redirect GROUP BY "statId" HAVING count(*) > 1)'
+    )
+    return connection.execute(
+        'DELETE FROM redirect WHERE id NOT IN (SELECT min(id) FROM redirect GROUP BY "statId")'
+    ).rowcount
+
+
+def create_missing_indexes(connection):
+    """
+    This method creates the indexes added to the existing tables, which
+    create_all skips.
+
+    :param connection: The provided database connection.
+    :type connection: sqlalchemy.engine.Connection
+
+    :return: The names of the created indexes.
+    :rtype: list
+    """
+    import models
+    inspector = inspect(connection)
+    created = []
+    for table in dbs.Model.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if table is models.Redirect.__table__ and index.unique:
+                merge_duplicate_redirects(connection=connection)
+            index.create(bind=connection)
+            created.append(index.name)
+    return created
+
+
+def migrate():
+    """
+    This method creates the missing database tables and indexes, and
+    stamps the database with the current schema version.
+
+    A new SQLite database is created with auto_vacuum set to incremental,
+    so the database maintenance can return the free pages step by step.
+    The global stats are built from the link tables if missing.
+
+    A database with the legacy shortcode layout is refused, as the
+    missing tables would be created next to the unmigrated ones.
+
+    :return: The schema version.
+    :rtype: int
+
+    :raises:
+        LegacySchemaError: When the database has the legacy layout.
+
+    .. warning::
+        This method has to be called within an application context.
+    """
+    import models  # registers the models on the metadata
+    engine = dbs.get_engine()
+    with engine.connect() as connection:
+        if engine.dialect.name == 'sqlite' and not engine.dialect.get_table_names(connection):
+            connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        legacy = legacy_columns(connection=connection)
+        if legacy:
+            raise LegacySchemaError(
+                'Database has the legacy layout ({COLUMNS}), recreate the database'.format(COLUMNS=', '.join(legacy))
+            )
+        dbs.Model.metadata.create_all(bind=connection)
+        create_missing_indexes(connection=connection)
+    if dbs.session.query(models.GlobalStat).get(1) is None:
+        models.GlobalStat.reconcile()
+    schema_version = dbs.session.query(SchemaVersion).get(1)
+    if schema_version is None:
+        dbs.session.add(SchemaVersion(id=1, version=SCHEMA_VERSION))
+    else:
+        schema_version.version = SCHEMA_VERSION
+    dbs.session.commit()
+    return SCHEMA_VERSION
+
+
+def check(app):
+    """
+    This method checks the schema version of the database on startup.
+
+    By default the check only reads the schema version, and an outdated
+    database is logged and has to be migrated with the migrate command,
+    so the workers booting together do not race the DDL. It is migrated
+    on startup if the SCHEMA_AUTO_MIGRATE configuration parameter is
+    set, for the tests and local development.
+
+    :param app: The provided application object.
+    :type app: flask.Flask
+
+    :return: The schema version of the database.
+    :rtype: int
+    """
+    with app.app_context():
+        version = current_version()
+        if version == SCHEMA_VERSION:
+            return version
+        if app.config.get('SCHEMA_AUTO_MIGRATE', False):
+            return migrate()
+        LOGGER.error('Database schema version {VERSION} is not {EXPECTED}, run: flask migrate'.format(
+            VERSION=version,
+            EXPECTED=SCHEMA_VERSION
+        ))
+        return version
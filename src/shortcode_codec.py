@@ -0,0 +1,125 @@
+"""
+The shortcode codec packs the fixed format shortcodes into integers.
+
+A shortcode consists of exactly LENGTH characters of the ALPHABET,
+so every shortcode is a LENGTH digit number in base len(ALPHABET),
+which fits in an unsigned 32-bit integer. The ALPHABET is sorted, so
+the integer order equals the string order of the shortcodes.
+"""
+import random
+import string
+
+ALPHABET = ''.join(sorted(string.ascii_lowercase + string.digits + '_'))
+LENGTH = 6
+BASE = len(ALPHABET)
+MAX_VALUE = BASE ** LENGTH - 1
+
+_CHARACTERS = frozenset(ALPHABET)
+_VALUES = {character: value for value, character in enumerate(ALPHABET)}
+
+
+def is_valid(shortcode):
+    """
+    This method checks if the provided shortcode matches the
+    shortcode format, without a regex match.
+
+    :param shortcode: The provided shortcode.
+    :type shortcode: str
+
+    :return: The validity result.
+    :rtype: bool
+    """
+    return isinstance(shortcode, str) and len(shortcode) == LENGTH and _CHARACTERS.issuperset(shortcode)
+
+
+def encode(shortcode):
+    """
+    This method packs the provided shortcode into an integer.
+
+    :param shortcode: The provided shortcode.
+    :type shortcode: str
+
+    :raises:
+        ValueError: When the provided shortcode has an invalid format.
+
+    :return: The packed shortcode.
+    :rtype: int
+    """
+    if not is_valid(shortcode):
+        raise ValueError('Invalid shortcode: {SHORTCODE!r}'.format(SHORTCODE=shortcode))
+    value = 0
+    for character in shortcode:
+        value = value * BASE + _VALUES[character]
+    return value
+
+
+def decode(value):
+    """
+    This method unpacks the provided integer into a shortcode.
+
+    :param value: The provided packed shortcode.
+    :type value: int
+
+    :raises:
+        ValueError: When the provided integer is out of the shortcode range.
+
+    :return: The unpacked shortcode.
+    :rtype: str
+    """
+    if not 0 <= value <= MAX_VALUE:
+        raise ValueError('Packed shortcode out of range: {VALUE}'.format(VALUE=value))
+    characters = []
+    for _ in range(LENGTH):
+        value, remainder = divmod(value, BASE)
+        characters.append(ALPHABET[remainder])
+    return ''.join(reversed(characters))
+
+
+def key(shortcode):
+    """
+    This method packs the provided shortcode into an integer, if the
+    shortcode has a valid format.
+
+    :param shortcode: The provided shortcode.
+    :type shortcode: str
+
+    :return: The packed shortcode, or None if the shortcode is invalid.
+    :rtype: int
+    """
+    if not is_valid(shortcode):
+        return None
+    return encode(shortcode)
+
+
+def neighbours(value, distance):
+    """
+    This method lists the packed shortcodes nearest to the provided
+    packed shortcode, nearest first. As the integer order equals the
+    string order, the nearest shortcodes differ in the last characters.
+
+    :param value: The provided packed shortcode.
+    :type value: int
+
+    :param distance: The provided maximum distance.
+    :type distance: int
+
+    :return: The packed shortcodes within the distance, in range.
+    :rtype: list
+    """
+    _neighbours = []
+    for offset in range(1, distance + 1):
+        for neighbour in (value + offset, value - offset):
+            if 0 <= neighbour <= MAX_VALUE:
+                _neighbours.append(neighbour)
+    return _neighbours
+
+
+def random_shortcode():
+    """
+    This method generates a random shortcode, without checking if
+    the shortcode is in use.
+
+    :return: The random shortcode.
+    :rtype: str
+    """
+    return ''.join(random.choice(ALPHABET) for _ in range(LENGTH))
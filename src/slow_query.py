@@ -0,0 +1,219 @@
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+from tracing import tracer
+
+LOGGER = logging.getLogger(__name__)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """
+    This method derives the fingerprint of the provided statement, which
+    is equal for all statements of the same shape.
+
+    :param statement: The provided SQL statement.
+    :type statement: str
+
+    :return: The normalized statement and its fingerprint.
+    :rtype: tuple
+    """
+    normalized = _WHITESPACE.sub(' ', statement).strip()
+    normalized = _LITERALS.sub('?', normalized)
+    normalized = _IN_LISTS.sub('IN (...)', normalized)
+    return normalized, hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+def redact(parameters):
+    """
+    This method replaces the provided bound parameters by their type,
+    so no user data ends up in the slow query log.
+
+    :param parameters: The provided bound parameters.
+    :type parameters: tuple|list|dict
+
+    :return: The redacted parameters.
+    :rtype: list|dict
+    """
+    def _redact(value):
+        if value is None:
+            return None
+        if isinstance(value, (str, bytes)):
+            return '<{TYPE}:{LENGTH}>'.format(TYPE=type(value).__name__, LENGTH=len(value))
+        return '<{TYPE}>'.format(TYPE=type(value).__name__)
+
+    if isinstance(parameters, dict):
+        return {key: _redact(value) for key, value in parameters.items()}
+    return [_redact(value) for value in parameters or ()]
+
+
+def model_method():
+    """
+    This method determines the model method executing the current
+    statement, from the open tracer span or else from the call stack.
+
+    :return: The model method name, or None if no model method is executing.
+    :rtype: str
+    """
+    span = tracer.current_span()
+    if span is not None and '.' in span:
+        return span
+    frame = sys._getframe(1)
+    while frame is not None:
+        if os.path.basename(frame.f_code.co_filename) == 'models.py':
+            return getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)
+        frame = frame.f_back
+    return None
+
+
+class SlowQueryLog:
+    """
+    This object logs the SQL statements exceeding a duration threshold,
+    hooked into the SQLAlchemy engine events.
+
+    Every entry holds the statement, its redacted bound parameters, the
+    endpoint and the model method executing it. The EXPLAIN QUERY PLAN
+    output is captured once per statement fingerprint.
+    """
+    def __init__(self):
+        """This method initializes the disabled slow query log."""
+        self.threshold = 0.05
+        self.path = None
+        self._explained = set()
+        self._lock = threading.Lock()
+        self._engines = set()
+
+    def init_app(self, app):
+        """
+        This method configures the slow query log from the provided app
+        configuration and registers the engine listeners.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+        """
+        self.threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS', 50) / 1000
+        self.path = os.path.join(app.root_path, app.config.get('SLOW_QUERY_LOG_PATH', 'slow_queries.jsonl'))
+        self._explained.clear()
+        from db import db as dbs
+        with app.app_context():
+            engine = dbs.get_engine()
+        if engine not in self._engines:
+            self._engines.add(engine)
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_starts', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('slow_query_starts')
+        if not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        if duration < self.threshold:
+            return
+        normalized, statement_fingerprint = fingerprint(statement=statement)
+        entry = {
+            'timestamp': datetime.utcnow().isoformat(),
+            'fingerprint': statement_fingerprint,
+            'durationMs': round(duration * 1000, 3),
+            'statement': normalized,
+            'parameters': redact(parameters=parameters) if not executemany else '<executemany>',
+            'endpoint': request.endpoint if has_request_context() else None,
+            'method': model_method()
+        }
+        with self._lock:
+            explain = statement_fingerprint not in self._explained
+            self._explained.add(statement_fingerprint)
+        if explain and not executemany and conn.dialect.name == 'sqlite':
+            entry['plan'] = self.explain(conn=conn, statement=statement, parameters=parameters)
+        LOGGER.warning('Slow query {FINGERPRINT} took {DURATION}ms: {STATEMENT}'.format(
+            FINGERPRINT=statement_fingerprint,
+            DURATION=entry['durationMs'],
+            STATEMENT=normalized
+        ))
+        with self._lock:
+            with open(self.path, 'a') as log_file:
+                log_file.write(json.dumps(entry) + '\n')
+
+    @staticmethod
+    def explain(conn, statement, parameters):
+        """
+        This method captures the query plan of the provided statement.
+
+        :param conn: The provided connection executing the statement.
+        :type conn: sqlalchemy.engine.Connection
+
+        :param statement: The provided SQL statement.
+        :type statement: str
+
+        :param parameters: The provided bound parameters.
+        :type parameters: tuple|list|dict
+
+        :return: The query plan lines, or None if the plan is unavailable.
+        :rtype: list
+        """
+        try:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+                return [row[-1] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception:
+            LOGGER.debug('Query plan unavailable', exc_info=True)
+            return None
+
+
+def summarize(path):
+    """
+    This method summarizes the slow query log per statement fingerprint.
+
+    :param path: The provided slow query log path.
+    :type path: str
+
+    :return: The summaries, slowest total duration first.
+    :rtype: list
+    """
+    summaries = {}
+    with open(path) as log_file:
+        for line in log_file:
+            entry = json.loads(line)
+            summary = summaries.setdefault(entry['fingerprint'], {
+                'fingerprint': entry['fingerprint'],
+                'statement': entry['statement'],
+                'durations': [],
+                'endpoints': set(),
+                'methods': set(),
+                'plan': None
+            })
+            summary['durations'].append(entry['durationMs'])
+            summary['endpoints'].add(entry['endpoint'])
+            summary['methods'].add(entry['method'])
+            summary['plan'] = summary['plan'] or entry.get('plan')
+    for summary in summaries.values():
+        durations = sorted(summary.pop('durations'))
+        summary['count'] = len(durations)
+        summary['totalMs'] = round(sum(durations), 3)
+        summary['meanMs'] = round(summary['totalMs'] / len(durations), 3)
+        summary['p95Ms'] = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        summary['maxMs'] = durations[-1]
+        summary['endpoints'] = sorted(endpoint for endpoint in summary['endpoints'] if endpoint)
+        summary['methods'] = sorted(method for method in summary['methods'] if method)
+    return sorted(summaries.values(), key=lambda summary: summary['totalMs'], reverse=True)
+
+
+slow_query_log = SlowQueryLog()
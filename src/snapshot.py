@@ -0,0 +1,166 @@
+import bisect
+import calendar
+import mmap
+import os
+import struct
+import time
+
+from db import db as dbs
+from models import Url, Shortcode
+import shortcode_codec
+
+
+class LinkSnapshot:
+    """
+    This object is a compact, read-only snapshot of the shortcode to url
+    mapping, stored in a file that is memory-mapped on lookup.
+
+    The file consists of a header, the records sorted on the packed
+    shortcode and the concatenated UTF-8 urls:
+
+    - header: magic, format version, record count
+    - record: packed shortcode, expiry epoch (0 if none), url offset, url length
+    """
+    MAGIC = b'LSNP'
+    VERSION = 1
+    HEADER = struct.Struct('<4sII')
+    RECORD = struct.Struct('<IIII')
+
+    def __init__(self, path):
+        """
+        This method initializes the snapshot for the provided file path.
+        The file is mapped lazily, on the first lookup.
+
+        :param path: The provided snapshot file path.
+        :type path: str
+        """
+        self.path = path
+        self._view = None
+
+    @classmethod
+    def write(cls, path, rows):
+        """
+        This method writes a snapshot file from the provided rows, atomically
+        replacing an existing snapshot file.
+
+        :param path: The provided snapshot file path.
+        :type path: str
+
+        :param rows: The provided (packed shortcode, url, expiry) rows,
+            sorted on the packed shortcode.
+        :type rows: collections.abc.Iterable
+
+        :return: The amount of written records.
+        :rtype: int
+        """
+        records = bytearray()
+        urls = bytearray()
+        count = 0
+        for key, url, expires_at in rows:
+            encoded = url.encode('utf-8')
+            expires = calendar.timegm(expires_at.utctimetuple()) if expires_at is not None else 0
+            records += cls.RECORD.pack(key, expires, len(urls), len(encoded))
+            urls += encoded
+            count += 1
+        temporary_path = '{PATH}.{PID}.tmp'.format(PATH=path, PID=os.getpid())
+        with open(temporary_path, 'wb') as snapshot_file:
+            snapshot_file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, count))
+            snapshot_file.write(records)
+            snapshot_file.write(urls)
+        os.replace(temporary_path, path)
+        return count
+
+    @classmethod
+    def build(cls, path):
+        """
+        This method writes a snapshot file from the database.
+
+        :param path: The provided snapshot file path.
+        :type path: str
+
+        :return: The amount of written records.
+        :rtype: int
+
+        .. warning::
+            This method has to be called within an application context.
+        """
+        rows = dbs.session.query(Shortcode.id, Url.url, Url.expiresAt).join(
+            Url, Shortcode.urlId == Url.id
+        ).order_by(Shortcode.id).yield_per(10000)
+        return cls.write(path=path, rows=rows)
+
+    def _open(self):
+        """
+        This method maps the current snapshot file, re-mapping it when
+        the file has been replaced since the last lookup. A replaced
+        mapping is not closed explicitly, as concurrent lookups may
+        still use it; it is closed once it is no longer referenced.
+
+        :return: The mapped snapshot, or None if no snapshot file exists.
+        :rtype: snapshot._SnapshotView
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._view = None
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        view = self._view
+        if view is None or view.identity != identity:
+            view = self._view = _SnapshotView(path=self.path, identity=identity)
+        return view
+
+    def lookup(self, shortcode, now=None):
+        """
+        This method looks up the url for the provided shortcode, with a
+        binary search over the sorted records.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :param now: The provided reference epoch, defaults to the current time.
+        :type now: float
+
+        :return: The url, or None if the shortcode is not present or expired.
+        :rtype: str
+        """
+        key = shortcode_codec.key(shortcode)
+        view = self._open() if key is not None else None
+        if view is None:
+            return None
+        index = bisect.bisect_left(view, key)
+        if index == len(view) or view[index] != key:
+            return None
+        _, expires, offset, length = self.RECORD.unpack_from(view.mmap, self.HEADER.size + index * self.RECORD.size)
+        if expires and expires <= (now or time.time()):
+            return None
+        start = view.urls_offset + offset
+        return view.mmap[start:start + length].decode('utf-8')
+
+    def __len__(self):
+        view = self._open()
+        return len(view) if view is not None else 0
+
+
+class _SnapshotView:
+    """
+    The memory-mapped snapshot file, exposed as the sequence of packed
+    shortcodes of its records for the binary search.
+    """
+    def __init__(self, path, identity):
+        self.identity = identity
+        with open(path, 'rb') as snapshot_file:
+            self.mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count = LinkSnapshot.HEADER.unpack_from(self.mmap, 0)
+        if magic != LinkSnapshot.MAGIC or version != LinkSnapshot.VERSION:
+            raise ValueError('Invalid snapshot file: {PATH}'.format(PATH=path))
+        self.urls_offset = LinkSnapshot.HEADER.size + self._count * LinkSnapshot.RECORD.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return _KEY.unpack_from(self.mmap, LinkSnapshot.HEADER.size + index * LinkSnapshot.RECORD.size)[0]
+
+
+_KEY = struct.Struct('<I')
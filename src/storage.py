@@ -0,0 +1,528 @@
+"""
+The storage backends of the links, selected with the STORAGE_BACKEND
+configuration parameter.
+
+- sqlalchemy: the database models, the default.
+- memory: dicts and compact arrays in the worker process, with an
+  optional snapshot to disk. The links are not shared between workers,
+  so this backend is meant for a single worker and for benchmarks.
+
+The click analytics, the degraded mode, the invalidation bus and the
+link index work on the database models, and only apply to the
+sqlalchemy backend.
+"""
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import threading
+import time
+
+from cache import stats_versions
+from exceptions import InvalidShortcode, ShortcodeAlreadyInUse, ShortcodeNotFound
+import shortcode_codec
+
+LOGGER = logging.getLogger(__name__)
+
+
+class StorageBackend(ABC):
+    """
+    The abstract base class for the storage backends of the links.
+
+    Every backend raises the same API exceptions, and returns the same
+    shortcodes, urls and stats, as checked by tests/test_storage.py.
+    """
+    @abstractmethod
+    def insert_url(self, url, shortcode=None, expires_at=None):
+        """
+        This method stores a new link and returns its shortcode. If the
+        url is already stored and not expired, the existing shortcode is
+        returned.
+
+        :param url: The provided URL.
+        :type url: str
+
+        :param shortcode: The provided optional shortcode.
+        :type shortcode: str
+
+        :param expires_at: The provided optional expiry moment in UTC.
+        :type expires_at: datetime.datetime
+
+        :raises:
+            InvalidShortcode: When the provided shortcode has an invalid format.
+            ShortcodeAlreadyInUse: When the provided shortcode is already in use.
+
+        :return: The shortcode of the link.
+        :rtype: str
+        """
+
+    @abstractmethod
+    def resolve(self, shortcode):
+        """
+        This method counts a redirect of the provided shortcode and
+        returns its url.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :raises:
+            ShortcodeNotFound: When the provided shortcode does not exist
+                or has expired.
+
+        :return: The url of the link.
+        :rtype: str
+        """
+
+    @abstractmethod
+    def get_stats(self, shortcode):
+        """
+        This method retrieves the stats of the provided shortcode.
+
+        :param shortcode: The provided shortcode.
+        :type shortcode: str
+
+        :raises:
+            ShortcodeNotFound: When the provided shortcode does not exist
+                or has expired.
+
+        :return: The created moment, last redirect moment and redirect count.
+        :rtype: dict
+        """
+
+    @abstractmethod
+    def in_use_keys(self, keys):
+        """
+        This method determines which of the provided packed shortcodes
+        are in use.
+
+        :param keys: The provided packed shortcodes.
+        :type keys: collections.abc.Iterable
+
+        :return: The packed shortcodes in use.
+        :rtype: set
+        """
+
+    @abstractmethod
+    def record_redirects(self, counts):
+        """
+        This method counts the redirects of many shortcodes at once, all
+        or nothing. The counts of shortcodes that do not exist are skipped.
+
+        :param counts: The provided amount of redirects per shortcode.
+        :type counts: dict
+
+        :return: The amount of counted redirects.
+        :rtype: int
+        """
+
+    @abstractmethod
+    def purge_expired(self, limit, now=None):
+        """
+        This method deletes a batch of expired links and releases their
+        shortcodes.
+
+        :param limit: The maximum amount of links to delete.
+        :type limit: int
+
+        :param now: The provided reference moment, defaults to the
+            current UTC time.
+        :type now: datetime.datetime
+
+        :return: The amount of deleted links.
+        :rtype: int
+        """
+
+    @abstractmethod
+    def summary(self, days):
+        """
+        This method retrieves the service-wide totals, and the totals of
+        the provided amount of most recent UTC days, without scanning
+        the links.
+
+        :param days: The provided amount of days, including today.
+        :type days: int
+
+        :return: The amount of links and clicks, and the links created
+            and clicks per day, most recent day first.
+        :rtype: dict
+        """
+
+    def check_availability(self, shortcodes, suggestions=0):
+        """
+        This method checks the validity and availability of the provided
+        candidate shortcodes. The validity is checked in memory, the
+        availability of all valid candidates at once.
+
+        For an unavailable candidate, the nearest free shortcodes are
+        suggested, i.e. the candidate with other last characters.
+
+        :param shortcodes: The provided candidate shortcodes.
+        :type shortcodes: list
+
+        :param suggestions: The provided amount of suggestions per
+            unavailable candidate.
+        :type suggestions: int
+
+        :return: The validity, availability and suggestions per candidate,
+            in the provided order.
+        :rtype: list
+        """
+        keys = [shortcode_codec.key(shortcode) for shortcode in shortcodes]
+        in_use = self.in_use_keys(keys={key for key in keys if key is not None})
+        neighbours = {}
+        if suggestions > 0:
+            for key in in_use:
+                neighbours[key] = shortcode_codec.neighbours(value=key, distance=suggestions * 2)
+            in_use |= self.in_use_keys(keys={
+                neighbour for _neighbours in neighbours.values() for neighbour in _neighbours
+            })
+        results = []
+        for shortcode, key in zip(shortcodes, keys):
+            result = {
+                'shortcode': shortcode,
+                'valid': key is not None,
+                'available': key is not None and key not in in_use
+            }
+            if suggestions > 0:
+                result['suggestions'] = [
+                    shortcode_codec.decode(neighbour) for neighbour in neighbours.get(key, [])
+                    if neighbour not in in_use
+                ][:suggestions]
+            results.append(result)
+        return results
+
+    def start(self):
+        """This method starts the background work of the backend, if any."""
+
+    def stop(self):
+        """This method stops the background work of the backend, if any."""
+
+
+class SQLAlchemyStorage(StorageBackend):
+    """
+    The storage backend on the database models.
+
+    .. warning::
+        The methods have to be called within an application context.
+    """
+    def insert_url(self, url, shortcode=None, expires_at=None):
+        from models import Url
+        return Url.insert_url(url=url, shortcode=shortcode, expires_at=expires_at)
+
+    def resolve(self, shortcode):
+        from models import Redirect
+        return Redirect.redirect(shortcode=shortcode)
+
+    def get_stats(self, shortcode):
+        from models import Stat
+        return Stat.get_stats(shortcode=shortcode)
+
+    def in_use_keys(self, keys):
+        from models import Shortcode
+        return Shortcode.in_use_keys(keys=keys)
+
+    def record_redirects(self, counts):
+        from db import db as dbs
+        from repository import links
+        counted = 0
+        try:
+            for shortcode, amount in counts.items():
+                link = links.find(shortcode=shortcode)
+                if link is None or link.is_expired():
+                    continue
+                links.record_redirect(link=link, amount=amount)
+                counted += amount
+            dbs.session.commit()
+        except Exception:
+            dbs.session.rollback()
+            raise
+        return counted
+
+    def purge_expired(self, limit, now=None):
+        from db import db as dbs
+        from models import Url
+        url_ids = Url.expired_ids(limit=limit, now=now)
+        Url.purge(url_ids=url_ids)
+        dbs.session.commit()
+        return len(url_ids)
+
+    def summary(self, days):
+        from models import GlobalStat
+        return GlobalStat.summary(days=days)
+
+
+def _epoch(moment):
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _isoformat(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def _day(epoch):
+    return time.strftime('%Y-%m-%d', time.gmtime(epoch))
+
+
+class MemoryStorage(StorageBackend):
+    """
+    The storage backend in the worker process memory.
+
+    Every link occupies a slot in compact column arrays, found through
+    the packed shortcode and url dicts. The slots of deleted links are
+    reused. An expiry or last redirect moment of 0 means none. The
+    service-wide totals are counted along, per UTC day as well.
+
+    The links are optionally loaded from, and periodically saved to, a
+    snapshot file. The app saves a last snapshot when the worker exits.
+    """
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, snapshot_path=None, snapshot_interval=60):
+        """
+        This method initializes the backend, loading the snapshot file
+        if present.
+
+        :param snapshot_path: The provided optional snapshot file path.
+        :type snapshot_path: str
+
+        :param snapshot_interval: The amount of seconds between two
+            snapshots, 0 to only save on stop.
+        :type snapshot_interval: float
+        """
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.slots = {}
+        self.url_slots = {}
+        self.keys = array('I')
+        self.urls = []
+        self.created = array('d')
+        self.expires = array('d')
+        self.counts = array('Q')
+        self.last_redirects = array('d')
+        self.free_slots = []
+        self.clicks = 0
+        self.daily = {}
+        self.released = deque(maxlen=10000)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            self.load()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _expired(self, slot, now):
+        return 0 < self.expires[slot] <= now
+
+    def _add(self, key, url, created, expires, count=0, last_redirect=0.0):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.keys[slot], self.urls[slot], self.created[slot] = key, url, created
+            self.expires[slot], self.counts[slot], self.last_redirects[slot] = expires, count, last_redirect
+        else:
+            slot = len(self.urls)
+            self.keys.append(key)
+            self.urls.append(url)
+            self.created.append(created)
+            self.expires.append(expires)
+            self.counts.append(count)
+            self.last_redirects.append(last_redirect)
+        self.slots[key] = slot
+        self.url_slots[url] = slot
+        self.clicks += count
+        self.daily.setdefault(_day(created), [0, 0])[0] += 1
+        return slot
+
+    def _delete(self, slot):
+        key = self.keys[slot]
+        del self.slots[key]
+        del self.url_slots[self.urls[slot]]
+        self.urls[slot] = None
+        self.free_slots.append(slot)
+        self.clicks -= self.counts[slot]
+        self.daily[_day(self.created[slot])][0] -= 1
+        shortcode = shortcode_codec.decode(key)
+        stats_versions.pop(shortcode)
+        self.released.append(shortcode)
+
+    def _allocate(self):
+        while True:
+            try:
+                key = shortcode_codec.encode(self.released.popleft())
+            except IndexError:
+                key = shortcode_codec.encode(shortcode_codec.random_shortcode())
+            if key not in self.slots:
+                return key
+
+    def insert_url(self, url, shortcode=None, expires_at=None):
+        if shortcode is not None and not shortcode_codec.is_valid(shortcode):
+            raise InvalidShortcode
+        now = time.time()
+        with self._lock:
+            slot = self.url_slots.get(url)
+            if slot is not None:
+                if not self._expired(slot=slot, now=now):
+                    return shortcode_codec.decode(self.keys[slot])
+                self._delete(slot=slot)
+            if shortcode is not None:
+                key = shortcode_codec.encode(shortcode)
+                if key in self.slots:
+                    raise ShortcodeAlreadyInUse
+            else:
+                key = self._allocate()
+            self._add(key=key, url=url, created=now, expires=_epoch(expires_at) if expires_at is not None else 0.0)
+        return shortcode_codec.decode(key)
+
+    def _slot(self, shortcode, now):
+        slot = self.slots.get(shortcode_codec.key(shortcode))
+        if slot is None or self._expired(slot=slot, now=now):
+            raise ShortcodeNotFound
+        return slot
+
+    def resolve(self, shortcode):
+        now = time.time()
+        with self._lock:
+            slot = self._slot(shortcode=shortcode, now=now)
+            self.counts[slot] += 1
+            self.last_redirects[slot] = now
+            self._count_clicks(amount=1, now=now)
+            return self.urls[slot]
+
+    def _count_clicks(self, amount, now):
+        self.clicks += amount
+        self.daily.setdefault(_day(now), [0, 0])[1] += amount
+
+    def get_stats(self, shortcode):
+        slot = self._slot(shortcode=shortcode, now=time.time())
+        last_redirect = self.last_redirects[slot]
+        return {
+            'created': _isoformat(self.created[slot]),
+            'lastRedirect': _isoformat(last_redirect) if last_redirect else None,
+            'redirectCount': self.counts[slot]
+        }
+
+    def in_use_keys(self, keys):
+        return {key for key in keys if key in self.slots}
+
+    def record_redirects(self, counts):
+        now = time.time()
+        counted = 0
+        with self._lock:
+            for shortcode, amount in counts.items():
+                try:
+                    slot = self._slot(shortcode=shortcode, now=now)
+                except ShortcodeNotFound:
+                    continue
+                self.counts[slot] += amount
+                self.last_redirects[slot] = now
+                counted += amount
+            self._count_clicks(amount=counted, now=now)
+        return counted
+
+    def purge_expired(self, limit, now=None):
+        now = _epoch(now) if now is not None else time.time()
+        with self._lock:
+            expired = [slot for slot in self.slots.values() if self._expired(slot=slot, now=now)][:limit]
+            for slot in expired:
+                self._delete(slot=slot)
+        return len(expired)
+
+    def summary(self, days):
+        since = _day(time.time() - (days - 1) * 86400)
+        return {
+            'links': len(self.slots),
+            'clicks': self.clicks,
+            'days': [
+                {'day': day, 'linksCreated': totals[0], 'clicks': totals[1]}
+                for day, totals in sorted(self.daily.items(), reverse=True) if day >= since
+            ]
+        }
+
+    def save(self):
+        """
+        This method writes the links to the snapshot file, atomically
+        by replacing the file.
+        """
+        with self._lock:
+            rows = [
+                [self.keys[slot], self.urls[slot], self.created[slot], self.expires[slot], self.counts[slot],
+                 self.last_redirects[slot]]
+                for slot in self.slots.values()
+            ]
+            daily_clicks = {day: totals[1] for day, totals in self.daily.items() if totals[1]}
+        temporary_path = self.snapshot_path + '.tmp'
+        with open(temporary_path, 'w') as snapshot_file:
+            json.dump(
+                {'version': self.SNAPSHOT_VERSION, 'links': rows, 'dailyClicks': daily_clicks},
+                snapshot_file,
+                separators=(',', ':')
+            )
+        os.replace(temporary_path, self.snapshot_path)
+
+    def load(self):
+        """This method replaces the links by the links of the snapshot file."""
+        with open(self.snapshot_path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        if snapshot.get('version') != self.SNAPSHOT_VERSION:
+            raise ValueError('Unsupported storage snapshot version: {VERSION}'.format(VERSION=snapshot.get('version')))
+        with self._lock:
+            for key, url, created, expires, count, last_redirect in snapshot['links']:
+                self._add(key=key, url=url, created=created, expires=expires, count=count, last_redirect=last_redirect)
+            for day, clicks in snapshot.get('dailyClicks', {}).items():
+                self.daily.setdefault(day, [0, 0])[1] = clicks
+
+    def _run(self):
+        while not self._stopped.wait(self.snapshot_interval):
+            try:
+                self.save()
+            except OSError:  # pragma: no cover
+                LOGGER.exception('Storage snapshot failed')
+
+    def start(self):
+        """This method starts the periodic snapshots in a daemon thread, if configured."""
+        if self.snapshot_path is not None and self.snapshot_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='storage-snapshot', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """This method stops the periodic snapshots, after a last snapshot."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.snapshot_path is not None:
+            self.save()
+
+
+BACKENDS = {
+    'sqlalchemy': SQLAlchemyStorage,
+    'memory': MemoryStorage
+}
+
+
+def from_config(app):
+    """
+    This method creates the storage backend from the provided app configuration.
+
+    :param app: The provided application object.
+    :type app: flask.Flask
+
+    :raises:
+        ValueError: When the configured backend is unknown.
+
+    :return: The storage backend.
+    :rtype: storage.StorageBackend
+    """
+    name = app.config.get('STORAGE_BACKEND', 'sqlalchemy')
+    if name not in BACKENDS:
+        raise ValueError('Unknown storage backend: {NAME}'.format(NAME=name))
+    if name == 'memory':
+        snapshot_path = app.config.get('STORAGE_SNAPSHOT_PATH')
+        return MemoryStorage(
+            snapshot_path=os.path.join(app.root_path, snapshot_path) if snapshot_path else None,
+            snapshot_interval=app.config.get('STORAGE_SNAPSHOT_INTERVAL', 60)
+        )
+    return BACKENDS[name]()
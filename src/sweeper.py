@@ -0,0 +1,76 @@
+import threading
+import logging
+
+from db import db as dbs
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ExpirySweeper:
+    """
+    This object removes expired links from the configured storage
+    backend in the background, i.e. the expired Url records and the
+    attached Shortcode, Stat and Redirect records.
+
+    The expired records are deleted in small batches driven by the
+    expiry index, every batch being committed on its own, so the sweeper
+    never holds the database write lock for a long time.
+    """
+    def __init__(self, app, interval=60, batch_size=100):
+        """
+        This method initializes the sweeper with the provided parameters.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+
+        :param interval: The amount of seconds between two sweeps.
+        :type interval: float
+
+        :param batch_size: The maximum amount of Url records deleted
+            per transaction.
+        :type batch_size: int
+        """
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sweep(self):
+        """
+        This method deletes all currently expired records, batch by batch.
+
+        :return: The amount of deleted links.
+        :rtype: int
+        """
+        deleted = 0
+        with self.app.app_context():
+            storage = self.app.extensions['storage']
+            while not self._stopped.is_set():
+                purged = storage.purge_expired(limit=self.batch_size)
+                deleted += purged
+                if purged < self.batch_size:
+                    break
+            dbs.session.remove()
+        return deleted
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                deleted = self.sweep()
+            except Exception:  # pragma: no cover
+                LOGGER.exception('Expiry sweep failed')
+            else:
+                if deleted:
+                    LOGGER.info('Expiry sweep deleted {AMOUNT} urls'.format(AMOUNT=deleted))
+
+    def start(self):
+        """This method starts the sweeper in a daemon thread."""
+        self._thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """This method stops the sweeper thread."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,262 @@
+from collections import deque
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+from flask import Blueprint, request
+from sqlalchemy import event
+
+from responses import stream_json
+
+blueprint_debug_trace = Blueprint('debug_trace', __name__)
+
+
+class Tracer:
+    """
+    This object is the sampling request tracer.
+
+    A sampled request records a span for the request, for every decorated
+    model method and for every SQL statement. The finished spans are kept
+    as Chrome trace events in an in-process ring buffer, and optionally
+    appended to a local trace file.
+
+    A request that is not sampled only pays for a thread-local lookup
+    per decorated method call.
+    """
+    def __init__(self):
+        """This method initializes the tracer, sampling no requests."""
+        self.sample_rate = 0.0
+        self.events = deque(maxlen=10000)
+        self.file_path = None
+        self._local = threading.local()
+        self._file_lock = threading.Lock()
+        self._engines = set()
+
+    def configure(self, sample_rate, buffer_size=10000, file_path=None):
+        """
+        This method reconfigures the tracer and drops all recorded spans.
+
+        :param sample_rate: The provided fraction of the requests to trace.
+        :type sample_rate: float
+
+        :param buffer_size: The provided maximum amount of kept spans.
+        :type buffer_size: int
+
+        :param file_path: The provided optional trace file path.
+        :type file_path: str
+        """
+        self.sample_rate = sample_rate
+        self.events = deque(maxlen=buffer_size)
+        self.file_path = file_path
+
+    def init_app(self, app):
+        """
+        This method configures the tracer from the provided app configuration,
+        and registers the request hooks and, if requests are sampled, the
+        SQL statement listeners.
+
+        :param app: The provided application object.
+        :type app: flask.Flask
+        """
+        file_path = app.config.get('TRACING_FILE')
+        self.configure(
+            sample_rate=app.config.get('TRACING_SAMPLE_RATE', 0.0),
+            buffer_size=app.config.get('TRACING_BUFFER_SIZE', 10000),
+            file_path=os.path.join(app.root_path, file_path) if file_path else None
+        )
+        app.before_request(lambda: self.start(name=request.endpoint or request.path))
+        app.teardown_request(lambda error=None: self.finish())
+        if self.sample_rate > 0:
+            from db import db as dbs
+            with app.app_context():
+                self.install(engine=dbs.get_engine())
+        if app.config.get('TRACING_DEBUG_ENDPOINT', False):
+            app.register_blueprint(blueprint=blueprint_debug_trace, url_prefix='')
+
+    def install(self, engine):
+        """
+        This method registers the SQL statement span listeners on the
+        provided engine, once per engine.
+
+        :param engine: The provided engine.
+        :type engine: sqlalchemy.engine.Engine
+        """
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    @property
+    def active(self):
+        """
+        The trace of the current request, or None if it is not sampled.
+
+        :rtype: dict
+        """
+        return getattr(self._local, 'trace', None)
+
+    def current_span(self):
+        """
+        This method fetches the name of the innermost open span of the
+        current request.
+
+        :return: The span name, or None if no span is open.
+        :rtype: str
+        """
+        trace = self.active
+        if trace is None or not trace['stack']:
+            return None
+        return trace['stack'][-1]
+
+    def start(self, name, force=False):
+        """
+        This method decides if the current request is sampled and, if so,
+        opens the request span.
+
+        :param name: The provided request span name.
+        :type name: str
+
+        :param force: Whether the request is traced regardless of the sample rate.
+        :type force: bool
+        """
+        if force or (self.sample_rate > 0 and random.random() < self.sample_rate):
+            self._local.trace = {'name': name, 'start': time.perf_counter_ns(), 'spans': [], 'stack': [name]}
+        else:
+            self._local.trace = None
+
+    def finish(self):
+        """This method closes the request span and stores the spans of the current request."""
+        trace = self.active
+        if trace is None:
+            return
+        self._local.trace = None
+        self.record(trace=trace, name=trace['name'], category='request', start=trace['start'])
+        self.events.extend(trace['spans'])
+        if self.file_path is not None:
+            self._write(events=trace['spans'])
+
+    def record(self, trace, name, category, start, args=None):
+        """
+        This method adds a finished span to the provided trace, as a
+        Chrome trace complete event.
+
+        :param trace: The provided trace of the current request.
+        :type trace: dict
+
+        :param name: The provided span name.
+        :type name: str
+
+        :param category: The provided span category.
+        :type category: str
+
+        :param start: The provided span start, in perf_counter nanoseconds.
+        :type start: int
+
+        :param args: The provided optional span arguments.
+        :type args: dict
+        """
+        span = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start // 1000,
+            'dur': (time.perf_counter_ns() - start) // 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_ident()
+        }
+        if args:
+            span['args'] = args
+        trace['spans'].append(span)
+
+    def span(self, name):
+        """
+        This method creates a decorator that records a span for every
+        call of the decorated method within a sampled request.
+
+        :param name: The provided span name.
+        :type name: str
+
+        :return: The decorator.
+        :rtype: collections.abc.Callable
+        """
+        def decorator(method):
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                trace = getattr(self._local, 'trace', None)
+                if trace is None:
+                    return method(*args, **kwargs)
+                start = time.perf_counter_ns()
+                trace['stack'].append(name)
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    trace['stack'].pop()
+                    self.record(trace=trace, name=name, category='model', start=start)
+            return wrapper
+        return decorator
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active is not None:
+            conn.info.setdefault('tracing_starts', []).append(time.perf_counter_ns())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        trace = self.active
+        starts = conn.info.get('tracing_starts')
+        if trace is None or not starts:
+            return
+        self.record(
+            trace=trace,
+            name=statement.split(None, 1)[0].upper(),
+            category='sql',
+            start=starts.pop(),
+            args={'statement': statement[:500], 'parent': self.current_span()}
+        )
+
+    def _write(self, events):
+        """
+        This method appends the provided spans to the trace file, in the
+        Chrome trace JSON array format, which may be left unterminated.
+        """
+        with self._file_lock:
+            with open(self.file_path, 'a') as trace_file:
+                if trace_file.tell() == 0:
+                    trace_file.write('[\n')
+                for _event in events:
+                    trace_file.write(json.dumps(_event) + ',\n')
+
+    def chrome_trace(self):
+        """
+        This method exports the spans of the ring buffer.
+
+        :return: The Chrome trace event JSON object.
+        :rtype: dict
+        """
+        return {
+            'traceEvents': list(self.events),
+            'displayTimeUnit': 'ms'
+        }
+
+
+tracer = Tracer()
+traced = tracer.span
+
+
+@blueprint_debug_trace.route('/debug/trace', methods=['GET'])
+def get_trace():
+    """
+    This endpoint method dumps the spans of the in-process ring buffer
+    as Chrome trace events, loadable in chrome://tracing or Perfetto.
+
+    The ring buffer is emptied if the clear parameter is provided.
+
+    :return: The streamed response with the Chrome trace event JSON object.
+    :rtype: flask.Response
+    """
+    response = stream_json(data=tracer.chrome_trace(), status_code=200)
+    if 'clear' in request.args:
+        tracer.events.clear()
+    return response
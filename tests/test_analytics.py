@@ -0,0 +1,122 @@
+import os
+import json
+import tempfile
+
+from src.app import create_app, dbs
+from src.exceptions import InvalidRequestPayload
+
+from analytics import referrer_host, agent_family, CountryDatabase, DIRECT, UNKNOWN
+from models import Url, ClickAggregate, Shortcode
+
+TEST_CONFIG = {
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True,
+    'ANALYTICS_ENABLED': True,
+    'ANALYTICS_TOP_N': 2,
+    'ANALYTICS_FLUSH_INTERVAL': 3600
+}
+
+CHROME = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+FIREFOX = 'Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0'
+
+
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
+class TestClassification:
+
+    def test_referrer_host(self):
+        assert referrer_host('https://www.Example.com/some/page?q=1') == 'example.com'
+        assert referrer_host(None) == DIRECT
+        assert referrer_host('not a url') == UNKNOWN
+
+    def test_agent_family(self):
+        assert agent_family(CHROME) == 'Chrome'
+        assert agent_family(FIREFOX) == 'Firefox'
+        assert agent_family('Googlebot/2.1 (+http://www.google.com/bot.html)') == 'Bot'
+        assert agent_family('curl/8.0.1') == 'curl'
+        assert agent_family('') == UNKNOWN
+        assert agent_family('SomethingElse/1.0') == 'Other'
+
+    def test_country_database_lookup(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'countries.csv')
+            with open(path, 'w') as database_file:
+                database_file.write('first,last,country\n')
+                database_file.write('10.0.0.0,10.0.0.255,nl\n')
+                database_file.write('3232235520,3232301055,US\n')
+                database_file.write('2001:db8::,2001:db8::ffff,DE\n')
+            countries = CountryDatabase(path=path)
+        assert len(countries) == 2
+        assert countries.lookup('10.0.0.7') == 'NL'
+        assert countries.lookup('192.168.1.1') == 'US'
+        assert countries.lookup('10.0.1.0') == UNKNOWN
+        assert countries.lookup('2001:db8::1') == UNKNOWN
+
+
+class TestClickAnalytics:
+
+    def setup_class(self):
+        self.app = create_app(config=TEST_CONFIG)
+        self.api_client = self.app.test_client()
+        self.click_analytics = self.app.extensions['click_analytics']
+        self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://analytics.com', 'shortcode': 'anly01'}),
+            headers={'Content-Type': 'application/json'}
+        )
+
+    def click(self, referrer=None, user_agent=CHROME):
+        headers = {'User-Agent': user_agent}
+        if referrer is not None:
+            headers['Referer'] = referrer
+        return self.api_client.get(path='/anly01', headers=headers)
+
+    def test_breakdown_success(self):
+        self.click(referrer='https://news.com/a')
+        self.click(referrer='https://news.com/b', user_agent=FIREFOX)
+        self.click()
+        assert self.click_analytics.pending_clicks == 3
+        request = self.api_client.get(path='/anly01/stats?breakdown=referrer,agent')
+        assert 200 == request.status_code
+        response = request.get_json()
+        assert response['redirectCount'] == 3
+        assert response['breakdown'] == {
+            'referrer': {'news.com': 2, DIRECT: 1},
+            'agent': {'Chrome': 2, 'Firefox': 1}
+        }
+        assert self.click_analytics.pending_clicks == 0
+
+    def test_breakdown_top_n_folded(self):
+        self.click(referrer='https://blog.com')
+        self.click(referrer='https://blog.com')
+        self.click(referrer='https://forum.com')
+        response = self.api_client.get(path='/anly01/stats?breakdown=referrer').get_json()
+        assert response['breakdown'] == {
+            'referrer': {'blog.com': 2, 'news.com': 2, ClickAggregate.OTHER: 2}
+        }
+
+    def test_breakdown_without_country_database(self):
+        response = self.api_client.get(path='/anly01/stats?breakdown').get_json()
+        assert response['breakdown']['country'] == {}
+
+    def test_breakdown_unknown_dimension_failure(self):
+        request = self.api_client.get(path='/anly01/stats?breakdown=referrer,os')
+        assert InvalidRequestPayload.STATUS_CODE == request.status_code
+
+    def test_purge_deletes_aggregates(self):
+        self.click(referrer='https://news.com')
+        with self.app.app_context():
+            self.click_analytics.flush()
+            key = Shortcode.key(shortcode='anly01')
+            Url.purge(url_ids=[Url.query.filter_by(url='http://analytics.com').first().id])
+            dbs.session.commit()
+            assert ClickAggregate.query.filter_by(shortcodeId=key).count() == 0
+            Shortcode.released.clear()
+
+    def teardown_class(self):
+        self.click_analytics.stop()
+        remove_test_database()
@@ -1,21 +1,29 @@
+import os
+import sqlite3
+import tempfile
 import pytest
 
 from . import TestAttributes as TA
 
 from flask import Flask
-from sqlalchemy.exc import OperationalError
 
-from src.app import create_app, blueprint_get_stats, blueprint_get_url, blueprint_shorten_url
-from exceptions import InvalidRequestPayload, ShortcodeAlreadyInUse, ShortcodeNotFound, InvalidShortcode
+from src.app import APP_CONFIG, create_app, blueprint_get_stats, blueprint_get_url, blueprint_shorten_url
+from exceptions import InvalidRequestPayload, ShortcodeAlreadyInUse, ShortcodeNotFound, InvalidShortcode, \
+    IdempotencyKeyReused, ServiceOverloaded
 
 
 TEST_CONFIG = {
     'SQLALCHEMY_TRACK_MODIFICATIONS': False,
     'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
-    'TESTING': True
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True
 }
 
 
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
 @pytest.fixture(name='app_instance', scope='class')
 def app_instance(request):
     app = create_app(config=TEST_CONFIG)
@@ -27,34 +35,56 @@ def app_instance(request):
 
 @pytest.mark.usefixtures('app_instance')
 class TestCreateApp:
-    class DbsMock:
-        def __init__(self):
-            self.session = self.Session
-
-        @classmethod
-        def init_app(cls, app):
-            pass
-
-        class Session:
-            @classmethod
-            def commit(cls):
-                pass
-
-        @classmethod
-        def create_all(cls, app=None):
-            if isinstance(app, Flask):
-                raise OperationalError(statement=None, params=None, orig=None)
-            if app is None:
-                pass
-
     def test_base_instance(self):
         assert isinstance(self.app, Flask)
 
-    def test_create_app_dbs_create_all_OperationalError_exception(self):
-        from src import app  # avoid top-level import colision
-        with TA.patch(app, 'dbs', self.DbsMock()):
+    def test_create_app_schema_current_skips_migrate(self):
+        import schema
+
+        def migrate():
+            raise AssertionError('Schema migrated while current')
+
+        with TA.patch(schema, 'migrate', migrate):
             app = create_app(config=TEST_CONFIG)
-            assert True
+            assert isinstance(app, Flask)
+
+    def test_create_app_without_auto_migrate(self):
+        import schema
+        config = dict(TEST_CONFIG, SQLALCHEMY_DATABASE_URI='sqlite://', SCHEMA_AUTO_MIGRATE=False)
+        app = create_app(config=config)
+        with app.app_context():
+            assert schema.current_version() is None
+        app = create_app(config=dict(APP_CONFIG, SQLALCHEMY_DATABASE_URI='sqlite://'))
+        with app.app_context():
+            assert schema.current_version() is None
+
+    def test_migrate_command(self):
+        import schema
+        config = dict(TEST_CONFIG, SQLALCHEMY_DATABASE_URI='sqlite://', SCHEMA_AUTO_MIGRATE=False)
+        app = create_app(config=config)
+        result = app.test_cli_runner().invoke(args=['migrate'])
+        assert result.exit_code == 0
+        assert str(schema.SCHEMA_VERSION) in result.output
+
+    def test_migrate_refuses_legacy_layout(self):
+        import schema
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'legacy.db')
+            connection = sqlite3.connect(path)
+            connection.executescript(
+                'CREATE TABLE url (id INTEGER PRIMARY KEY, url VARCHAR NOT NULL);'
+                'CREATE TABLE shortcode (id INTEGER PRIMARY KEY, shortcode VARCHAR(6) UNIQUE, urlId INTEGER);'
+            )
+            connection.close()
+            config = dict(TEST_CONFIG, SQLALCHEMY_DATABASE_URI='sqlite:///' + path, SCHEMA_AUTO_MIGRATE=False)
+            app = create_app(config=config)
+            result = app.test_cli_runner().invoke(args=['migrate'])
+            assert result.exit_code != 0
+            assert 'shortcode.shortcode, url.expiresAt' in result.output
+            with app.app_context():
+                assert schema.current_version() is None
+            with pytest.raises(schema.LegacySchemaError):
+                create_app(config=dict(config, SCHEMA_AUTO_MIGRATE=True))
 
     def test_blueprints_present(self):
         assert blueprint_get_url in self.app.blueprints.values()
@@ -66,3 +96,8 @@ class TestCreateApp:
         assert InvalidRequestPayload.__name__ in str(self.app.error_handler_spec)
         assert ShortcodeAlreadyInUse.__name__ in str(self.app.error_handler_spec)
         assert ShortcodeNotFound.__name__ in str(self.app.error_handler_spec)
+        assert IdempotencyKeyReused.__name__ in str(self.app.error_handler_spec)
+        assert ServiceOverloaded.__name__ in str(self.app.error_handler_spec)
+
+    def teardown_class(self):
+        remove_test_database()
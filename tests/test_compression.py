@@ -0,0 +1,94 @@
+import os
+import gzip
+import json
+
+from flask import jsonify
+
+from src.app import create_app
+
+import compression
+from responses import stream_json
+
+TEST_CONFIG = {
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True,
+    'COMPRESSION_THRESHOLD': 64
+}
+
+
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
+class TestCompression:
+
+    def setup_class(self):
+        self.app = create_app(config=TEST_CONFIG)
+        self.api_client = self.app.test_client()
+        self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://compression.com', 'shortcode': 'cmpr01'}),
+            headers={'Content-Type': 'application/json'}
+        )
+
+    def test_streamed_response_gzip_success(self):
+        request = self.api_client.get(path='/metrics', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert 200 == request.status_code
+        assert request.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in request.headers['Vary']
+        assert 'Content-Length' not in request.headers
+        response = json.loads(gzip.decompress(request.get_data()))
+        assert 'counters' in response
+
+    def test_not_accepted_not_compressed(self):
+        request = self.api_client.get(path='/metrics', headers={'Accept-Encoding': 'identity'})
+        assert 'Content-Encoding' not in request.headers
+        assert 'Accept-Encoding' in request.headers['Vary']
+        assert 'counters' in request.get_json()
+
+    def test_brotli_negotiation(self):
+        request = self.api_client.get(path='/metrics', headers={'Accept-Encoding': 'br;q=1.0, gzip;q=0.5'})
+        if compression.brotli is None:
+            assert request.headers['Content-Encoding'] == 'gzip'
+        else:
+            assert request.headers['Content-Encoding'] == 'br'
+
+    def test_redirect_not_compressed(self):
+        request = self.api_client.get(path='/cmpr01', headers={'Accept-Encoding': 'gzip'})
+        assert 302 == request.status_code
+        assert 'Content-Encoding' not in request.headers
+        assert 'Vary' not in request.headers
+
+    def test_compressed_etag_not_modified(self):
+        request = self.api_client.get(path='/cmpr01/stats', headers={'Accept-Encoding': 'gzip'})
+        assert request.headers['Content-Encoding'] == 'gzip'
+        etag = request.headers['ETag']
+        assert etag.endswith('-gzip"')
+        assert 'redirectCount' in json.loads(gzip.decompress(request.get_data()))
+        request = self.api_client.get(
+            path='/cmpr01/stats',
+            headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}
+        )
+        assert 304 == request.status_code
+        assert request.headers['ETag'] == etag
+
+    def test_below_threshold_not_compressed(self):
+        compressor = compression.compressor
+        threshold, compressor.threshold = compressor.threshold, 1 << 20
+        try:
+            request = self.api_client.get(path='/metrics', headers={'Accept-Encoding': 'gzip'})
+        finally:
+            compressor.threshold = threshold
+        assert 'Content-Encoding' not in request.headers
+        assert int(request.headers['Content-Length']) == len(request.get_data())
+
+    def test_stream_json_matches_jsonify(self):
+        data = {'b': [1, 2, {'c': 'é' * 100}], 'a': None}
+        with self.app.test_request_context():
+            streamed = b''.join(stream_json(data=data, chunk_size=16).response)
+            assert streamed == jsonify(data).get_data()
+
+    def teardown_class(self):
+        remove_test_database()
@@ -0,0 +1,177 @@
+import os
+import json
+import tempfile
+from datetime import datetime, timedelta
+
+from . import TestAttributes as TA
+
+from sqlalchemy.exc import DatabaseError, OperationalError
+from src.app import create_app
+
+from degraded import CircuitBreaker, ClickBuffer
+from snapshot import LinkSnapshot
+from models import Redirect
+import shortcode_codec
+
+TEST_CONFIG = {
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True
+}
+
+
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
+def raise_operational_error(shortcode):
+    raise OperationalError(statement=None, params=None, orig=Exception('database is locked'))
+
+
+def raise_database_error(shortcode):
+    raise DatabaseError(statement=None, params=None, orig=Exception('database disk image is malformed'))
+
+
+class TestLinkSnapshot:
+
+    def test_lookup_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'links.snapshot')
+            rows = sorted([
+                (shortcode_codec.encode('bbbbbb'), 'http://b.com', None),
+                (shortcode_codec.encode('aaaaaa'), 'http://a.com', None),
+                (shortcode_codec.encode('cccccc'), 'http://c.com', datetime.utcnow() - timedelta(seconds=1)),
+                (shortcode_codec.encode('dddddd'), 'http://d.com/é', datetime.utcnow() + timedelta(days=1))
+            ])
+            assert LinkSnapshot.write(path=path, rows=rows) == 4
+            snapshot = LinkSnapshot(path=path)
+            assert len(snapshot) == 4
+            assert snapshot.lookup('aaaaaa') == 'http://a.com'
+            assert snapshot.lookup('bbbbbb') == 'http://b.com'
+            assert snapshot.lookup('dddddd') == 'http://d.com/é'
+            assert snapshot.lookup('cccccc') is None
+            assert snapshot.lookup('zzzzzz') is None
+            assert snapshot.lookup('xy_') is None
+
+    def test_lookup_without_file_success(self):
+        assert LinkSnapshot(path='/nonexistent/links.snapshot').lookup('aaaaaa') is None
+
+
+class TestCircuitBreaker:
+
+    def test_open_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow() is False
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow() is False
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestClickBuffer:
+
+    def test_drain_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            click_buffer = ClickBuffer(path=os.path.join(directory, 'clicks.buffer'))
+            assert not click_buffer
+            click_buffer.record('aaaaaa')
+            click_buffer.record('aaaaaa')
+            click_buffer.record('bbbbbb', amount=3)
+            applied = {}
+            assert click_buffer.drain(apply=applied.__setitem__) == 5
+            assert applied == {'aaaaaa': 2, 'bbbbbb': 3}
+            assert not click_buffer
+
+    def test_drain_keeps_concurrent_clicks_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'clicks.buffer')
+            click_buffer, other_worker = ClickBuffer(path=path), ClickBuffer(path=path)
+            click_buffer.record('aaaaaa')
+            remove = os.remove
+
+            def record_and_remove(removed_path):
+                other_worker.record('bbbbbb')
+                remove(removed_path)
+
+            applied = {}
+            with TA.patch(os, 'remove', record_and_remove):
+                assert click_buffer.drain(apply=applied.__setitem__) == 1
+            assert click_buffer.drain(apply=applied.__setitem__) == 1
+            assert applied == {'aaaaaa': 1, 'bbbbbb': 1}
+            assert os.listdir(directory) == []
+
+
+class TestDegradedRedirects:
+    URL = 'http://degraded.com'
+    SHORTCODE = 'dgr001'
+
+    def setup_class(self):
+        self.directory = tempfile.TemporaryDirectory()
+        config = dict(
+            TEST_CONFIG,
+            DEGRADED_MODE_ENABLED=True,
+            SNAPSHOT_PATH=os.path.join(self.directory.name, 'links.snapshot'),
+            SNAPSHOT_REFRESH_INTERVAL=3600,
+            CLICK_BUFFER_PATH=os.path.join(self.directory.name, 'clicks.buffer'),
+            CIRCUIT_FAILURE_THRESHOLD=1,
+            CIRCUIT_RESET_TIMEOUT=3600
+        )
+        self.app = create_app(config=config)
+        self.degraded_redirects = self.app.extensions['degraded_redirects']
+        self.api_client = self.app.test_client()
+
+    def test_redirect_from_snapshot_success(self):
+        request = self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': self.URL, 'shortcode': self.SHORTCODE}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert request.status_code == 201
+        self.degraded_redirects.refresh()
+        with TA.patch(Redirect, 'redirect', staticmethod(raise_operational_error)):
+            for _ in range(2):
+                request = self.api_client.get(path='/{SHORTCODE}'.format(SHORTCODE=self.SHORTCODE))
+                assert request.status_code == 302
+                assert request.headers['Location'] == self.URL
+            request = self.api_client.get(path='/dgr002')
+            assert request.status_code == 404
+        assert self.degraded_redirects.breaker.state == CircuitBreaker.OPEN
+        assert self.degraded_redirects.click_buffer
+
+    def test_probe_not_found_closes_circuit_success(self):
+        self.degraded_redirects.breaker.reset_timeout = 0
+        request = self.api_client.get(path='/zzzzzz')
+        assert request.status_code == 404
+        assert self.degraded_redirects.breaker.state == CircuitBreaker.CLOSED
+
+    def test_database_error_served_from_snapshot_success(self):
+        self.degraded_redirects.breaker.reset_timeout = 3600
+        with TA.patch(Redirect, 'redirect', staticmethod(raise_database_error)):
+            request = self.api_client.get(path='/{SHORTCODE}'.format(SHORTCODE=self.SHORTCODE))
+            assert request.status_code == 302
+        assert self.degraded_redirects.breaker.state == CircuitBreaker.OPEN
+
+    def test_buffered_clicks_applied_on_recovery_success(self):
+        self.degraded_redirects.breaker.reset_timeout = 0
+        request = self.api_client.get(path='/{SHORTCODE}'.format(SHORTCODE=self.SHORTCODE))
+        assert request.status_code == 302
+        assert self.degraded_redirects.breaker.state == CircuitBreaker.CLOSED
+        self.degraded_redirects.refresh()
+        assert not self.degraded_redirects.click_buffer
+        request = self.api_client.get(path='/{SHORTCODE}/stats'.format(SHORTCODE=self.SHORTCODE))
+        assert request.get_json()['redirectCount'] == 4
+
+    def teardown_class(self):
+        self.degraded_redirects.stop()
+        self.directory.cleanup()
+        remove_test_database()
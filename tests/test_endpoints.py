@@ -1,15 +1,21 @@
 import os
 import json
+import threading
+import time
 import pytest
 
-from src.exceptions import InvalidRequestPayload, ShortcodeAlreadyInUse, InvalidShortcode, ShortcodeNotFound
+from src.exceptions import InvalidRequestPayload, ShortcodeAlreadyInUse, InvalidShortcode, ShortcodeNotFound, \
+    IdempotencyKeyReused, IdempotencyRequestInProgress, ServiceOverloaded
 
 from src.app import create_app, dbs
 
+from . import TestAttributes as TA
+
 TEST_CONFIG = {
     'SQLALCHEMY_TRACK_MODIFICATIONS': False,
     'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
-    'TESTING': True
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True
 }
 
 
@@ -84,6 +90,42 @@ class TestShortenUrl:
         response = request.get_json()
         assert ShortcodeAlreadyInUse.MESSAGE in response['message']
 
+    def test_shorten_url_providing_ttl_success(self):
+        request = self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://example7.com', 'ttl': 3600}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert 201 == request.status_code
+
+    def test_shorten_url_providing_expires_at_in_past_failure(self):
+        request = self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://example8.com', 'expiresAt': '2000-01-01T00:00:00Z'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert InvalidRequestPayload.STATUS_CODE == request.status_code
+        response = request.get_json()
+        assert 'ExpiresAt' in response['message']
+
+    def test_shorten_url_providing_invalid_ttl_failure(self):
+        request = self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://example8.com', 'ttl': 'soon'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert InvalidRequestPayload.STATUS_CODE == request.status_code
+
+    def test_shorten_url_providing_expiry_out_of_range_failure(self):
+        for expiry in ({'ttl': 1000000000000}, {'ttl': 101 * 365 * 86400}, {'expiresAt': '9999-12-30T00:00:00Z'},
+                       {'expiresAt': '9999-12-31T23:59:59-01:00'}):
+            request = self.api_client.post(
+                path='/shorten',
+                data=json.dumps(dict(expiry, url='http://example8.com')),
+                headers={'Content-Type': 'application/json'}
+            )
+            assert InvalidRequestPayload.STATUS_CODE == request.status_code
+
     def test_shorten_url_shortcode_invalid_failure(self):
         url = 'http://example4.com'
         shortcode = 'xy_'
@@ -128,6 +170,13 @@ class TestGetUrl:
         response = request.get_json()
         assert response['message'] == ShortcodeNotFound.MESSAGE
 
+    def test_get_url_no_body_success(self):
+        request = self.api_client.get(
+            path='/{SHORTCODE}'.format(SHORTCODE=self.SHORTCODE)
+        )
+        assert request.data == b''
+        assert 'Cache-Control' not in request.headers
+
     def teardown_class(self):
         remove_test_database()
 
@@ -155,6 +204,33 @@ class TestGetStats:
         assert 'lastRedirect' in response
         assert 'redirectCount' in response
 
+    def test_get_stats_conditional_not_modified_success(self):
+        request = self.api_client.get(
+            path='/{SHORTCODE}/stats'.format(SHORTCODE=self.SHORTCODE)
+        )
+        etag = request.headers['ETag']
+        assert request.headers['Cache-Control'] == 'max-age=0'
+        request = self.api_client.get(
+            path='/{SHORTCODE}/stats'.format(SHORTCODE=self.SHORTCODE),
+            headers={'If-None-Match': etag}
+        )
+        assert request.status_code == 304
+        assert request.headers['ETag'] == etag
+
+    def test_get_stats_conditional_modified_success(self):
+        request = self.api_client.get(
+            path='/{SHORTCODE}/stats'.format(SHORTCODE=self.SHORTCODE)
+        )
+        etag = request.headers['ETag']
+        self.api_client.get(path='/{SHORTCODE}'.format(SHORTCODE=self.SHORTCODE))
+        request = self.api_client.get(
+            path='/{SHORTCODE}/stats'.format(SHORTCODE=self.SHORTCODE),
+            headers={'If-None-Match': etag}
+        )
+        assert request.status_code == 200
+        assert request.headers['ETag'] != etag
+        assert request.get_json()['redirectCount'] == 1
+
     def test_get_stats_shortcode_not_found_failure(self):
         request = self.api_client.get(
             path='/{SHORTCODE}/stats'.format(SHORTCODE=self.SHORTCODE + 'x')
@@ -164,4 +240,332 @@ class TestGetStats:
         assert response['message'] == ShortcodeNotFound.MESSAGE
 
     def teardown_class(self):
-        remove_test_database()
\ No newline at end of file
+        remove_test_database()
+
+@pytest.mark.usefixtures('api_client')
+class TestGetGlobalStats:
+
+    def test_get_global_stats_success(self):
+        request = self.api_client.post(path='/shorten', json={'url': 'http://example12.com', 'shortcode': 'glob01'})
+        assert request.status_code == 201
+        self.api_client.get(path='/glob01')
+        request = self.api_client.get(path='/stats')
+        assert request.status_code == 200
+        response = request.get_json()
+        assert (response['links'], response['clicks']) == (1, 1)
+        assert response['days'][0]['linksCreated'] == 1
+        assert response['days'][0]['clicks'] == 1
+
+    def test_get_global_stats_invalid_days_failure(self):
+        for days in ('0', '367', 'x'):
+            request = self.api_client.get(path='/stats', query_string={'days': days})
+            assert request.status_code == InvalidRequestPayload.STATUS_CODE
+
+    def teardown_class(self):
+        remove_test_database()
+
+
+class TestGetUrlPermanentRedirect:
+    URL = 'http://example9.com'
+    SHORTCODE = 'perm01'
+
+    def setup_class(self):
+        config = dict(TEST_CONFIG, REDIRECT_STATUS_CODE=301, REDIRECT_CACHE_CONTROL='public, max-age=60')
+        self.app = create_app(config=config)
+        self.api_client = self.app.test_client()
+
+    def test_get_url_permanent_redirect_success(self):
+        request = self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': self.URL, 'shortcode': self.SHORTCODE}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert request.status_code == 201
+        request = self.api_client.get(
+            path='/{SHORTCODE}'.format(SHORTCODE=self.SHORTCODE)
+        )
+        assert request.status_code == 301
+        assert request.headers['Location'] == self.URL
+        assert request.headers['Cache-Control'] == 'public, max-age=60'
+
+    def teardown_class(self):
+        remove_test_database()
+
+
+@pytest.mark.usefixtures('api_client')
+class TestCheckShortcodes:
+
+    def test_check_shortcodes_success(self):
+        self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://example-check.com', 'shortcode': 'promo5'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        request = self.api_client.post(
+            path='/shorten/check',
+            data=json.dumps({'shortcodes': ['promo5', 'promo6', 'PROMO7', 12]}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert 200 == request.status_code
+        assert request.get_json()['shortcodes'] == [
+            {'shortcode': 'promo5', 'valid': True, 'available': False},
+            {'shortcode': 'promo6', 'valid': True, 'available': True},
+            {'shortcode': 'PROMO7', 'valid': False, 'available': False},
+            {'shortcode': 12, 'valid': False, 'available': False}
+        ]
+
+    def test_check_shortcodes_suggestions_success(self):
+        self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://example-check2.com', 'shortcode': 'promo6'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        request = self.api_client.post(
+            path='/shorten/check',
+            data=json.dumps({'shortcodes': ['promo5', 'promo9'], 'suggest': 2}),
+            headers={'Content-Type': 'application/json'}
+        )
+        results = request.get_json()['shortcodes']
+        assert results[0]['suggestions'] == ['promo4', 'promo7']
+        assert results[1] == {'shortcode': 'promo9', 'valid': True, 'available': True, 'suggestions': []}
+
+    def test_check_shortcodes_too_many_failure(self):
+        request = self.api_client.post(
+            path='/shorten/check',
+            data=json.dumps({'shortcodes': ['promo5'] * 101}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert InvalidRequestPayload.STATUS_CODE == request.status_code
+
+    def test_check_shortcodes_invalid_payload_failure(self):
+        for payload in ({'shortcodes': 'promo5'}, {'shortcodes': [], 'suggest': 99}, ['promo5']):
+            request = self.api_client.post(
+                path='/shorten/check',
+                data=json.dumps(payload),
+                headers={'Content-Type': 'application/json'}
+            )
+            assert InvalidRequestPayload.STATUS_CODE == request.status_code
+
+    def teardown_class(self):
+        remove_test_database()
+
+
+@pytest.mark.usefixtures('api_client')
+class TestIdempotency:
+    URL = 'http://example10.com'
+    SHORTCODE = 'idem01'
+
+    def shorten(self, key, url=None):
+        return self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': url or self.URL, 'shortcode': self.SHORTCODE}),
+            headers={'Content-Type': 'application/json', 'Idempotency-Key': key}
+        )
+
+    def test_idempotent_retry_replayed_success(self):
+        request = self.shorten(key='retry-1')
+        assert request.status_code == 201
+        assert 'Idempotent-Replayed' not in request.headers
+        request = self.shorten(key='retry-1')
+        assert request.status_code == 201
+        assert request.headers['Idempotent-Replayed'] == 'true'
+        assert request.get_json()['shortcode'] == self.SHORTCODE
+
+    def test_idempotency_key_reused_failure(self):
+        request = self.shorten(key='retry-1', url='http://example11.com')
+        assert request.status_code == IdempotencyKeyReused.STATUS_CODE
+
+    def test_concurrent_retry_in_progress_failure(self):
+        storage = self.api_client.application.extensions['storage']
+        insert_url = storage.insert_url
+        inserting, release = threading.Event(), threading.Event()
+        responses = {}
+
+        def blocking_insert_url(**kwargs):
+            inserting.set()
+            release.wait(5)
+            return insert_url(**kwargs)
+
+        def shorten(name):
+            responses[name] = self.api_client.application.test_client().post(
+                path='/shorten',
+                data=json.dumps({'url': 'http://example12.com', 'shortcode': 'idem02'}),
+                headers={'Content-Type': 'application/json', 'Idempotency-Key': 'retry-2'}
+            )
+
+        with TA.patch(storage, 'insert_url', blocking_insert_url):
+            thread = threading.Thread(target=shorten, args=('first',))
+            thread.start()
+            assert inserting.wait(5)
+            shorten(name='retry')
+            release.set()
+            thread.join()
+        assert responses['retry'].status_code == IdempotencyRequestInProgress.STATUS_CODE
+        assert responses['first'].status_code == 201
+        shorten(name='replayed')
+        assert responses['replayed'].status_code == 201
+        assert responses['replayed'].headers['Idempotent-Replayed'] == 'true'
+
+    def test_server_error_releases_key_success(self):
+        storage = self.api_client.application.extensions['storage']
+
+        def shorten():
+            return self.api_client.post(
+                path='/shorten',
+                data=json.dumps({'url': 'http://example13.com', 'shortcode': 'idem03'}),
+                headers={'Content-Type': 'application/json', 'Idempotency-Key': 'retry-3'}
+            )
+
+        def failing_insert_url(**kwargs):
+            raise RuntimeError('storage failed')
+
+        with TA.patch(storage, 'insert_url', failing_insert_url):
+            with pytest.raises(RuntimeError):
+                shorten()
+        request = shorten()
+        assert request.status_code == 201
+        assert 'Idempotent-Replayed' not in request.headers
+
+    def test_abandoned_reservation_expires_success(self):
+        from flask import g
+        from endpoints import replay_idempotent_request
+        app = create_app(config=dict(TEST_CONFIG, IDEMPOTENCY_RESERVATION_TTL=0.05))
+        client = app.test_client()
+        request_kwargs = {
+            'path': '/shorten',
+            'method': 'POST',
+            'data': json.dumps({'url': 'http://example14.com', 'shortcode': 'idem04'}),
+            'headers': {'Content-Type': 'application/json', 'Idempotency-Key': 'retry-4'}
+        }
+        with app.test_request_context(**request_kwargs):
+            assert replay_idempotent_request() is None
+            g.pop('idempotency_key')  # the worker dies before its teardown
+        assert client.open(**request_kwargs).status_code == IdempotencyRequestInProgress.STATUS_CODE
+        time.sleep(0.1)
+        assert client.open(**request_kwargs).status_code == 201
+        time.sleep(0.1)
+        assert client.open(**request_kwargs).headers['Idempotent-Replayed'] == 'true'
+
+    def test_idempotency_metrics_success(self):
+        request = self.api_client.get(path='/metrics')
+        assert request.status_code == 200
+        gauges = request.get_json()['gauges']
+        assert gauges['idempotency.replay_hit_rate'] == 2 / 6
+
+    def teardown_class(self):
+        remove_test_database()
+
+
+@pytest.mark.usefixtures('api_client')
+class TestConcurrentShortenUrl:
+    THREADS = 8
+
+    def race(self, payloads):
+        app = self.api_client.application
+        barrier = threading.Barrier(len(payloads))
+        results = [None] * len(payloads)
+
+        def shorten(index, payload):
+            with app.test_client() as client:
+                barrier.wait()
+                request = client.post(
+                    path='/shorten',
+                    data=json.dumps(payload),
+                    headers={'Content-Type': 'application/json'}
+                )
+                results[index] = (request.status_code, request.get_json())
+
+        threads = [threading.Thread(target=shorten, args=(index, payload)) for index, payload in enumerate(payloads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_same_shortcode_single_winner_success(self):
+        results = self.race([
+            {'url': 'http://race{INDEX}.com'.format(INDEX=index), 'shortcode': 'race01'}
+            for index in range(self.THREADS)
+        ])
+        status_codes = sorted(status_code for status_code, _ in results)
+        assert status_codes == [201] + [ShortcodeAlreadyInUse.STATUS_CODE] * (self.THREADS - 1)
+
+    def test_concurrent_same_url_single_shortcode_success(self):
+        results = self.race([{'url': 'http://race.com'} for _ in range(self.THREADS)])
+        assert {status_code for status_code, _ in results} == {201}
+        assert len({response['shortcode'] for _, response in results}) == 1
+
+    def test_concurrent_first_redirects_counted_success(self):
+        app = self.api_client.application
+        request = self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://race2.com', 'shortcode': 'race02'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert request.status_code == 201
+        barrier = threading.Barrier(self.THREADS)
+        status_codes = []
+
+        def redirect():
+            with app.test_client() as client:
+                barrier.wait()
+                status_codes.append(client.get(path='/race02').status_code)
+
+        threads = [threading.Thread(target=redirect) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert status_codes == [302] * self.THREADS
+        assert self.api_client.get(path='/race02/stats').get_json()['redirectCount'] == self.THREADS
+
+    def teardown_class(self):
+        remove_test_database()
+
+
+class TestAdmissionControl:
+
+    def setup_class(self):
+        config = dict(TEST_CONFIG, ADMISSION_READ_CONCURRENCY=0, ADMISSION_READ_QUEUE_SIZE=0, ADMISSION_RETRY_AFTER=3)
+        self.app = create_app(config=config)
+        self.api_client = self.app.test_client()
+
+    def test_read_shed_success(self):
+        request = self.api_client.get(path='/shed01')
+        assert request.status_code == ServiceOverloaded.STATUS_CODE
+        assert request.headers['Retry-After'] == '3'
+        assert request.get_json()['message'] == ServiceOverloaded.MESSAGE
+
+    def test_write_admitted_success(self):
+        request = self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://example12.com', 'shortcode': 'shed01'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert request.status_code == 201
+
+    def test_budgets_per_app_success(self):
+        app = create_app(config=dict(TEST_CONFIG, ADMISSION_READ_CONCURRENCY=4, ADMISSION_RETRY_AFTER=5))
+        assert app.extensions['admission'] is not self.app.extensions['admission']
+        assert app.test_client().get(path='/shed02').status_code == ShortcodeNotFound.STATUS_CODE
+        request = self.api_client.get(path='/shed02')
+        assert request.status_code == ServiceOverloaded.STATUS_CODE
+        assert request.headers['Retry-After'] == '3'
+
+    def test_budget_deadline_success(self):
+        from admission import Budget
+        budget = Budget(name='test', concurrency=1, queue_size=1, timeout=0.01)
+        assert budget.acquire()
+        assert budget.acquire() is False
+        budget.release()
+        assert budget.acquire()
+
+    def test_admission_metrics_success(self):
+        request = self.api_client.get(path='/metrics')
+        response = request.get_json()
+        assert response['counters']['admission.read.shed'] >= 1
+        assert response['gauges']['admission.write.in_flight'] == 0
+        assert response['gauges']['admission.read.queue_depth'] == 0
+
+    def teardown_class(self):
+        remove_test_database()
@@ -0,0 +1,92 @@
+import os
+import time
+
+from src.app import create_app, dbs
+
+from cache import stats_versions
+from invalidation import InvalidationBus
+from metrics import metrics
+from models import Url, LinkChange
+
+TEST_CONFIG = {
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True,
+    'INVALIDATION_ENABLED': True,
+    'INVALIDATION_POLL_INTERVAL': 0.01
+}
+
+
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
+class TestInvalidationBus:
+
+    def setup_class(self):
+        self.app = create_app(config=TEST_CONFIG)
+        self.bus = InvalidationBus(app=self.app, batch_size=2)
+        self.changes = []
+        self.bus.subscribe(self.changes.extend)
+        self.bus.connect()
+
+    def test_created_and_deleted_changes(self):
+        with self.app.app_context():
+            Url.insert_url(url='http://invalidation1.com', shortcode='inv001')
+            Url.insert_url(url='http://invalidation2.com', shortcode='inv002')
+            Url.insert_url(url='http://invalidation3.com', shortcode='inv003')
+            assert self.bus.poll() == 3
+            Url.purge(url_ids=[Url.query.filter_by(url='http://invalidation1.com').first().id])
+            dbs.session.commit()
+        assert self.bus.poll() == 1
+        assert self.changes == [
+            ('inv001', LinkChange.CREATED),
+            ('inv002', LinkChange.CREATED),
+            ('inv003', LinkChange.CREATED),
+            ('inv001', LinkChange.DELETED)
+        ]
+        assert metrics.get('invalidation.batches') >= 3
+        assert metrics.get('invalidation.delay_ms') >= 0
+
+    def test_unchanged_database_not_read(self):
+        assert self.bus.poll() == 0
+
+    def test_pruned_change_log_ids_not_reused(self):
+        bus = InvalidationBus(app=self.app, retention=0)
+        changes = []
+        bus.subscribe(changes.extend)
+        bus.connect()
+        with self.app.app_context():
+            Url.insert_url(url='http://invalidation5.com', shortcode='inv005')
+            assert bus.poll() == 1
+            assert LinkChange.query.count() == 1
+            Url.insert_url(url='http://invalidation6.com', shortcode='inv006')
+        assert bus.poll() == 1
+        assert changes == [('inv005', LinkChange.CREATED), ('inv006', LinkChange.CREATED)]
+        bus.close()
+
+    def test_running_bus_drops_stats_versions(self):
+        stats_versions.set('inv002', 'etag')
+        with self.app.app_context():
+            Url.purge(url_ids=[Url.query.filter_by(url='http://invalidation2.com').first().id])
+            dbs.session.commit()
+        deadline = time.monotonic() + 2
+        while stats_versions.get('inv002') is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stats_versions.get('inv002') is None
+
+    def test_change_log_disabled(self):
+        disabled_app = create_app(config=dict(TEST_CONFIG, INVALIDATION_ENABLED=False))
+        with disabled_app.app_context():
+            count = LinkChange.query.count()
+            Url.insert_url(url='http://invalidation4.com', shortcode='inv004')
+            assert LinkChange.query.count() == count
+        with self.app.app_context():
+            Url.insert_url(url='http://invalidation7.com', shortcode='inv007')
+            assert LinkChange.query.count() == count + 1
+
+    def teardown_class(self):
+        self.bus.close()
+        self.app.extensions['invalidation_bus'].stop()
+        remove_test_database()
@@ -0,0 +1,193 @@
+import atexit
+import calendar
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from src.app import create_app, dbs
+
+from . import TestAttributes as TA
+
+from link_index import CompactLinkIndex, split_host
+from metrics import metrics
+from models import Url
+from repository import links
+import shortcode_codec
+
+TEST_CONFIG = {
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True,
+    'INVALIDATION_ENABLED': True,
+    'INVALIDATION_POLL_INTERVAL': 0.01,
+    'LINK_INDEX_ENABLED': True,
+    'LINK_INDEX_FLUSH_INTERVAL': 3600,
+    'LINK_INDEX_REBUILD_INTERVAL': 0
+}
+
+
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
+def key(shortcode):
+    return shortcode_codec.encode(shortcode)
+
+
+class TestCompactLinkIndex:
+    ROWS = [
+        (key('idx001'), 'https://example.com/a', 0),
+        (key('idx002'), 'https://example.com/b?c=d', 0),
+        (key('idx003'), 'http://other.org', 1),
+        (key('idx004'), 'example.net/é', 0)
+    ]
+
+    def test_split_host(self):
+        assert split_host('https://example.com/a/b') == ('https://example.com', '/a/b')
+        assert split_host('https://example.com') == ('https://example.com', '')
+        assert split_host('example.com/a') == ('', 'example.com/a')
+
+    def test_lookup(self):
+        for compress_hosts in (True, False):
+            index = CompactLinkIndex.build(rows=self.ROWS, compress_hosts=compress_hosts)
+            assert len(index) == 4
+            assert index.lookup(key=key('idx001')) == 'https://example.com/a'
+            assert index.lookup(key=key('idx002')) == 'https://example.com/b?c=d'
+            assert index.lookup(key=key('idx003')) is None
+            assert index.lookup(key=key('idx004')) == 'example.net/é'
+            assert index.lookup(key=key('idx000')) is None
+            assert index.lookup(key=key('idx005')) is None
+        assert index.memory()['hosts'] is None
+        assert CompactLinkIndex.build(rows=self.ROWS).memory()['hosts'] == 3
+
+    def test_merged(self):
+        index = CompactLinkIndex.build(rows=self.ROWS)
+        merged = index.merged(delta={
+            key('idx000'): ('https://new.com/0', 0),
+            key('idx002'): None,
+            key('idx004'): ('https://example.com/4', 0),
+            key('idx009'): ('https://new.com/9', 0)
+        })
+        assert list(merged.keys) == [key('idx000'), key('idx001'), key('idx004'), key('idx009')]
+        assert merged.lookup(key=key('idx004')) == 'https://example.com/4'
+        assert merged.lookup(key=key('idx009')) == 'https://new.com/9'
+        assert index.lookup(key=key('idx002')) == 'https://example.com/b?c=d'
+
+    def test_far_future_expiry(self):
+        far_future = calendar.timegm(datetime(9999, 12, 31, 23, 59, 59).utctimetuple())
+        index = CompactLinkIndex.build(rows=self.ROWS + [(key('idx005'), 'https://example.com/e', far_future)])
+        assert index.lookup(key=key('idx005')) == 'https://example.com/e'
+        assert index.merged(delta={}).lookup(key=key('idx005')) == 'https://example.com/e'
+
+    def test_memory_per_entry(self):
+        rows = [(value, 'https://example.com/{}'.format(value), 0) for value in range(10000)]
+        memory = CompactLinkIndex.build(rows=rows).memory()
+        assert memory['entries'] == 10000
+        assert memory['bytesPerEntry'] < 40
+
+
+class TestIndexedRedirects:
+
+    def setup_class(self):
+        self.app = create_app(config=TEST_CONFIG)
+        self.redirects = self.app.extensions['link_index']
+        self.client = self.app.test_client()
+
+    def wait_for(self, shortcode, indexed=True):
+        deadline = time.monotonic() + 2
+        while (self.redirects.lookup(shortcode=shortcode) is not None) != indexed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.redirects.lookup(shortcode=shortcode)
+
+    def test_redirect_served_from_index(self):
+        request = self.client.post(path='/shorten', json={'url': 'http://index1.com/a', 'shortcode': 'idx101'})
+        assert request.status_code == 201
+        assert self.wait_for(shortcode='idx101') == 'http://index1.com/a'
+        hits = metrics.get('link_index.hits')
+        assert self.client.get(path='/idx101').headers['Location'] == 'http://index1.com/a'
+        assert metrics.get('link_index.hits') == hits + 1
+        assert self.client.get(path='/idx101/stats').get_json()['redirectCount'] == 0
+        assert self.redirects.flush() == 1
+        assert self.client.get(path='/idx101/stats').get_json()['redirectCount'] == 1
+
+    def test_merge_and_delete(self):
+        assert self.redirects.merge() >= 1
+        assert self.redirects.delta == {}
+        assert self.redirects.index.lookup(key=key('idx101')) == 'http://index1.com/a'
+        with self.app.app_context():
+            Url.purge(url_ids=[Url.query.filter_by(url='http://index1.com/a').first().id])
+            dbs.session.commit()
+        assert self.wait_for(shortcode='idx101', indexed=False) is None
+        assert self.client.get(path='/idx101').status_code == 404
+        self.redirects.merge()
+        assert len(self.redirects.index) == 0
+
+    def test_rebuild_and_miss(self):
+        misses = metrics.get('link_index.misses')
+        assert self.client.get(path='/idx102').status_code == 404
+        assert metrics.get('link_index.misses') == misses + 1
+        with self.app.app_context():
+            Url.insert_url(url='http://index2.com/b', shortcode='idx102')
+        assert self.redirects.build() == 1
+        assert self.redirects.index.lookup(key=key('idx102')) == 'http://index2.com/b'
+        assert metrics.get('link_index.entries') == 1
+        assert metrics.get('link_index.bytes_per_entry') > 0
+
+    def test_failed_flush_not_double_counted(self):
+        record_redirect = links.record_redirect
+        recorded = []
+
+        def fail_second(link, amount=1):
+            recorded.append(link.shortcode)
+            if len(recorded) == 2:
+                raise RuntimeError('storage failed')
+            record_redirect(link=link, amount=amount)
+
+        with self.app.app_context():
+            Url.insert_url(url='http://index3.com/c', shortcode='idx103')
+        assert self.wait_for(shortcode='idx103') == 'http://index3.com/c'
+        self.client.get(path='/idx102')
+        self.client.get(path='/idx103')
+        with TA.patch(links, 'record_redirect', fail_second):
+            with pytest.raises(RuntimeError):
+                self.redirects.flush()
+        assert self.client.get(path='/idx102/stats').get_json()['redirectCount'] == 0
+        assert self.redirects.flush() == 2
+        assert self.client.get(path='/idx102/stats').get_json()['redirectCount'] == 1
+        assert self.client.get(path='/idx103/stats').get_json()['redirectCount'] == 1
+
+    def test_far_future_link_indexed(self):
+        request = self.client.post(
+            path='/shorten',
+            json={'url': 'http://index4.com/d', 'shortcode': 'idx104', 'ttl': 99 * 365 * 86400}
+        )
+        assert request.status_code == 201
+        assert self.wait_for(shortcode='idx104') == 'http://index4.com/d'
+        assert self.redirects.merge() >= 1
+        assert self.redirects.build() >= 1
+        assert self.client.get(path='/idx104').headers['Location'] == 'http://index4.com/d'
+
+    def test_clicks_flushed_at_exit(self):
+        exit_handlers = []
+        with TA.patch(atexit, 'register', exit_handlers.append):
+            app = create_app(config=TEST_CONFIG)
+        redirects = app.extensions['link_index']
+        assert redirects.stop in exit_handlers
+        assert redirects.lookup(shortcode='idx104') == 'http://index4.com/d'
+        client = app.test_client()
+        self.redirects.flush()
+        count = client.get(path='/idx104/stats').get_json()['redirectCount']
+        assert client.get(path='/idx104').status_code == 302
+        assert client.get(path='/idx104/stats').get_json()['redirectCount'] == count
+        for handler in reversed(exit_handlers):
+            handler()
+        assert client.get(path='/idx104/stats').get_json()['redirectCount'] == count + 1
+        app.extensions['invalidation_bus'].stop()
+
+    def teardown_class(self):
+        self.redirects.stop()
+        self.app.extensions['invalidation_bus'].stop()
+        remove_test_database()
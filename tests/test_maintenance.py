@@ -0,0 +1,107 @@
+import os
+import tempfile
+
+from src.app import create_app, dbs
+
+from maintenance import LatencyMonitor, MaintenanceScheduler
+from metrics import metrics
+from models import Url
+
+TEST_CONFIG = {
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True
+}
+
+
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
+class TestMaintenanceScheduler:
+
+    def setup_class(self):
+        self.app = create_app(config=TEST_CONFIG)
+        with self.app.app_context():
+            for index in range(300):
+                Url.insert_url(url='http://maintenance{}.com/'.format(index) + 'x' * 1000)
+            Url.purge(url_ids=[url.id for url in Url.query.all()])
+            dbs.session.commit()
+
+    def teardown_class(self):
+        remove_test_database()
+
+    def test_yields_while_busy(self):
+        monitor = LatencyMonitor(threshold_ms=10, window=60)
+        for _ in range(10):
+            monitor.record(latency_ms=100)
+        report = MaintenanceScheduler(app=self.app, monitor=monitor, vacuum_pages=10).run()
+        assert report['yielded'] is True
+        assert report['vacuumedPages'] == 0
+        assert report['refreshed'] is None
+        assert report['freePages'] > 0
+        assert metrics.get('maintenance.yields') >= 1
+
+    def test_incremental_vacuum_and_analyze(self):
+        monitor = LatencyMonitor(threshold_ms=10, window=60)
+        monitor.record(latency_ms=1)
+        scheduler = MaintenanceScheduler(app=self.app, monitor=monitor, vacuum_pages=10, step_pause=0)
+        report = scheduler.run()
+        assert report['autoVacuum'] == 'incremental'
+        assert report['yielded'] is False
+        assert report['vacuumedPages'] > 10
+        assert report['freePages'] == 0
+        assert report['fileBytes'] == report['pageCount'] * report['pageSize']
+        assert report['refreshed'] == 'analyze'
+        assert scheduler.run()['refreshed'] == 'optimize'
+        assert metrics.get('maintenance.free_pages') == 0
+
+    def test_maintenance_command(self):
+        result = self.app.test_cli_runner().invoke(args=['maintenance', '--analyze'])
+        assert result.exit_code == 0
+        assert 'auto_vacuum=incremental' in result.output
+        assert 'refreshed=analyze' in result.output
+
+
+    def test_single_runner_elected(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lock_path = os.path.join(directory, 'maintenance.lock')
+            first = MaintenanceScheduler(app=self.app, lock_path=lock_path)
+            second = MaintenanceScheduler(app=self.app, lock_path=lock_path)
+            assert first.elect()
+            assert first.elect()
+            assert not second.elect()
+            first.stop()
+            assert second.elect()
+            second.stop()
+        assert MaintenanceScheduler(app=self.app).elect()
+
+    def test_lock_path_from_config(self):
+        scheduler = MaintenanceScheduler.from_config(app=self.app)
+        with self.app.app_context():
+            assert scheduler.lock_path == dbs.get_engine().url.database + '.maintenance.lock'
+        app = create_app(config=dict(TEST_CONFIG, SQLALCHEMY_DATABASE_URI='sqlite://'))
+        assert MaintenanceScheduler.from_config(app=app).lock_path is None
+
+
+class TestLatencyMonitor:
+
+    def test_p99_within_window(self):
+        monitor = LatencyMonitor(threshold_ms=50, window=1)
+        assert monitor.quiet() is True
+        for latency in range(1, 101):
+            monitor.record(latency_ms=latency)
+        assert monitor.p99() == 100
+        assert monitor.quiet() is False
+        monitor.latencies.clear()
+        monitor.record(latency_ms=500, finished=0)
+        assert monitor.quiet() is True
+
+    def test_request_hooks(self):
+        app = create_app(config=dict(TEST_CONFIG, MAINTENANCE_ENABLED=True, MAINTENANCE_INTERVAL=3600))
+        scheduler = app.extensions['maintenance']
+        app.test_client().get(path='/metrics')
+        scheduler.stop()
+        assert len(scheduler.monitor.latencies) == 1
+        remove_test_database()
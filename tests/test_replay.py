@@ -0,0 +1,97 @@
+import os
+import json
+import tempfile
+from concurrent.futures import Future
+
+from src.app import create_app
+
+import replay
+
+TEST_CONFIG = {
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True
+}
+
+
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
+class TestReplay:
+
+    def setup_class(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.directory.name, 'request_log.jsonl')
+        self.app = create_app(config=dict(TEST_CONFIG, REQUEST_LOG_ENABLED=True, REQUEST_LOG_PATH=self.log_path))
+        self.api_client = self.app.test_client()
+
+    def test_request_log_recorded_success(self):
+        self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://replay.com', 'shortcode': 'rply01'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://replay2.com'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        self.api_client.get(path='/rply01')
+        self.api_client.get(path='/rply01/stats')
+        self.api_client.get(path='/rply02')
+        entries = replay.load(path=self.log_path)
+        assert [entry['endpoint'] for entry in entries] == [
+            'shorten_url.shorten_url', 'shorten_url.shorten_url', 'get_url.get_url', 'get_stats.get_stats',
+            'get_url.get_url'
+        ]
+        assert entries[0]['headers']['Content-Type'] == 'application/json'
+        assert entries[2]['location'] == 'http://replay.com'
+        assert entries[4]['status'] == 404
+
+    def test_replay_matches_success(self):
+        entries = replay.load(path=self.log_path)
+        database_uri = 'sqlite:///' + os.path.join(self.directory.name, 'replay.db')
+        results = replay.replay(entries=entries, target_spec=('app', database_uri), speed=0, workers=1)
+        summaries = replay.report(results=results)
+        assert summaries['shorten_url.shorten_url']['count'] == 2
+        assert all(not summary['mismatches'] for summary in summaries.values())
+        assert summaries['get_url.get_url']['p50'] > 0
+
+    def test_replay_generated_shortcodes_success(self):
+        request = self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://replay3.com'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        shortcode = request.get_json()['shortcode']
+        self.api_client.get(path='/' + shortcode)
+        self.api_client.get(path='/' + shortcode + '/stats')
+        entries = replay.load(path=self.log_path)
+        database_uri = 'sqlite:///' + os.path.join(self.directory.name, 'replay_generated.db')
+        results = replay.replay(entries=entries, target_spec=('app', database_uri), speed=0, workers=1)
+        summaries = replay.report(results=results)
+        assert summaries['get_url.get_url']['count'] == 3
+        assert all(not summary['mismatches'] for summary in summaries.values())
+
+    def test_rewrite(self):
+        entry = {'path': '/abc123/stats?x=1', 'endpoint': 'get_stats.get_stats'}
+        assert replay.rewrite(entry, {'abc123': 'xyz789'})['path'] == '/xyz789/stats?x=1'
+        assert replay.rewrite(entry, {'abc124': 'xyz789'}) is entry
+        assert replay.rewrite(entry, {'abc123': None}) is entry
+        future = Future()
+        future.set_result(('shorten_url.shorten_url', 0.001, None, 'xyz789'))
+        shortcodes = {'abc123': future}
+        assert replay.rewrite(entry, shortcodes)['path'] == '/xyz789/stats?x=1'
+        assert shortcodes == {'abc123': 'xyz789'}
+
+    def test_compare_mismatch(self):
+        entry = {'status': 302, 'location': 'http://a.com', 'response': None, 'endpoint': 'get_url.get_url'}
+        assert replay.compare(entry, 302, 'http://a.com', b'') is None
+        assert 'location' in replay.compare(entry, 302, 'http://b.com', b'')
+        assert 'status' in replay.compare(entry, 404, None, b'')
+
+    def teardown_class(self):
+        self.directory.cleanup()
+        remove_test_database()
@@ -0,0 +1,48 @@
+import pytest
+
+import shortcode_codec
+
+
+class TestShortcodeCodec:
+
+    def test_alphabet_sorted(self):
+        assert shortcode_codec.ALPHABET == ''.join(sorted(shortcode_codec.ALPHABET))
+        assert shortcode_codec.MAX_VALUE < 2 ** 32
+
+    def test_encode_decode_roundtrip(self):
+        for shortcode in ('000000', 'zzzzzz', '01_2qp', 'js9_86'):
+            assert shortcode_codec.decode(shortcode_codec.encode(shortcode)) == shortcode
+
+    def test_encode_boundaries(self):
+        assert shortcode_codec.encode('000000') == 0
+        assert shortcode_codec.encode('zzzzzz') == shortcode_codec.MAX_VALUE
+
+    def test_encode_preserves_order(self):
+        shortcodes = ['zz_000', '000001', 'a_b_c_', '_abcde', '9zzzzz']
+        assert sorted(shortcodes) == sorted(shortcodes, key=shortcode_codec.encode)
+
+    def test_is_valid(self):
+        assert shortcode_codec.is_valid('927hs_')
+        assert shortcode_codec.is_valid('poc') is False
+        assert shortcode_codec.is_valid('ABCDEF') is False
+        assert shortcode_codec.is_valid('abcde-') is False
+        assert shortcode_codec.is_valid(None) is False
+
+    def test_encode_invalid_failure(self):
+        with pytest.raises(ValueError):
+            shortcode_codec.encode('xy_')
+
+    def test_decode_out_of_range_failure(self):
+        with pytest.raises(ValueError):
+            shortcode_codec.decode(shortcode_codec.MAX_VALUE + 1)
+
+    def test_key_invalid_is_none(self):
+        assert shortcode_codec.key('xy_') is None
+        assert shortcode_codec.key('000001') == 1
+
+    def test_neighbours_nearest_first(self):
+        value = shortcode_codec.encode('promo5')
+        assert [shortcode_codec.decode(neighbour) for neighbour in shortcode_codec.neighbours(value, 2)] == [
+            'promo6', 'promo4', 'promo7', 'promo3'
+        ]
+        assert shortcode_codec.neighbours(0, 2) == [1, 2]
@@ -0,0 +1,76 @@
+import os
+import json
+import tempfile
+
+from src.app import create_app
+
+from slow_query import fingerprint, redact, summarize, slow_query_log
+
+TEST_CONFIG = {
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True
+}
+
+
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
+class TestSlowQueryLog:
+
+    def setup_class(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.directory.name, 'slow_queries.jsonl')
+        config = dict(
+            TEST_CONFIG,
+            SLOW_QUERY_LOG_ENABLED=True,
+            SLOW_QUERY_THRESHOLD_MS=0,
+            SLOW_QUERY_LOG_PATH=self.log_path
+        )
+        self.app = create_app(config=config)
+        self.api_client = self.app.test_client()
+
+    def test_fingerprint(self):
+        first = fingerprint("SELECT * FROM url WHERE id IN (?, ?) AND url = 'a'")
+        second = fingerprint('SELECT *  FROM url\nWHERE id IN (?) AND url = \'b\'')
+        assert first == second
+        assert first[0] == 'SELECT * FROM url WHERE id IN (...) AND url = ?'
+
+    def test_redact(self):
+        assert redact(('http://secret.com', 3, None)) == ['<str:17>', '<int>', None]
+        assert redact({'url': 'x'}) == {'url': '<str:1>'}
+
+    def test_slow_queries_logged_success(self):
+        request = self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://slow.com', 'shortcode': 'slow01'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert request.status_code == 201
+        for _ in range(2):
+            assert self.api_client.get(path='/slow01/stats').status_code == 200
+        with open(self.log_path) as log_file:
+            entries = [json.loads(line) for line in log_file]
+        assert all('slow.com' not in json.dumps(entry) for entry in entries)
+        stats_entries = [entry for entry in entries if entry['method'] == 'Stat.get_stats']
+        assert len(stats_entries) >= 2
+        assert stats_entries[0]['endpoint'] == 'get_stats.get_stats'
+        assert stats_entries[0]['plan']
+        assert 'plan' not in stats_entries[-1]
+
+    def test_summarize_success(self):
+        summaries = summarize(path=self.log_path)
+        assert summaries == sorted(summaries, key=lambda summary: summary['totalMs'], reverse=True)
+        assert any('Stat.get_stats' in summary['methods'] and summary['count'] >= 2 for summary in summaries)
+
+    def test_slow_queries_command_success(self):
+        result = self.app.test_cli_runner().invoke(args=['slow-queries', '--top', '3'])
+        assert result.exit_code == 0
+        assert 'count=' in result.output
+
+    def teardown_class(self):
+        slow_query_log.threshold = float('inf')
+        self.directory.cleanup()
+        remove_test_database()
@@ -0,0 +1,194 @@
+import atexit
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.app import create_app
+
+from . import TestAttributes as TA
+
+from exceptions import InvalidShortcode, ShortcodeAlreadyInUse, ShortcodeNotFound
+from repository import links
+from storage import MemoryStorage, SQLAlchemyStorage, from_config
+
+TEST_CONFIG = {
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True
+}
+
+
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
+@pytest.fixture(name='storage', params=['sqlalchemy', 'memory'])
+def storage(request):
+    if request.param == 'memory':
+        yield MemoryStorage()
+        return
+    app = create_app(config=TEST_CONFIG)
+    with app.app_context():
+        yield app.extensions['storage']
+    remove_test_database()
+
+
+class TestStorageContract:
+    """The contract every storage backend passes."""
+    PAST = datetime.utcnow() - timedelta(seconds=1)
+    FUTURE = datetime.utcnow() + timedelta(days=1)
+
+    def test_insert_url_generated_shortcode(self, storage):
+        shortcode = storage.insert_url(url='http://storage1.com')
+        assert len(shortcode) == 6
+        assert storage.insert_url(url='http://storage1.com') == shortcode
+
+    def test_insert_url_provided_shortcode(self, storage):
+        assert storage.insert_url(url='http://storage2.com', shortcode='stor02') == 'stor02'
+        with pytest.raises(ShortcodeAlreadyInUse):
+            storage.insert_url(url='http://storage3.com', shortcode='stor02')
+        with pytest.raises(InvalidShortcode):
+            storage.insert_url(url='http://storage3.com', shortcode='STOR03')
+
+    def test_resolve_counts_redirects(self, storage):
+        storage.insert_url(url='http://storage4.com', shortcode='stor04')
+        stats = storage.get_stats(shortcode='stor04')
+        assert stats['redirectCount'] == 0
+        assert stats['lastRedirect'] is None
+        assert datetime.fromisoformat(stats['created']) <= datetime.utcnow()
+        assert storage.resolve(shortcode='stor04') == 'http://storage4.com'
+        assert storage.resolve(shortcode='stor04') == 'http://storage4.com'
+        stats = storage.get_stats(shortcode='stor04')
+        assert stats['redirectCount'] == 2
+        assert datetime.fromisoformat(stats['lastRedirect']) >= datetime.fromisoformat(stats['created'])
+
+    def test_unknown_shortcode_not_found(self, storage):
+        for shortcode in ('stor05', 'xxx'):
+            with pytest.raises(ShortcodeNotFound):
+                storage.resolve(shortcode=shortcode)
+            with pytest.raises(ShortcodeNotFound):
+                storage.get_stats(shortcode=shortcode)
+
+    def test_expired_links(self, storage):
+        storage.insert_url(url='http://storage6.com', shortcode='stor06', expires_at=self.PAST)
+        storage.insert_url(url='http://storage7.com', shortcode='stor07', expires_at=self.FUTURE)
+        with pytest.raises(ShortcodeNotFound):
+            storage.resolve(shortcode='stor06')
+        with pytest.raises(ShortcodeNotFound):
+            storage.get_stats(shortcode='stor06')
+        assert storage.resolve(shortcode='stor07') == 'http://storage7.com'
+        assert storage.purge_expired(limit=10) == 1
+        assert storage.check_availability(shortcodes=['stor06'])[0]['available'] is True
+        assert storage.insert_url(url='http://storage6.com', shortcode='stor08') == 'stor08'
+
+    def test_check_availability(self, storage):
+        storage.insert_url(url='http://storage9.com', shortcode='stor09')
+        results = storage.check_availability(shortcodes=['stor09', 'stor10', 'STOR11'], suggestions=2)
+        assert results == [
+            {'shortcode': 'stor09', 'valid': True, 'available': False, 'suggestions': ['stor0_', 'stor08']},
+            {'shortcode': 'stor10', 'valid': True, 'available': True, 'suggestions': []},
+            {'shortcode': 'STOR11', 'valid': False, 'available': False, 'suggestions': []}
+        ]
+
+    def test_record_redirects(self, storage):
+        storage.insert_url(url='http://storage12.com', shortcode='stor12')
+        storage.insert_url(url='http://storage13.com', shortcode='stor13')
+        assert storage.record_redirects(counts={'stor12': 3, 'stor13': 1, 'stor14': 5}) == 4
+        assert storage.get_stats(shortcode='stor12')['redirectCount'] == 3
+        assert storage.get_stats(shortcode='stor13')['redirectCount'] == 1
+
+    def test_summary(self, storage):
+        storage.insert_url(url='http://storage15.com', shortcode='stor15')
+        storage.insert_url(url='http://storage16.com', shortcode='stor16', expires_at=self.FUTURE)
+        storage.resolve(shortcode='stor15')
+        storage.record_redirects(counts={'stor16': 2})
+        assert storage.summary(days=7) == {
+            'links': 2,
+            'clicks': 3,
+            'days': [{'day': datetime.utcnow().date().isoformat(), 'linksCreated': 2, 'clicks': 3}]
+        }
+        assert storage.purge_expired(limit=10, now=self.FUTURE + timedelta(seconds=1)) == 1
+        summary = storage.summary(days=1)
+        assert (summary['links'], summary['clicks']) == (1, 1)
+        assert summary['days'][0]['linksCreated'] == 1
+        assert summary['days'][0]['clicks'] == 3
+
+
+class TestSQLAlchemyStorage:
+
+    def test_record_redirects_all_or_nothing(self):
+        app = create_app(config=TEST_CONFIG)
+        storage = app.extensions['storage']
+        record_redirect = links.record_redirect
+        recorded = []
+
+        def fail_second(link, amount=1):
+            recorded.append(link.shortcode)
+            if len(recorded) == 2:
+                raise RuntimeError('storage failed')
+            record_redirect(link=link, amount=amount)
+
+        with app.app_context():
+            storage.insert_url(url='http://sqlalchemy1.com', shortcode='sql001')
+            storage.insert_url(url='http://sqlalchemy2.com', shortcode='sql002')
+            with TA.patch(links, 'record_redirect', fail_second):
+                with pytest.raises(RuntimeError):
+                    storage.record_redirects(counts={'sql001': 2, 'sql002': 1})
+            assert storage.get_stats(shortcode='sql001')['redirectCount'] == 0
+            assert storage.record_redirects(counts={'sql001': 2, 'sql002': 1}) == 3
+            assert storage.get_stats(shortcode='sql001')['redirectCount'] == 2
+        remove_test_database()
+
+
+class TestMemoryStorage:
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'links.json')
+            storage = MemoryStorage(snapshot_path=path, snapshot_interval=0)
+            storage.start()
+            storage.insert_url(url='http://memory1.com', shortcode='mem001')
+            storage.resolve(shortcode='mem001')
+            storage.stop()
+            restored = MemoryStorage(snapshot_path=path)
+        assert len(restored) == 1
+        assert restored.get_stats(shortcode='mem001') == storage.get_stats(shortcode='mem001')
+        assert restored.summary(days=1) == storage.summary(days=1)
+
+    def test_snapshot_saved_at_exit(self):
+        exit_handlers = []
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'links.json')
+            with TA.patch(atexit, 'register', exit_handlers.append):
+                app = create_app(config=dict(
+                    TEST_CONFIG, STORAGE_BACKEND='memory', STORAGE_SNAPSHOT_PATH=path, STORAGE_SNAPSHOT_INTERVAL=3600
+                ))
+            app.extensions['storage'].insert_url(url='http://memory6.com', shortcode='mem006')
+            assert exit_handlers == [app.extensions['storage'].stop]
+            exit_handlers[0]()
+            assert MemoryStorage(snapshot_path=path).get_stats(shortcode='mem006')['redirectCount'] == 0
+        remove_test_database()
+
+    def test_deleted_slots_reused(self):
+        storage = MemoryStorage()
+        storage.insert_url(url='http://memory2.com', shortcode='mem002', expires_at=datetime.utcnow())
+        storage.purge_expired(limit=10)
+        storage.insert_url(url='http://memory3.com')
+        assert len(storage.urls) == 1
+        assert storage.insert_url(url='http://memory4.com') != 'mem002'
+
+    def test_from_config(self):
+        app = create_app(config=dict(TEST_CONFIG, STORAGE_BACKEND='memory'))
+        assert isinstance(app.extensions['storage'], MemoryStorage)
+        client = app.test_client()
+        request = client.post(path='/shorten', json={'url': 'http://memory5.com', 'shortcode': 'mem005'})
+        assert request.status_code == 201
+        assert client.get(path='/mem005').headers['Location'] == 'http://memory5.com'
+        assert client.get(path='/mem005/stats').get_json()['redirectCount'] == 1
+        with pytest.raises(ValueError):
+            from_config(app=create_app(config=dict(TEST_CONFIG, STORAGE_BACKEND='unknown')))
+        assert isinstance(create_app(config=TEST_CONFIG).extensions['storage'], SQLAlchemyStorage)
+        remove_test_database()
@@ -0,0 +1,72 @@
+import os
+import json
+import tempfile
+
+from src.app import create_app
+
+from tracing import tracer
+
+TEST_CONFIG = {
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///testing.db',
+    'TESTING': True,
+    'SCHEMA_AUTO_MIGRATE': True
+}
+
+
+def remove_test_database():
+    os.remove(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src') + r'/testing.db')
+
+
+class TestTracing:
+
+    def setup_class(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.trace_file = os.path.join(self.directory.name, 'trace.json')
+        config = dict(TEST_CONFIG, TRACING_SAMPLE_RATE=1.0, TRACING_DEBUG_ENDPOINT=True, TRACING_FILE=self.trace_file)
+        self.app = create_app(config=config)
+        self.api_client = self.app.test_client()
+
+    def test_sampled_request_spans_success(self):
+        request = self.api_client.post(
+            path='/shorten',
+            data=json.dumps({'url': 'http://traced.com', 'shortcode': 'trace1'}),
+            headers={'Content-Type': 'application/json'}
+        )
+        assert request.status_code == 201
+        assert self.api_client.get(path='/trace1').status_code == 302
+        request = self.api_client.get(path='/debug/trace')
+        assert request.status_code == 200
+        events = request.get_json()['traceEvents']
+        names = {event['name'] for event in events}
+        assert {'shorten_url.shorten_url', 'Url.insert_url', 'Shortcode.insert', 'Redirect.redirect'} <= names
+        sql_events = [event for event in events if event['cat'] == 'sql']
+        assert sql_events
+        assert 'Redirect.increment' in {event['args']['parent'] for event in sql_events}
+        assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+
+    def test_trace_file_success(self):
+        with open(self.trace_file) as trace_file:
+            content = trace_file.read()
+        events = json.loads(content.rstrip().rstrip(',') + ']')
+        assert 'Url.insert_url' in {event['name'] for event in events}
+
+    def test_unsampled_request_no_spans(self):
+        self.api_client.get(path='/debug/trace?clear=1')
+        tracer.sample_rate = 0.0
+        assert self.api_client.get(path='/trace1').status_code == 302
+        tracer.sample_rate = 1.0
+        names = {event['name'] for event in tracer.events}
+        assert 'Redirect.redirect' not in names
+
+    def test_buffer_keeps_newest_spans(self):
+        tracer.configure(sample_rate=1.0, buffer_size=3)
+        for index in range(5):
+            tracer.start(name='request{INDEX}'.format(INDEX=index), force=True)
+            tracer.finish()
+        assert [event['name'] for event in tracer.events] == ['request2', 'request3', 'request4']
+
+    def teardown_class(self):
+        tracer.configure(sample_rate=0.0)
+        self.directory.cleanup()
+        remove_test_database()